@@ -12,7 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+import json
 import logging
+import os
 import pprint
 
 import click
@@ -20,6 +23,15 @@ from click_plugins import with_plugins
 import pkg_resources
 import yaml
 
+from spyglass.data_extractor.intermediary_file import \
+    drop_unchanged_racks
+from spyglass.data_extractor.intermediary_file import load_changed_racks
+from spyglass.data_extractor.intermediary_file import load_intermediary
+from spyglass.data_extractor.models import site_document_data_factory
+from spyglass.data_extractor.site_diff import changes_as_dict
+from spyglass.data_extractor.site_diff import format_change
+from spyglass.data_extractor.site_store import is_site_store
+from spyglass.data_extractor.site_store import SiteStore
 from spyglass import exceptions
 from spyglass.parser.engine import ProcessDataSource
 from spyglass.site_processors.site_processor import SiteProcessor
@@ -89,6 +101,31 @@ FORCE_OPTION = click.option(
     default=False,
     help='Forces manifests to be written, regardless of undefined data.')
 
+RESUME_OPTION = click.option(
+    '--resume',
+    'resume',
+    is_flag=True,
+    default=False,
+    help='Reuses manifests staged by a previous failed run when still valid.')
+
+IP_LEDGER_OPTION = click.option(
+    '--ip-ledger',
+    'ip_ledger',
+    type=click.Path(dir_okay=False, writable=True),
+    required=False,
+    help=(
+        'Path to a YAML file recording the IPs assigned to each host. It is '
+        'created if missing and keeps host IPs stable between runs.'))
+
+RULES_STATE_OPTION = click.option(
+    '--rules-state',
+    'rules_state',
+    type=click.Path(dir_okay=False, writable=True),
+    required=False,
+    help=(
+        'Path to a JSON file recording the inputs of each design rule. Rules '
+        'whose inputs are unchanged since the recorded run are skipped.'))
+
 INTERMEDIARY_SCHEMA_OPTION = click.option(
     '--intermediary-schema',
     'intermediary_schema',
@@ -161,7 +198,8 @@ def intermediary_processor(plugin_type, **kwargs):
         kwargs['site_name'], data_extractor.data,
         kwargs.get('rule_configuration', None),
         kwargs.get('intermediary_schema', None),
-        kwargs.get('no_validation', False))
+        kwargs.get('no_validation', False), kwargs.get('ip_ledger', None),
+        kwargs.get('rules_state', None))
     return process_input_ob
 
 
@@ -170,21 +208,154 @@ def intermediary_processor(plugin_type, **kwargs):
     short_help='generates manifest from intermediary',
     help='Generate manifest files from specified intermediary file.')
 @click.argument(
-    'intermediary_file',
-    type=click.Path(exists=True, readable=True, dir_okay=False))
+    'intermediary_file', type=click.Path(exists=True, readable=True))
 @TEMPLATE_DIR_OPTION
 @MANIFEST_DIR_OPTION
 @FORCE_OPTION
+@RESUME_OPTION
+@click.option(
+    '--rack',
+    'racks',
+    multiple=True,
+    help=(
+        'Renders only the sharded outputs of this rack, keeping the other '
+        'manifests. Can be given more than once. Indexed intermediary files '
+        'are read only for these racks.'))
 def generate_manifests_using_intermediary(
-        *, intermediary_file, template_dir, manifest_dir, force):
-    LOG.info("Loading intermediary from user provided input")
-    with open(intermediary_file, 'r') as f:
-        raw_data = f.read()
-        intermediary_yaml = yaml.safe_load(raw_data)
-
-    LOG.info("Generating site Manifests")
-    processor_engine = SiteProcessor(intermediary_yaml, manifest_dir, force)
-    processor_engine.render_template(template_dir)
+        *, intermediary_file, template_dir, manifest_dir, force, resume,
+        racks):
+    # Site stores stay open until the manifests are rendered
+    with contextlib.ExitStack() as stack:
+        if is_site_store(intermediary_file):
+            LOG.info("Loading site data from site store")
+            site_store = stack.enter_context(SiteStore(intermediary_file))
+            intermediary_yaml = site_store.site_data()
+        elif racks:
+            LOG.info(
+                "Loading racks {} of intermediary".format(', '.join(racks)))
+            intermediary_yaml = load_intermediary(
+                intermediary_file, racks=set(racks))
+        elif os.path.isdir(intermediary_file):
+            LOG.info("Loading intermediary directory")
+            intermediary_yaml = load_intermediary(intermediary_file)
+        else:
+            LOG.info("Loading intermediary from user provided input")
+            with open(intermediary_file, 'r') as f:
+                raw_data = f.read()
+                intermediary_yaml = yaml.safe_load(raw_data)
+
+        LOG.info("Generating site Manifests")
+        processor_engine = SiteProcessor(
+            intermediary_yaml,
+            manifest_dir,
+            force,
+            resume=resume,
+            racks=racks or None)
+        processor_engine.render_template(template_dir)
+
+
+@contextlib.contextmanager
+def _load_intermediary(intermediary_file):
+    """Loads an intermediary file, with the LibYAML parser if available
+
+    Site stores are loaded with their hosts left in the database until the
+    context exits, indexed intermediary files are parsed section by section
+    and intermediary directories file by file.
+    """
+    if is_site_store(intermediary_file):
+        with SiteStore(intermediary_file) as site_store:
+            yield site_store.site_data()
+    else:
+        yield site_document_data_factory(load_intermediary(intermediary_file))
+
+
+def _intermediary_dict(intermediary_file):
+    """Loads the intermediary data of an intermediary file or site store"""
+    if is_site_store(intermediary_file):
+        with SiteStore(intermediary_file) as site_store:
+            return site_store.site_data().dict_from_class()
+    return load_intermediary(intermediary_file)
+
+
+@main.command(
+    'lookup',
+    short_help='finds the network and host of addresses',
+    help=(
+        'Finds the VLAN network and the host each address belongs to in the '
+        'specified intermediary file.'))
+@click.argument(
+    'intermediary_file', type=click.Path(exists=True, readable=True))
+@click.argument('addresses', nargs=-1, required=True)
+def lookup_addresses(*, intermediary_file, addresses):
+    with _load_intermediary(intermediary_file) as site_data:
+        index = site_data.address_index
+        for address in addresses:
+            network = index.network_for(address)
+            owner = index.host_for(address)
+            click.echo(
+                '{}: network {}, host {}'.format(
+                    address, network.name if network else '-',
+                    '{} (rack {}, {})'.format(
+                        owner.host.name, owner.rack.name, owner.role)
+                    if owner else '-'))
+
+
+@main.command(
+    'diff',
+    short_help='compares two intermediary files',
+    help=(
+        'Lists the site information, network, rack and host changes from '
+        'the first to the second intermediary file.'))
+@click.argument(
+    'old_intermediary', type=click.Path(exists=True, readable=True))
+@click.argument(
+    'new_intermediary', type=click.Path(exists=True, readable=True))
+@click.option(
+    '-f',
+    '--format',
+    'output_format',
+    type=click.Choice(['text', 'json']),
+    default='text',
+    help='Output format of the changes.')
+def diff_intermediaries(*, old_intermediary, new_intermediary, output_format):
+    if is_site_store(old_intermediary) or is_site_store(new_intermediary):
+        old_dict = _intermediary_dict(old_intermediary)
+        new_dict = _intermediary_dict(new_intermediary)
+        drop_unchanged_racks(old_dict, new_dict)
+    else:
+        # Racks with identical text cannot differ, so only the others are
+        # parsed
+        old_dict, new_dict = load_changed_racks(
+            old_intermediary, new_intermediary)
+    old_data = site_document_data_factory(old_dict)
+    new_data = site_document_data_factory(new_dict)
+    changes = old_data.diff(new_data)
+    if output_format == 'json':
+        click.echo(
+            json.dumps(
+                changes_as_dict(changes),
+                indent=2,
+                sort_keys=True,
+                default=str))
+        return
+    for change in changes:
+        click.echo(format_change(change))
+
+
+@main.command(
+    'store',
+    short_help='writes an intermediary file to a site store',
+    help=(
+        'Writes the site data of an intermediary file to a SQLite site store, '
+        'replacing its content. Site stores can be used in place of '
+        'intermediary files by the mi, lookup and diff commands.'))
+@click.argument(
+    'intermediary_file', type=click.Path(exists=True, readable=True))
+@click.argument('store_file', type=click.Path(dir_okay=False, writable=True))
+def store_intermediary(*, intermediary_file, store_file):
+    with SiteStore(store_file) as site_store, \
+            _load_intermediary(intermediary_file) as site_data:
+        site_store.save(site_data)
 
 
 @main.command(
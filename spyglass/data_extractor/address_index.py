@@ -0,0 +1,201 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import ipaddress
+import logging
+
+LOG = logging.getLogger(__name__)
+
+# Owner of a host address
+HostAddress = collections.namedtuple('HostAddress', ['rack', 'host', 'role'])
+
+
+class _Node(object):
+    """Node of a PrefixTrie holding a prefix and, optionally, its value"""
+
+    __slots__ = ('prefix', 'length', 'value', 'children')
+
+    def __init__(self, prefix, length, value=None):
+        self.prefix = prefix
+        self.length = length
+        self.value = value
+        self.children = [None, None]
+
+
+class PrefixTrie(object):
+    """Path compressed binary (Patricia) trie of address prefixes
+
+    Nodes only exist where prefixes branch or hold a value, so the depth of
+    the trie, and the cost of a lookup, is bounded by the address width.
+    """
+    def __init__(self, width):
+        """Creates an empty trie
+
+        :param width: number of bits of the addresses, 32 for IPv4 and 128
+                      for IPv6
+        """
+        self.width = width
+        self._root = None
+
+    def _mask(self, value, length):
+        """Returns value with all but the first length bits cleared"""
+        shift = self.width - length
+        return value >> shift << shift
+
+    def _bit(self, value, position):
+        """Returns the bit of value at position, counted from the top"""
+        return (value >> (self.width - 1 - position)) & 1
+
+    def _common_length(self, a, b, limit):
+        """Returns the length of the common prefix of a and b, up to limit"""
+        return min(limit, self.width - (a ^ b).bit_length())
+
+    def insert(self, prefix, length, value):
+        """Stores a value for a prefix, replacing any previous value
+
+        :param prefix: integer value of the prefix
+        :param length: length of the prefix in bits
+        :param value: value to store, must not be None
+        """
+        prefix = self._mask(prefix, length)
+        parent, side, node = None, 0, self._root
+        while node is not None:
+            common = self._common_length(
+                prefix, node.prefix, min(length, node.length))
+            if common < node.length:
+                # The new prefix branches off above this node
+                if common == length:
+                    branch = _Node(prefix, length, value)
+                else:
+                    branch = _Node(self._mask(prefix, common), common)
+                    branch.children[self._bit(prefix, common)] = _Node(
+                        prefix, length, value)
+                branch.children[self._bit(node.prefix, common)] = node
+                node = branch
+                break
+            if length == node.length:
+                node.value = value
+                return
+            parent, side = node, self._bit(prefix, node.length)
+            node = node.children[side]
+        else:
+            node = _Node(prefix, length, value)
+        if parent is None:
+            self._root = node
+        else:
+            parent.children[side] = node
+
+    def longest_match(self, address):
+        """Returns the value of the longest prefix containing an address
+
+        :param address: integer value of the address
+        :return: the stored value, or None if no prefix contains the address
+        """
+        best = None
+        node = self._root
+        while node is not None and \
+                self._mask(address, node.length) == node.prefix:
+            if node.value is not None:
+                best = node.value
+            if node.length == self.width:
+                break
+            node = node.children[self._bit(address, node.length)]
+        return best
+
+
+class AddressIndex(object):
+    """Reverse lookups from addresses to the networks and hosts of a site
+
+    Site-wide and rack-level VLAN network subnets are indexed in a prefix
+    trie per IP version for longest prefix matches, and host addresses in a
+    dictionary for exact matches. The index is a snapshot of the site data
+    it was built from.
+    """
+    def __init__(self, site_data):
+        """Indexes the subnets and host addresses of site data
+
+        :param site_data: the site data to index
+        :type site_data: models.SiteDocumentData
+        """
+        self._networks = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        vlan_networks = list(site_data.network.vlan_network_data)
+        for rack in site_data.baremetal:
+            vlan_networks.extend(rack.networks.values())
+        for vlan_data in vlan_networks:
+            for subnet in vlan_data.subnet:
+                try:
+                    network = ipaddress.ip_network(subnet, strict=False)
+                except (TypeError, ValueError):
+                    continue
+                self._networks[network.version].insert(
+                    int(network.network_address), network.prefixlen, vlan_data)
+        self._hosts = {}
+        for rack in site_data.baremetal:
+            for host in rack.hosts:
+                for role, _ in host.ip:
+                    address = host.ip.packed(role)
+                    if address is not None:
+                        self._hosts.setdefault(
+                            address, HostAddress(rack, host, role))
+        LOG.debug("Indexed {} host addresses".format(len(self._hosts)))
+
+    @staticmethod
+    def _pack(address):
+        """Returns an address string as (version, integer value), or None"""
+        try:
+            address = ipaddress.ip_address(address)
+        except (TypeError, ValueError):
+            return None
+        return address.version, int(address)
+
+    def network_for(self, address):
+        """Returns the VLAN network whose subnet contains an address
+
+        When subnets are nested, the network of the most specific subnet is
+        returned.
+
+        :param address: the address as a string
+        :return: the network, or None if no subnet contains the address
+        :rtype: models.VLANNetworkData or None
+        """
+        packed = self._pack(address)
+        if packed is None:
+            return None
+        return self._networks[packed[0]].longest_match(packed[1])
+
+    def host_for(self, address):
+        """Returns the host an address is assigned to
+
+        :param address: the address as a string
+        :return: the rack, host and role the address is assigned to, or None
+                 if no host has the address
+        :rtype: HostAddress or None
+        """
+        packed = self._pack(address)
+        if packed is None:
+            return None
+        return self._hosts.get(packed)
+
+    def in_network(self, address, name):
+        """Returns True if the network owning an address has the given name
+
+        The owning network is the one found by ``network_for``.
+
+        :param address: the address as a string
+        :param name: name of the VLAN network
+        :rtype: bool
+        """
+        network = self.network_for(address)
+        return network is not None and network.name == name
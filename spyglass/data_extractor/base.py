@@ -63,10 +63,24 @@ class BaseDataSourcePlugin(metaclass=abc.ABCMeta):
         :rtype: list of models.VLANNetworkData
         """
 
-        # TODO(nh863p): Expand the return type if they are rack level subnets
+        # Rack level subnets are returned by parse_rack_networks
         # TODO(nh863p): Is ingress information can be provided here?
         return []
 
+    def parse_rack_networks(self, rack):
+        """Return list of networks with subnets local to a rack
+
+        Plugins that do not support rack level subnets do not need to
+        implement this method.
+
+        :param string rack: Rack name
+        :returns: list of network data replacing the site-wide networks of
+                  the same name for the hosts of the rack
+        :rtype: list of models.VLANNetworkData
+        """
+
+        return []
+
     @abc.abstractmethod
     def parse_ips(self, host):
         """Return list of IPs on the host
@@ -155,7 +169,11 @@ class BaseDataSourcePlugin(metaclass=abc.ABCMeta):
         """
 
         LOG.info("Extract baremetal information from plugin")
-        return self.parse_racks()
+        racks = self.parse_racks()
+        for rack in racks:
+            for network in self.parse_rack_networks(rack.name):
+                rack.networks.setdefault(network.name, network)
+        return racks
 
     def parse_site_information(self):
         """Get site information from plugin
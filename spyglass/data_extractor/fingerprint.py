@@ -0,0 +1,137 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Content fingerprints of the site data models
+
+The fingerprint of a model object is the SHA-256 hex digest of the JSON
+encoding of ``[FINGERPRINT_VERSION, kind, content]``, serialized with sorted
+keys, ``(',', ':')`` separators, ASCII output and ``str`` for values JSON
+cannot encode. The content of each kind of object is:
+
+* ``ip_list``: mapping of each role to ``[IP version, integer value]`` of
+  its address, or to the value itself if it is not an address, empty roles
+  omitted
+* ``host``: ``[{'name', 'host_profile', 'type'}, <ip_list fingerprint>]``
+* ``vlan_network_data``: ``[name, <dict_from_class()>]``
+* ``rack``: ``[name, {host name: fingerprint},
+  {network name: fingerprint}]``
+* ``site_info``: ``[region_name, <dict_from_class()>]``
+* ``network``: ``[bgp, {network name: fingerprint}]``
+* ``site``: ``[storage, <site_info fingerprint>, <network fingerprint>,
+  {rack name: fingerprint}]``
+
+Children are keyed by name, so fingerprints do not depend on the order of
+racks, hosts or networks. Two objects with the same fingerprint produce the
+same intermediary. The algorithm only changes along with
+``FINGERPRINT_VERSION``, so fingerprints may be persisted and compared
+across runs of the same version.
+"""
+
+import hashlib
+import json
+import logging
+import weakref
+
+LOG = logging.getLogger(__name__)
+
+# Version of the fingerprint algorithm, part of every fingerprint
+FINGERPRINT_VERSION = 1
+
+_ENCODER = json.JSONEncoder(sort_keys=True, separators=(',', ':'), default=str)
+
+
+def content_hash(kind, content):
+    """Returns the fingerprint of an object's content
+
+    :param kind: the kind of object, see the module documentation
+    :param content: JSON serializable content of the object
+    :rtype: str
+    """
+    return hashlib.sha256(
+        _ENCODER.encode([FINGERPRINT_VERSION, kind,
+                         content]).encode('ascii')).hexdigest()
+
+
+class Fingerprinted(object):
+    """Mixin maintaining the fingerprint of a model object
+
+    The fingerprint is computed on first use and cached. Setting a public
+    attribute marks the object dirty, which propagates to every object whose
+    fingerprint includes it, so only the changed objects and their ancestors
+    are hashed again. Adding or removing children, such as hosts of a rack,
+    is detected by comparing the children with those last hashed.
+
+    Objects whose content is changed in place, for example by appending to
+    ``VLANNetworkData.subnet``, must be marked dirty with ``touch()``.
+    """
+
+    __slots__ = ()
+
+    #: Kind of object, see the module documentation
+    fingerprint_kind = None
+
+    #: Whether the fingerprint is cached. Objects with small contents that
+    #: are usually changed in place, such as dictionaries, are hashed on
+    #: every call instead, still reusing the fingerprints of their children.
+    fingerprint_cached = True
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if not name.startswith('_'):
+            self.touch()
+
+    def touch(self):
+        """Marks the object, and the objects including it, as changed"""
+        if getattr(self, '_fingerprint', None) is None:
+            return
+        object.__setattr__(self, '_fingerprint', None)
+        parents = getattr(self, '_fingerprint_parents', None)
+        if parents:
+            for parent in list(parents):
+                parent.touch()
+
+    def _fingerprint_children(self):
+        """Returns the fingerprinted objects the content includes"""
+        return []
+
+    def _fingerprint_content(self):
+        """Returns the content to hash, see the module documentation"""
+        raise NotImplementedError()
+
+    def _child_fingerprint(self, child):
+        """Returns the fingerprint of a child, registering self as parent"""
+        parents = getattr(child, '_fingerprint_parents', None)
+        if parents is None:
+            parents = weakref.WeakSet()
+            object.__setattr__(child, '_fingerprint_parents', parents)
+        parents.add(self)
+        return child.fingerprint()
+
+    def fingerprint(self):
+        """Returns the content fingerprint of the object
+
+        :return: SHA-256 hex digest, see the module documentation
+        :rtype: str
+        """
+        children = self._fingerprint_children()
+        fingerprint = getattr(self, '_fingerprint', None)
+        if fingerprint is not None and \
+                getattr(self, '_fingerprinted_children', None) == children:
+            return fingerprint
+        fingerprint = content_hash(
+            self.fingerprint_kind, self._fingerprint_content())
+        if self.fingerprint_cached:
+            object.__setattr__(self, '_fingerprinted_children', children)
+            object.__setattr__(self, '_fingerprint', fingerprint)
+        return fingerprint
@@ -0,0 +1,742 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reading and writing intermediary files
+
+An intermediary file can be written with a sidecar index, named after the
+file with ``INDEX_SUFFIX`` appended, recording where each top-level section
+and each rack of ``baremetal`` starts in the file::
+
+    {
+      "version": 1,
+      "sha256": "<digest of the intermediary file>",
+      "sections": {"network": {"offset": 0, "length": 10, "sha256": ""}},
+      "racks": {"rack72": {"offset": 11, "length": 20, "sha256": ""}}
+    }
+
+Sections and racks are written as separate blocks of the same block style
+YAML as ``yaml.dump(data, default_flow_style=False)``, so each can be parsed
+on its own. The index is ignored when the digest of the file does not match,
+and the whole file is parsed instead. Files without an index that keep this
+layout can be indexed by scanning their lines with ``scan_index``.
+
+An intermediary can also be written as a directory holding a header file
+with every section but ``baremetal``, and a file per rack with the rack's
+hosts::
+
+    <region>_intermediary/
+        site.yaml
+        racks/
+            rack72.yaml
+            rack73.yaml
+
+Only the files of a directory whose content changed are rewritten. Rack
+names are read back from the file names, so racks named by other YAML
+scalars, such as the integer ``72``, are loaded with string names.
+
+Site data models are written without building their ``dict_from_class()``
+tree: hosts are emitted directly as the text ``yaml.dump`` would produce
+for them, one host at a time. Hosts with names or values that YAML would
+quote are dumped with ``yaml.dump`` on their own.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+from urllib.parse import unquote
+
+import yaml
+
+# LibYAML safe loader if available
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+LOG = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.index.json'
+
+INDEX_VERSION = 1
+
+# Size of the blocks read when hashing intermediary files
+HASH_BLOCK_SIZE = 1 << 20
+
+_BAREMETAL_HEADER = 'baremetal:\n'
+
+# Lines of an intermediary file indented by less than a host: section keys,
+# items of top-level lists and racks of baremetal
+_OUTER_LINE_RE = re.compile(br'^(?:[^ \n]| {2}[^ \n])[^\n]*', re.M)
+_SECTION_LINE_RE = re.compile(br'^[A-Za-z_][A-Za-z0-9_]*:(?: |$)')
+
+# Strings that yaml.dump writes unquoted as keys and as values, when they
+# also resolve to strings and are not document markers. Strings of more
+# than 128 characters with their tag cannot be simple keys.
+_PLAIN_RE = re.compile(r'^(?:[A-Za-z0-9_./]|-(?=.))[A-Za-z0-9_./:-]*$')
+_PLAIN_MAX_LENGTH = 128 - len('!!str')
+_STR_TAG = 'tag:yaml.org,2002:str'
+_resolver = yaml.resolver.Resolver()
+
+# Number of distinct strings whose YAML form is cached
+SCALAR_CACHE_SIZE = 4096
+
+# Header file of an intermediary directory, and directory of its rack files
+HEADER_FILE = 'site.yaml'
+RACK_DIR = 'racks'
+RACK_FILE_EXT = '.yaml'
+
+
+def _dump(data):
+    return yaml.dump(data, default_flow_style=False)
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def index_path(path):
+    """Returns the path of the index of an intermediary file"""
+    return path + INDEX_SUFFIX
+
+
+def _blocks(intermediary_dict):
+    """Yields the (section, rack, text) blocks of an intermediary file
+
+    rack is None for the blocks of whole sections. The baremetal section is
+    written as its header followed by a block per rack.
+    """
+    for section in sorted(intermediary_dict):
+        value = intermediary_dict[section]
+        if section == 'baremetal' and value:
+            yield section, None, _BAREMETAL_HEADER
+            for rack in sorted(value):
+                yield section, rack, _dump({section: {
+                    rack: value[rack]
+                }})[len(_BAREMETAL_HEADER):]
+        else:
+            yield section, None, _dump({section: value})
+
+
+@functools.lru_cache(maxsize=SCALAR_CACHE_SIZE)
+def _is_plain(value):
+    """Returns True if yaml.dump writes a string as it is"""
+    return len(value) < _PLAIN_MAX_LENGTH and not value.endswith(':') \
+        and not value.startswith(('---', '...')) \
+        and _PLAIN_RE.match(value) is not None \
+        and _resolver.resolve(yaml.ScalarNode, value,
+                              (True, False)) == _STR_TAG
+
+
+def _scalar(value):
+    """Returns the text yaml.dump writes for a value, None if unsure"""
+    if value is None:
+        return 'null'
+    if value is True or value is False:
+        return 'true' if value else 'false'
+    if type(value) is int:
+        return str(value)
+    if type(value) is str and _is_plain(value):
+        return value
+    return None
+
+
+def _dump_at(data, level):
+    """Dumps a mapping as if nested level mappings deep"""
+    for _ in range(level):
+        data = {'a': data}
+    text = _dump(data)
+    for _ in range(level):
+        text = text[text.index('\n') + 1:]
+    return text
+
+
+def _host_text(host, indent):
+    """Returns the text of a host, with its name indented by indent"""
+    ip = sorted((role, value) for role, value in host.ip if value)
+    values = [_scalar(value) for _, value in ip]
+    host_profile = _scalar(host.host_profile)
+    host_type = _scalar(host.type)
+    if not ip or host_profile is None or host_type is None \
+            or None in values or type(host.name) is not str \
+            or not _is_plain(host.name):
+        return _dump_at(host.dict_from_class(), indent // 2)
+    pad = ' ' * indent
+    lines = [
+        '{}{}:\n{}  host_profile: {}\n{}  ip:\n'.format(
+            pad, host.name, pad, host_profile, pad)
+    ]
+    for (role, _), value in zip(ip, values):
+        lines.append('{}    {}: {}\n'.format(pad, role, value))
+    lines.append('{}  type: {}\n'.format(pad, host_type))
+    return ''.join(lines)
+
+
+def _rack_chunks(rack, indent, with_name=True):
+    """Yields the text of a rack's hosts, one host at a time
+
+    :param rack: the Rack
+    :param indent: indentation of the rack's name
+    :param with_name: whether to start with the rack's name, otherwise the
+                      hosts are a mapping of their own at indent
+    """
+    hosts = {}
+    for host in rack.hosts:
+        hosts[host.name] = host
+    host_indent = indent + 2 if with_name else indent
+    if not hosts:
+        yield '{}{}: {{}}\n'.format(' ' * indent, rack.name) if with_name \
+            else '{}\n'
+        return
+    if not all(type(name) is str for name in hosts):
+        hosts_dict = rack.dict_from_class()[rack.name]
+        if with_name:
+            yield _dump_at({rack.name: hosts_dict}, indent // 2)
+        else:
+            yield _dump_at(hosts_dict, indent // 2)
+        return
+    if with_name:
+        yield '{}{}:\n'.format(' ' * indent, rack.name)
+    for name in sorted(hosts):
+        yield _host_text(hosts[name], host_indent)
+
+
+def _racks_by_name(site_data):
+    """Returns the racks of site data by name, later racks replacing others"""
+    racks = {}
+    for rack in site_data.baremetal:
+        racks[rack.name] = rack
+    return racks
+
+
+def _site_data_blocks(site_data):
+    """Yields the (section, rack, text) blocks of the intermediary of a site
+
+    The text is the same as for ``_blocks(site_data.dict_from_class())``,
+    with the racks split into a block per host.
+    """
+    document = site_data.dict_from_class(hosts=False)
+    racks = _racks_by_name(site_data)
+    for section in sorted(document):
+        if section != 'baremetal' or not racks:
+            yield section, None, _dump({section: document[section]})
+        elif not all(type(name) is str and _is_plain(name) for name in racks):
+            for rack in racks.values():
+                document[section].update(rack.dict_from_class())
+            yield section, None, _dump({section: document[section]})
+        else:
+            yield section, None, _BAREMETAL_HEADER
+            for name in sorted(racks):
+                for text in _rack_chunks(racks[name], 2):
+                    yield section, name, text
+
+
+def emit_intermediary(site_data, stream):
+    """Writes the intermediary of site data to a text stream
+
+    The output is the same as ``yaml.dump(site_data.dict_from_class(),
+    default_flow_style=False)``, as long as the sections of the site data
+    share no objects, but hosts are written one at a time.
+
+    :param site_data: the site data
+    :type site_data: models.SiteDocumentData
+    :param stream: text stream to write to
+    """
+    for _, _, text in _site_data_blocks(site_data):
+        stream.write(text)
+
+
+def write_intermediary(intermediary, outfile, index=False):
+    """Writes an intermediary file
+
+    :param intermediary: the intermediary data, or site data written with
+                         ``emit_intermediary``
+    :param outfile: path of the intermediary file
+    :param index: whether to write the index of the file's sections and
+                  racks next to it
+    """
+    if not index:
+        with open(outfile, 'w') as f:
+            if isinstance(intermediary, dict):
+                f.write(_dump(intermediary))
+            else:
+                emit_intermediary(intermediary, f)
+        return
+
+    if isinstance(intermediary, dict):
+        blocks = _blocks(intermediary)
+    else:
+        blocks = _site_data_blocks(intermediary)
+    digest = hashlib.sha256()
+    digests = {}
+    sections = {}
+    racks = {}
+    offset = 0
+    with open(outfile, 'wb') as f:
+        for section, rack, text in blocks:
+            data = text.encode('utf-8')
+            f.write(data)
+            digest.update(data)
+            if rack is None:
+                kind, name = 'sections', section
+            else:
+                kind, name = 'racks', rack
+                sections[section]['length'] += len(data)
+                digests['sections', section].update(data)
+            entries = sections if rack is None else racks
+            if name not in entries:
+                entries[name] = {'offset': offset, 'length': 0}
+                digests[kind, name] = hashlib.sha256()
+            entries[name]['length'] += len(data)
+            digests[kind, name].update(data)
+            offset += len(data)
+    for (kind, name), entry_digest in digests.items():
+        entries = sections if kind == 'sections' else racks
+        entries[name]['sha256'] = entry_digest.hexdigest()
+    with open(index_path(outfile), 'w') as f:
+        json.dump(
+            {
+                'version': INDEX_VERSION,
+                'sha256': digest.hexdigest(),
+                'sections': sections,
+                'racks': racks,
+            },
+            f,
+            indent=2,
+            sort_keys=True)
+    LOG.info(
+        "Indexed {} sections and {} racks of {}".format(
+            len(sections), len(racks), outfile))
+
+
+def read_index(path):
+    """Reads the index of an intermediary file
+
+    :param path: path of the intermediary file
+    :return: the index, or None if the file has no index or it is stale
+    :rtype: dict
+    """
+    try:
+        with open(index_path(path), 'r') as f:
+            index = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if not isinstance(index, dict) or index.get('version') != INDEX_VERSION:
+        LOG.info("Ignoring index of {} of another version".format(path))
+        return None
+    if index.get('sha256') != _file_digest(path):
+        LOG.info("Ignoring stale index of {}".format(path))
+        return None
+    return index
+
+
+def _rack_name(line):
+    """Returns the name of a rack from its key line, or None"""
+    if not line.endswith(b':'):
+        return None
+    try:
+        key = yaml.load(line.decode('utf-8'), Loader=SafeLoader)
+    except (UnicodeDecodeError, yaml.YAMLError):
+        return None
+    if not isinstance(key, dict) or len(key) != 1 or \
+            list(key.values()) != [None]:
+        return None
+    return next(iter(key))
+
+
+def _scan_blocks(data):
+    """Splits the text of an intermediary file into sections and racks
+
+    :return: lists of (section, offset, end) and (rack, offset, end)
+             tuples, or None if the text does not have the layout written by
+             ``write_intermediary``
+    """
+    sections = []
+    racks = []
+
+    def close(blocks, end):
+        if blocks and blocks[-1][2] is None:
+            blocks[-1][2] = end
+
+    for match in _OUTER_LINE_RE.finditer(data):
+        line = match.group(0)
+        if line.startswith(b' '):
+            if not sections or sections[-1][0] != 'baremetal':
+                continue
+            rack = _rack_name(line[2:])
+            if rack is None:
+                return None
+            close(racks, match.start())
+            racks.append([rack, match.start(), None])
+        elif line.startswith(b'- '):
+            if not sections or sections[-1][0] == 'baremetal':
+                return None
+        elif _SECTION_LINE_RE.match(line):
+            close(sections, match.start())
+            close(racks, match.start())
+            sections.append(
+                [line.split(b':', 1)[0].decode('ascii'),
+                 match.start(), None])
+        else:
+            return None
+    close(sections, len(data))
+    close(racks, len(data))
+    if not sections or sections[0][1] != 0:
+        return None
+    return sections, racks
+
+
+def scan_index(path):
+    """Indexes an intermediary file written without an index
+
+    The file is split into sections and racks by scanning its outer lines,
+    which takes a fraction of the time of parsing it. Files whose layout
+    differs from the one ``write_intermediary`` produces, such as edited
+    files with comments or flow style racks, are not indexed.
+
+    :param path: path of the intermediary file
+    :return: an index as returned by ``read_index``, or None if the layout
+             of the file is not recognised
+    :rtype: dict
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    blocks = _scan_blocks(data)
+    if blocks is None:
+        LOG.info("Layout of {} not recognised, not indexing it".format(path))
+        return None
+    sections, racks = blocks
+    header_end = len(_BAREMETAL_HEADER)
+    for section, offset, end in sections:
+        if section != 'baremetal' or not racks:
+            continue
+        if data[offset:offset + header_end] != \
+                _BAREMETAL_HEADER.encode('ascii') or \
+                racks[0][1] != offset + header_end or racks[-1][2] != end:
+            return None
+    entries = {}
+    for kind, blocks in (('sections', sections), ('racks', racks)):
+        entries[kind] = {}
+        for name, offset, end in blocks:
+            if name in entries[kind]:
+                return None
+            entries[kind][name] = {
+                'offset': offset,
+                'length': end - offset,
+                'sha256': _sha256(data[offset:end]),
+            }
+    if racks and 'baremetal' not in entries['sections']:
+        return None
+    return {
+        'version': INDEX_VERSION,
+        'sha256': _sha256(data),
+        'sections': entries['sections'],
+        'racks': entries['racks'],
+    }
+
+
+def _read_block(f, entry):
+    f.seek(entry['offset'])
+    return f.read(entry['length']).decode('utf-8')
+
+
+def load_intermediary(path, sections=None, racks=None, index=None):
+    """Loads an intermediary file, or some of its sections and racks
+
+    With a valid index, only the requested sections and racks are read and
+    parsed, otherwise the whole file is parsed and filtered. Intermediary
+    directories are loaded from the header and the requested rack files.
+
+    :param path: path of the intermediary file or directory
+    :param sections: names of the top-level sections to load, all of them
+                     if not given
+    :param racks: names of the racks of baremetal to load, all of them if
+                  not given. Racks missing from the file are ignored.
+    :param index: index of the file returned by ``read_index``, read if not
+                  given
+    :return: the intermediary data
+    :rtype: dict
+    """
+    if os.path.isdir(path):
+        return _load_intermediary_dir(path, sections, racks)
+    if index is None:
+        index = read_index(path)
+    if index is None:
+        with open(path, 'r') as f:
+            intermediary_dict = yaml.load(f, Loader=SafeLoader)
+        if sections is not None:
+            intermediary_dict = {
+                section: value
+                for section, value in intermediary_dict.items()
+                if section in sections
+            }
+        if racks is not None and intermediary_dict.get('baremetal'):
+            intermediary_dict['baremetal'] = {
+                rack: hosts
+                for rack, hosts in intermediary_dict['baremetal'].items()
+                if rack in racks
+            }
+        return intermediary_dict
+
+    intermediary_dict = {}
+    with open(path, 'rb') as f:
+        for section, entry in sorted(index['sections'].items()):
+            if sections is not None and section not in sections:
+                continue
+            if section == 'baremetal' and index['racks']:
+                text = _BAREMETAL_HEADER + ''.join(
+                    _read_block(f, rack_entry)
+                    for rack, rack_entry in sorted(index['racks'].items())
+                    if racks is None or rack in racks)
+                data = yaml.load(text, Loader=SafeLoader)
+                intermediary_dict[section] = data[section] or {}
+            else:
+                intermediary_dict.update(
+                    yaml.load(_read_block(f, entry), Loader=SafeLoader))
+    return intermediary_dict
+
+
+def changed_racks(old_index, new_index):
+    """Lists the racks whose content differs between two indexed files
+
+    :param old_index: index of the first intermediary file
+    :param new_index: index of the second intermediary file
+    :return: names of the racks added, removed or changed
+    :rtype: set
+    """
+    old_racks = old_index['racks']
+    new_racks = new_index['racks']
+    return {
+        rack
+        for rack in set(old_racks) | set(new_racks)
+        if rack not in old_racks or rack not in new_racks
+        or old_racks[rack]['sha256'] != new_racks[rack]['sha256']
+    }
+
+
+def drop_unchanged_racks(old_intermediary, new_intermediary):
+    """Removes the racks with the same hosts from two intermediaries
+
+    :param old_intermediary: the intermediary data, changed in place
+    :param new_intermediary: the intermediary data, changed in place
+    :return: names of the racks added, removed or changed
+    :rtype: set
+    """
+    old_racks = old_intermediary.get('baremetal') or {}
+    new_racks = new_intermediary.get('baremetal') or {}
+    unchanged = {
+        rack
+        for rack in set(old_racks) & set(new_racks)
+        if old_racks[rack] == new_racks[rack]
+    }
+    for rack in unchanged:
+        del old_racks[rack]
+        del new_racks[rack]
+    return (set(old_racks) | set(new_racks))
+
+
+def _write_if_changed(path, text):
+    """Writes a file unless it already has the given content
+
+    Files are replaced by renaming a temporary file, so readers never see a
+    partially written file.
+
+    :return: True if the file was written
+    :rtype: bool
+    """
+    data = text.encode('utf-8')
+    if os.path.isfile(path) and os.path.getsize(path) == len(data):
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def _rack_filename(rack):
+    """Returns the name of the file of a rack in an intermediary directory
+
+    Rack names are converted to strings, with ``%``, path separators and a
+    leading dot percent-encoded so the file stays in the rack directory.
+    """
+    name = str(rack)
+    for char in ('%', '/', '\\'):
+        name = name.replace(char, '%{:02X}'.format(ord(char)))
+    if name.startswith('.'):
+        name = '%2E' + name[1:]
+    return name + RACK_FILE_EXT
+
+
+def _rack_names(path):
+    """Lists the racks that have a file in an intermediary directory"""
+    return sorted(
+        unquote(filename[:-len(RACK_FILE_EXT)])
+        for filename in os.listdir(os.path.join(path, RACK_DIR))
+        if filename.endswith(RACK_FILE_EXT))
+
+
+def rack_file(outdir, rack):
+    """Returns the path of the file of a rack in an intermediary directory"""
+    return os.path.join(outdir, RACK_DIR, _rack_filename(rack))
+
+
+def _rack_file_text(rack):
+    return ''.join(_rack_chunks(rack, 0, with_name=False))
+
+
+def write_intermediary_dir(intermediary, outdir, racks=None):
+    """Writes an intermediary as a header file and a file per rack
+
+    Files whose content is unchanged are not rewritten, and the files of
+    racks no longer in the intermediary are removed.
+
+    :param intermediary: the intermediary data, or site data whose racks
+                         are written as by ``emit_intermediary``
+    :param outdir: path of the intermediary directory, created if missing
+    :param racks: names of the only racks to write, when the others are
+                  known to be unchanged. The header is always written and
+                  no rack file is removed.
+    :return: number of files written and removed
+    :rtype: dict
+    """
+    os.makedirs(os.path.join(outdir, RACK_DIR), exist_ok=True)
+    if isinstance(intermediary, dict):
+        header = dict(intermediary)
+        baremetal = header.pop('baremetal', None) or {}
+        render = _dump
+    else:
+        header = intermediary.dict_from_class(hosts=False)
+        del header['baremetal']
+        baremetal = _racks_by_name(intermediary)
+        render = _rack_file_text
+    files = [(os.path.join(outdir, HEADER_FILE), _dump, header)]
+    files.extend(
+        (rack_file(outdir, rack), render, value)
+        for rack, value in baremetal.items() if racks is None or rack in racks)
+    written = sum(
+        _write_if_changed(file_path, to_text(value))
+        for file_path, to_text, value in files)
+
+    removed = 0
+    rack_files = {_rack_filename(rack) for rack in baremetal}
+    for filename in os.listdir(os.path.join(outdir, RACK_DIR)):
+        if racks is None and filename.endswith(RACK_FILE_EXT) \
+                and filename not in rack_files:
+            os.remove(os.path.join(outdir, RACK_DIR, filename))
+            removed += 1
+    LOG.info(
+        "Intermediary files written: {}, unchanged: {}, removed: {}".format(
+            written,
+            len(files) - written, removed))
+    return {'written': written, 'removed': removed}
+
+
+def _load_file(path):
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
+def _load_intermediary_dir(path, sections=None, racks=None):
+    """Loads the header and rack files of an intermediary directory
+
+    Rack names are decoded from the file names, so they are strings.
+    """
+    rack_names = _rack_names(path)
+    if racks is not None:
+        rack_names = [rack for rack in rack_names if rack in racks]
+    load_header = sections is None or set(sections) - {'baremetal'}
+    load_racks = sections is None or 'baremetal' in sections
+    paths = [rack_file(path, rack) for rack in rack_names] if load_racks \
+        else []
+    if load_header:
+        paths.append(os.path.join(path, HEADER_FILE))
+
+    loaded = [_load_file(file_path) for file_path in paths]
+
+    intermediary_dict = {}
+    if load_header:
+        intermediary_dict.update(
+            (section, value) for section, value in loaded.pop().items()
+            if sections is None or section in sections)
+    if load_racks:
+        intermediary_dict['baremetal'] = {
+            rack: hosts or {}
+            for rack, hosts in zip(rack_names, loaded)
+        }
+    return intermediary_dict
+
+
+def _dir_changed_racks(old_path, new_path):
+    """Lists the racks whose files differ between intermediary directories"""
+    def read(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    old_racks = set(_rack_names(old_path))
+    new_racks = set(_rack_names(new_path))
+    return (old_racks ^ new_racks) | {
+        rack
+        for rack in old_racks & new_racks
+        if read(rack_file(old_path, rack)) != read(rack_file(new_path, rack))
+    }
+
+
+def load_changed_racks(old_path, new_path):
+    """Loads two intermediaries without the racks they have in common
+
+    Only the racks whose text differs are parsed: racks are compared by the
+    digests of an index, read or scanned, of intermediary files and by the
+    content of the rack files of intermediary directories. When the racks
+    cannot be located in the text, both intermediaries are parsed in full
+    and their racks compared as data, which is logged as a warning.
+
+    :param old_path: path of the first intermediary file or directory
+    :param new_path: path of the second intermediary file or directory
+    :return: the intermediary data of both, with every section but only the
+             racks added, removed or changed
+    :rtype: tuple
+    """
+    if os.path.isdir(old_path) and os.path.isdir(new_path):
+        racks = _dir_changed_racks(old_path, new_path)
+        return (
+            load_intermediary(old_path, racks=racks),
+            load_intermediary(new_path, racks=racks))
+    if os.path.isfile(old_path) and os.path.isfile(new_path):
+        old_index = read_index(old_path) or scan_index(old_path)
+        new_index = read_index(new_path) or scan_index(new_path)
+        if old_index is not None and new_index is not None:
+            racks = changed_racks(old_index, new_index)
+            return (
+                load_intermediary(old_path, racks=racks, index=old_index),
+                load_intermediary(new_path, racks=racks, index=new_index))
+    LOG.warning(
+        "Racks of {} and {} cannot be compared as text, parsing them in "
+        "full".format(old_path, new_path))
+    old_intermediary = load_intermediary(old_path)
+    new_intermediary = load_intermediary(new_path)
+    drop_unchanged_racks(old_intermediary, new_intermediary)
+    return old_intermediary, new_intermediary
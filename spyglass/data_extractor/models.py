@@ -12,32 +12,108 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from copy import deepcopy
+from array import array
+import collections
+from collections import abc
+import functools
 import ipaddress
+import itertools
 import logging
-
+import re
+import threading
+
+from spyglass.data_extractor.address_index import AddressIndex
+from spyglass.data_extractor.fingerprint import Fingerprinted
+from spyglass.data_extractor.intermediary_file import load_intermediary
+from spyglass.data_extractor.site_diff import diff_site_data
+from spyglass.data_extractor.site_config import SiteConfigMerge
 from spyglass.exceptions import InvalidIntermediary
 
 DATA_DEFAULT = "#CHANGE_ME"
 
+# Number of distinct address strings whose validation result is cached
+IP_CACHE_SIZE = 4096
+
+# Characters an IPv4 or IPv6 address or network may be written with
+_IP_CHARACTERS_RE = re.compile(r'^[0-9A-Fa-f.:/]+$')
+
 LOG = logging.getLogger(__name__)
 
+# Number of times each invalid address has been seen since the last summary
+_invalid_ips = collections.Counter()
+_invalid_ips_lock = threading.Lock()
 
-def _parse_ip(addr):
-    """Validates the given ip address
 
-    Validates addr and returns an IPAddress type object if it is a valid
-    address. If it is not valid, a warning is logged and the addr parameter
-    is returned.
+@functools.lru_cache(maxsize=IP_CACHE_SIZE)
+def _is_valid_ip_str(addr):
+    """Returns True if the string is a valid IP address or network
 
-    :param addr: The address to validate
-    :return: addr as an IPAddress object or string
+    Strings with characters that cannot appear in an address are rejected
+    without being parsed.
     """
+    if not _IP_CHARACTERS_RE.match(addr):
+        return False
     try:
         ipaddress.ip_network(addr)
     except ValueError:
-        if addr != DATA_DEFAULT:
-            LOG.warning("%s is not a valid IP address.", addr)
+        return False
+    return True
+
+
+def is_valid_ip(addr):
+    """Returns True if addr is a valid IP address or network
+
+    Results for strings are cached, as the same addresses are validated
+    every time models are created or merged.
+
+    :param addr: The address to validate
+    :rtype: bool
+    """
+    if isinstance(addr, str):
+        return _is_valid_ip_str(addr)
+    try:
+        ipaddress.ip_network(addr)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def _warn_invalid_ip(addr):
+    """Logs a warning the first time an invalid address is seen"""
+    key = str(addr)
+    with _invalid_ips_lock:
+        _invalid_ips[key] += 1
+        first_seen = _invalid_ips[key] == 1
+    if first_seen:
+        LOG.warning("%s is not a valid IP address.", addr)
+
+
+def log_invalid_ip_summary():
+    """Logs how often each invalid address was seen and resets the counts
+
+    Only the first occurrence of an invalid address is logged by
+    ``_parse_ip``, this summary reports the addresses seen more than once.
+    """
+    with _invalid_ips_lock:
+        counts = sorted(_invalid_ips.items())
+        _invalid_ips.clear()
+    for addr, count in counts:
+        if count > 1:
+            LOG.warning(
+                "%s is not a valid IP address (seen %d times).", addr, count)
+
+
+def _parse_ip(addr):
+    """Validates the given ip address
+
+    If addr is not a valid address, a warning is logged the first time it
+    is seen. The addr parameter is returned unchanged.
+
+    :param addr: The address to validate
+    :return: addr
+    """
+    if addr != DATA_DEFAULT and not is_valid_ip(addr):
+        _warn_invalid_ip(addr)
     return addr
 
 
@@ -81,8 +157,90 @@ class ServerList(object):
                 self.servers.append(_parse_ip(addr))
 
 
-class IPList(object):
-    """Model for IP addresses for a baremetal host"""
+# Roles of the addresses stored in an IPList, in the order they are listed
+IP_ROLES = ('oob', 'oam', 'calico', 'overlay', 'pxe', 'storage')
+
+# Codes of the values stored in the address slots of an IPList and the
+# address columns of a HostStore
+_IPV4_CODE = 4
+_IPV6_CODE = 6
+_DEFAULT_CODE = 1
+_OTHER_CODE = 0
+
+# Bytes per role in an IPList: the code, then the address as an integer
+_IP_SLOT_SIZE = 17
+_DEFAULT_SLOT = bytes((_DEFAULT_CODE, )) + bytes(_IP_SLOT_SIZE - 1)
+_OTHER_SLOT = bytes((_OTHER_CODE, )) + bytes(_IP_SLOT_SIZE - 1)
+
+
+@functools.lru_cache(maxsize=IP_CACHE_SIZE)
+def _pack_ip_str(addr):
+    """Returns the (version, integer value) of an address string, or None"""
+    if not _IP_CHARACTERS_RE.match(addr):
+        return None
+    try:
+        address = ipaddress.ip_address(addr)
+    except ValueError:
+        return None
+    return address.version, int(address)
+
+
+def pack_ip(addr):
+    """Returns an address as an (IP version, integer value) tuple
+
+    :param addr: the address as a string
+    :return: the packed address, or None if addr is not an address
+    :rtype: tuple
+    """
+    if not isinstance(addr, str):
+        return None
+    return _pack_ip_str(addr)
+
+
+class _PackedIP(object):
+    """Descriptor for one address role of an IPList"""
+    def __init__(self, index):
+        self.index = index
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance._render(self.index)
+
+    def __set__(self, instance, value):
+        instance._store(self.index, _parse_ip(value))
+
+
+def _address_key(packed):
+    """Sort key of a packed address, None for values that are not last"""
+    return (0, packed) if packed is not None else (1, )
+
+
+class IPList(Fingerprinted):
+    """Model for IP addresses for a baremetal host
+
+    The addresses of the six roles are packed into a single ``bytes`` buffer
+    of ``_IP_SLOT_SIZE`` bytes per role: a code giving the IP version, then
+    the address as a 16-byte big-endian integer. Addresses are rendered to
+    text each time they are read, so ``host.ip.oob`` returns the text given
+    for the address. Values that are not addresses, other than
+    ``DATA_DEFAULT``, and IPv6 addresses not given in their compressed form
+    are kept as given in a dictionary created for the first of them.
+    """
+
+    __slots__ = (
+        '_packed', '_other', '_fingerprint', '_fingerprint_parents',
+        '_fingerprinted_children', '__weakref__')
+
+    fingerprint_kind = 'ip_list'
+
+    oob = _PackedIP(0)
+    oam = _PackedIP(1)
+    calico = _PackedIP(2)
+    overlay = _PackedIP(3)
+    pxe = _PackedIP(4)
+    storage = _PackedIP(5)
+
     def __init__(
             self,
             oob=DATA_DEFAULT,
@@ -91,7 +249,7 @@ class IPList(object):
             overlay=DATA_DEFAULT,
             pxe=DATA_DEFAULT,
             storage=DATA_DEFAULT):
-        """Validates a list of string IPs into IPAddress objects
+        """Validates a list of string IPs and packs them as integers
 
         :param oob: OOB IP address as string
         :param oam: OAM IP address as string
@@ -100,77 +258,122 @@ class IPList(object):
         :param pxe: PXE IP address as string
         :param storage: Storage IP address as string
         """
-        self.oob = _parse_ip(oob)
-        self.oam = _parse_ip(oam)
-        self.calico = _parse_ip(calico)
-        self.overlay = _parse_ip(overlay)
-        self.pxe = _parse_ip(pxe)
-        self.storage = _parse_ip(storage)
+        self._other = None
+        values = (oob, oam, calico, overlay, pxe, storage)
+        self._packed = b''.join(
+            self._encode(index, _parse_ip(value))
+            for index, value in enumerate(values))
+
+    def _encode(self, index, value):
+        """Returns the slot of a value, keeping it in _other if needed"""
+        packed = _pack_ip_str(value) if isinstance(value, str) else None
+        if packed is not None:
+            version, number = packed
+            if version == 6 and value != str(ipaddress.IPv6Address(number)):
+                self._set_other(index, value)
+            else:
+                self._set_other(index, None)
+            return bytes((version, )) + number.to_bytes(16, 'big')
+        if value == DATA_DEFAULT:
+            self._set_other(index, None)
+            return _DEFAULT_SLOT
+        self._set_other(index, value)
+        return _OTHER_SLOT
+
+    def _set_other(self, index, value):
+        """Keeps a value as given, or forgets it if value is None"""
+        if self._other is None:
+            if value is not None:
+                self._other = {index: value}
+        elif value is None:
+            self._other.pop(index, None)
+        else:
+            self._other[index] = value
+
+    def _store(self, index, value):
+        """Packs a value into the slot of a role"""
+        offset = index * _IP_SLOT_SIZE
+        self._packed = (
+            self._packed[:offset] + self._encode(index, value)
+            + self._packed[offset + _IP_SLOT_SIZE:])
+
+    def _render(self, index):
+        """Returns the text of a value, rendering an address"""
+        offset = index * _IP_SLOT_SIZE
+        end = offset + _IP_SLOT_SIZE
+        code = self._packed[offset]
+        if code == _IPV4_CODE:
+            return str(ipaddress.IPv4Address(self._packed[end - 4:end]))
+        if code == _DEFAULT_CODE:
+            return DATA_DEFAULT
+        if self._other is not None and index in self._other:
+            return self._other[index]
+        if code == _IPV6_CODE:
+            return str(ipaddress.IPv6Address(self._packed[offset + 1:end]))
+        return None
+
+    def _packed_address(self, index):
+        """Returns (IP version, integer value) of a slot, or None"""
+        offset = index * _IP_SLOT_SIZE
+        code = self._packed[offset]
+        if code != _IPV4_CODE and code != _IPV6_CODE:
+            return None
+        return code, int.from_bytes(
+            self._packed[offset + 1:offset + _IP_SLOT_SIZE], 'big')
+
+    def packed(self, role: str):
+        """Returns an address as an (IP version, integer value) tuple
+
+        Packed addresses compare and sort in the same order as the
+        addresses, IPv4 before IPv6.
+
+        :param role: role of the address, one of ``IP_ROLES``
+        :return: the packed address, or None if the value of the role is not
+                 an address
+        :rtype: tuple
+        """
+        return self._packed_address(IP_ROLES.index(role))
 
     def __iter__(self):
-        yield from {
-            'oob': self.oob,
-            'oam': self.oam,
-            'calico': self.calico,
-            'overlay': self.overlay,
-            'pxe': self.pxe,
-            'storage': self.storage
-        }.items()
+        for index, role in enumerate(IP_ROLES):
+            yield role, self._render(index)
 
     def set_ip_by_role(self, role: str, new_value):
-        # TODO(ian-pittwood): use setattr here?
-        if role == 'oob':
-            self.oob = _parse_ip(new_value)
-        elif role == 'oam':
-            self.oam = _parse_ip(new_value)
-        elif role == 'calico':
-            self.calico = _parse_ip(new_value)
-        elif role == 'overlay':
-            self.overlay = _parse_ip(new_value)
-        elif role == 'pxe':
-            self.pxe = _parse_ip(new_value)
-        elif role == 'storage':
-            self.storage = _parse_ip(new_value)
+        if role in IP_ROLES:
+            setattr(self, role, new_value)
         else:
             LOG.warning('{} role is not defined for IPList.'.format(role))
 
     def dict_from_class(self):
         """Creates a writeable dict structure from the object"""
-        dictionary = {}
-        if self.oob:
-            dictionary['oob'] = self.oob
-        if self.oam:
-            dictionary['oam'] = self.oam
-        if self.calico:
-            dictionary['calico'] = self.calico
-        if self.overlay:
-            dictionary['overlay'] = self.overlay
-        if self.pxe:
-            dictionary['pxe'] = self.pxe
-        if self.storage:
-            dictionary['storage'] = self.storage
-
+        dictionary = {role: value for role, value in self if value}
         if not dictionary:
             LOG.warning('Object contains no data.')
         return dictionary
 
     def merge_additional_data(self, config_dict: dict):
-        if 'oob' in config_dict:
-            self.oob = _parse_ip(config_dict['oob'])
-        if 'oam' in config_dict:
-            self.oam = _parse_ip(config_dict['oam'])
-        if 'calico' in config_dict:
-            self.calico = _parse_ip(config_dict['calico'])
-        if 'overlay' in config_dict:
-            self.overlay = _parse_ip(config_dict['overlay'])
-        if 'pxe' in config_dict:
-            self.pxe = _parse_ip(config_dict['pxe'])
-        if 'storage' in config_dict:
-            self.storage = _parse_ip(config_dict['storage'])
-
-
-class Host(object):
+        for role in IP_ROLES:
+            if role in config_dict:
+                setattr(self, role, config_dict[role])
+
+    def _fingerprint_content(self):
+        content = {}
+        for index, role in enumerate(IP_ROLES):
+            packed = self._packed_address(index)
+            if packed is not None:
+                content[role] = list(packed)
+            else:
+                value = self._render(index)
+                if value:
+                    content[role] = value
+        return content
+
+
+class Host(Fingerprinted):
     """Model for a baremetal host"""
+
+    fingerprint_kind = 'host'
+
     def __init__(self, name, **kwargs):
         """Stores data for a baremetal host
 
@@ -212,17 +415,41 @@ class Host(object):
             self.ip.merge_additional_data(config_dict['ip'])
         self.data.update(config_dict)
 
+    def _fingerprint_children(self):
+        return [self.ip]
+
+    def _fingerprint_content(self):
+        return [
+            {
+                'name': self.name,
+                'host_profile': self.host_profile,
+                'type': self.type
+            },
+            self._child_fingerprint(self.ip)
+        ]
+
 
-class Rack(object):
+class Rack(Fingerprinted):
     """Model for a baremetal rack"""
-    def __init__(self, name: str, host_list: list):
+
+    fingerprint_kind = 'rack'
+
+    def __init__(self, name: str, host_list: list, networks: list = None):
         """Stores data for the top-level, baremetal rack
 
         :param name: Rack name
         :param host_list: list of Host objects that belong to the rack
+        :param networks: list of VLANNetworkData objects for the networks
+                         with subnets local to the rack, these replace the
+                         site-wide networks of the same name for the rack's
+                         hosts
         """
         self.name = name
         self.hosts = host_list
+        # Rack-level networks indexed by name
+        self.networks = {}
+        for vlan_data in networks or []:
+            self.networks[vlan_data.name] = vlan_data
 
     def dict_from_class(self):
         """Creates a writeable dict structure from the object"""
@@ -232,14 +459,27 @@ class Rack(object):
         return rack_as_dict
 
     def merge_additional_data(self, config_dict: dict):
+        hosts = {host.name: host for host in self.hosts}
         for key, value in config_dict.items():
-            exists = False
-            for host in self.hosts:
-                if host.name == key:
-                    exists = True
-                    host.merge_additional_data(value)
-            if not exists:
-                self.hosts.append(Host(key, **value))
+            if key in hosts:
+                hosts[key].merge_additional_data(value)
+            else:
+                hosts[key] = Host(key, **value)
+                self.hosts.append(hosts[key])
+
+    def _fingerprint_children(self):
+        return self.hosts + list(self.networks.values())
+
+    def _fingerprint_content(self):
+        return [
+            self.name,
+            {host.name: self._child_fingerprint(host)
+             for host in self.hosts},
+            {
+                name: self._child_fingerprint(vlan_data)
+                for name, vlan_data in self.networks.items()
+            }
+        ]
 
     def get_host_by_name(self, name: str):
         """Gets a host on the rack by name
@@ -266,9 +506,633 @@ class Rack(object):
                 matching_hosts.append(host)
         return matching_hosts
 
+    def count_hosts_by_type(self):
+        """Counts the hosts on the rack of each type
+
+        :return: number of hosts by host type
+        :rtype: collections.Counter
+        """
+        return collections.Counter(host.type for host in self.hosts)
+
+    def sorted_hosts(self, field: str = 'name'):
+        """Returns the hosts on the rack sorted by a field
+
+        :param field: ``name``, ``type``, ``host_profile`` or one of
+                      ``IP_ROLES`` to sort by address, hosts without an
+                      address for the role last
+        :return: list of hosts
+        :rtype: list
+        """
+        if field in IP_ROLES:
+            return sorted(
+                self.hosts,
+                key=lambda host: _address_key(host.ip.packed(field)))
+        return sorted(self.hosts, key=lambda host: getattr(host, field))
+
+
+# Held while a lazily loaded model builds its content, so concurrent first
+# reads get the same objects
+_materialize_lock = threading.Lock()
+
+
+class _LazyModel(object):
+    """Mixin for models built from intermediary data on first access"""
+
+    #: Names of the attributes holding the intermediary data of the model,
+    #: None once its content is built
+    _lazy_sources = ()
+
+    @property
+    def materialized(self):
+        """Whether the content of the model has been built"""
+        return all(
+            getattr(self, source) is None for source in self._lazy_sources)
+
+    def materialize(self):
+        """Builds the content of the model, validating its addresses"""
+        raise NotImplementedError()
+
+
+def _host_from_intermediary(rack_name, host_name, host_data):
+    """Creates a Host from its intermediary data"""
+    return Host(
+        host_name,
+        rack_name=rack_name,
+        host_profile=host_data['host_profile'],
+        type=host_data['type'],
+        ip=IPList(**host_data['ip']))
+
 
-class VLANNetworkData(object):
+class LazyRack(_LazyModel, Rack):
+    """Rack whose hosts and networks are built from the intermediary
+
+    The Host and VLANNetworkData objects are created when ``hosts`` or
+    ``networks`` is first read, so racks that are never used cost only
+    their name.
+    """
+
+    _lazy_sources = ('_host_data', '_network_data')
+
+    def __init__(self, name: str, host_data: dict, network_data: dict = None):
+        """Stores the intermediary data of a rack
+
+        :param name: Rack name
+        :param host_data: intermediary data of the rack's hosts, keyed by
+                          host name
+        :param network_data: intermediary data of the rack-level networks,
+                             keyed by network name
+        """
+        self._host_data = host_data
+        self._network_data = network_data or {}
+        self._hosts = None
+        self._networks = None
+        self.name = name
+
+    @property
+    def hosts(self):
+        if self._host_data is not None:
+            with _materialize_lock:
+                if self._host_data is not None:
+                    self._hosts = [
+                        _host_from_intermediary(self.name, name, data)
+                        for name, data in self._host_data.items()
+                    ]
+                    self._host_data = None
+        return self._hosts
+
+    @hosts.setter
+    def hosts(self, host_list):
+        self._host_data = None
+        self._hosts = host_list
+
+    @property
+    def networks(self):
+        if self._network_data is not None:
+            with _materialize_lock:
+                if self._network_data is not None:
+                    self._networks = {
+                        name: VLANNetworkData(name, **data)
+                        for name, data in self._network_data.items()
+                    }
+                    self._network_data = None
+        return self._networks
+
+    @networks.setter
+    def networks(self, networks):
+        self._network_data = None
+        self._networks = networks
+
+    def materialize(self):
+        self.hosts
+        self.networks
+
+
+# Host attributes stored in the columns of a HostStore
+_HOST_COLUMNS = ('rack_name', 'type', 'host_profile', 'ip')
+
+
+class _Codes(object):
+    """Table of the distinct values of a column and their integer codes"""
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        """Returns the code of a value, adding the value if it is new"""
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class HostStore(object):
+    """Column-wise storage of the hosts of a site
+
+    Each host is a row of the store. Host names are kept in a list, racks,
+    types and host profiles as integer codes in arrays and IPv4 addresses
+    as integers in an array per role, so a site with hundreds of thousands
+    of hosts needs no objects per host. IPv6 addresses and values that are
+    not addresses, other than ``DATA_DEFAULT``, are kept by row in a
+    dictionary per role.
+
+    The hosts of a ``ColumnarRack`` are read and changed through Host views
+    of its rows, created when iterating over ``rack.hosts``. Host objects
+    added to a columnar rack are copied into new rows.
+    """
+    def __init__(self):
+        self.racks = []
+        self.names = []
+        self.rack_index = array('I')
+        self.types = _Codes()
+        self.type_codes = array('I')
+        self.profiles = _Codes()
+        self.profile_codes = array('I')
+        self.ip_codes = [bytearray() for _ in IP_ROLES]
+        self.ip_values = [array('I') for _ in IP_ROLES]
+        self.ip_other = [{} for _ in IP_ROLES]
+        # Data given for hosts besides the columns, by row
+        self.extra = {}
+        # Number of rows removed from their rack
+        self.detached = 0
+
+    def __len__(self):
+        return len(self.names) - self.detached
+
+    def add_rack(self, name: str, networks: list = None):
+        """Creates a rack storing its hosts in the store
+
+        :param name: Rack name
+        :param networks: list of VLANNetworkData objects of the rack
+        :rtype: ColumnarRack
+        """
+        return ColumnarRack(name, self, networks)
+
+    def add_row(self, rack_index, name, host_type, host_profile, ip):
+        """Adds a host to the store, validating its addresses
+
+        :param rack_index: index of the host's rack in ``racks``
+        :param name: Host name
+        :param host_type: Host type
+        :param host_profile: Host profile
+        :param ip: dictionary of the host's addresses by role, roles missing
+                   are set to ``DATA_DEFAULT``
+        :return: the row of the host
+        :rtype: int
+        """
+        row = len(self.names)
+        self.names.append(name)
+        self.rack_index.append(rack_index)
+        self.type_codes.append(self.types.code(host_type))
+        self.profile_codes.append(self.profiles.code(host_profile))
+        for index, role in enumerate(IP_ROLES):
+            self.ip_codes[index].append(_OTHER_CODE)
+            self.ip_values[index].append(0)
+            self.set_ip(row, index, _parse_ip(ip.get(role, DATA_DEFAULT)))
+        return row
+
+    def add_host(self, host, rack_index):
+        """Copies a Host object into a new row
+
+        :return: the row of the host
+        :rtype: int
+        """
+        ip = host.ip if isinstance(host.ip, dict) else dict(host.ip)
+        row = self.add_row(
+            rack_index, host.name, host.type, host.host_profile, ip)
+        extra = {
+            key: value
+            for key, value in host.data.items() if key not in _HOST_COLUMNS
+        }
+        if host.rack_name != self.racks[rack_index].name:
+            extra['rack_name'] = host.rack_name
+        if extra:
+            self.extra[row] = extra
+        return row
+
+    def set_ip(self, row, index, value):
+        """Stores the address of a host for the role at index of IP_ROLES"""
+        packed = _pack_ip_str(value) if isinstance(value, str) else None
+        other = self.ip_other[index]
+        if packed is not None and packed[0] == 4:
+            self.ip_codes[index][row] = _IPV4_CODE
+            self.ip_values[index][row] = packed[1]
+            other.pop(row, None)
+        elif value == DATA_DEFAULT:
+            self.ip_codes[index][row] = _DEFAULT_CODE
+            other.pop(row, None)
+        else:
+            self.ip_codes[index][row] = _OTHER_CODE
+            other[row] = value
+
+    def get_ip(self, row, index):
+        """Returns the address of a host for the role at index of IP_ROLES"""
+        code = self.ip_codes[index][row]
+        if code == _IPV4_CODE:
+            return str(ipaddress.IPv4Address(self.ip_values[index][row]))
+        if code == _DEFAULT_CODE:
+            return DATA_DEFAULT
+        return self.ip_other[index].get(row)
+
+    def packed_ip(self, row, index):
+        """Returns an address of a host as (IP version, integer value)
+
+        :return: the packed address, or None if the value is not an address
+        :rtype: tuple
+        """
+        code = self.ip_codes[index][row]
+        if code == _IPV4_CODE:
+            return 4, self.ip_values[index][row]
+        if code == _DEFAULT_CODE:
+            return None
+        return pack_ip(self.ip_other[index].get(row))
+
+    def touch(self, row):
+        """Marks the rack of a changed host as changed"""
+        self.racks[self.rack_index[row]].touch()
+
+    def count_hosts_by_type(self):
+        """Counts the hosts of the store of each type
+
+        :return: number of hosts by host type
+        :rtype: collections.Counter
+        """
+        if self.detached:
+            counts = collections.Counter()
+            for rack in self.racks:
+                counts.update(rack.count_hosts_by_type())
+            return counts
+        return collections.Counter(
+            {
+                self.types.values[code]: count
+                for code, count in collections.Counter(
+                    self.type_codes).items()
+            })
+
+
+class _IPListView(IPList):
+    """IPList reading and writing the addresses of a HostStore row"""
+
+    __slots__ = ('_host_store', '_row')
+
+    fingerprint_cached = False
+
+    def __init__(self, host_store, row):
+        self._host_store = host_store
+        self._row = row
+
+    def _store(self, index, value):
+        self._host_store.set_ip(self._row, index, value)
+        self._host_store.touch(self._row)
+
+    def _render(self, index):
+        return self._host_store.get_ip(self._row, index)
+
+    def packed(self, role: str):
+        return self._host_store.packed_ip(self._row, IP_ROLES.index(role))
+
+    def _fingerprint_content(self):
+        content = {}
+        for index, role in enumerate(IP_ROLES):
+            packed = self._host_store.packed_ip(self._row, index)
+            if packed is not None:
+                content[role] = list(packed)
+            else:
+                value = self._host_store.get_ip(self._row, index)
+                if value:
+                    content[role] = value
+        return content
+
+
+class _HostView(Host):
+    """Host reading and writing a HostStore row
+
+    Views of the same row compare equal. They are not cached, their rack
+    is marked changed instead when a value is set.
+    """
+
+    fingerprint_cached = False
+
+    def __init__(self, host_store, row):
+        # Views are created for every host iterated over, so they are
+        # initialized without the change tracking of Fingerprinted
+        object.__setattr__(self, '_host_store', host_store)
+        object.__setattr__(self, '_row', row)
+
+    def __eq__(self, other):
+        return isinstance(other, _HostView) and \
+            other._host_store is self._host_store and other._row == self._row
+
+    def __hash__(self):
+        return hash((id(self._host_store), self._row))
+
+    def _set(self, column, value):
+        column[self._row] = value
+        self._host_store.touch(self._row)
+
+    @property
+    def name(self):
+        return self._host_store.names[self._row]
+
+    @name.setter
+    def name(self, value):
+        self._set(self._host_store.names, value)
+
+    @property
+    def type(self):
+        store = self._host_store
+        return store.types.values[store.type_codes[self._row]]
+
+    @type.setter
+    def type(self, value):
+        self._set(
+            self._host_store.type_codes, self._host_store.types.code(value))
+
+    @property
+    def host_profile(self):
+        store = self._host_store
+        return store.profiles.values[store.profile_codes[self._row]]
+
+    @host_profile.setter
+    def host_profile(self, value):
+        self._set(
+            self._host_store.profile_codes,
+            self._host_store.profiles.code(value))
+
+    @property
+    def rack_name(self):
+        store = self._host_store
+        extra = store.extra.get(self._row, {})
+        if 'rack_name' in extra:
+            return extra['rack_name']
+        return store.racks[store.rack_index[self._row]].name
+
+    @rack_name.setter
+    def rack_name(self, value):
+        self._host_store.extra.setdefault(self._row, {})['rack_name'] = value
+
+    @property
+    def ip(self):
+        return _IPListView(self._host_store, self._row)
+
+    @ip.setter
+    def ip(self, ip_list):
+        ip = ip_list if isinstance(ip_list, dict) else dict(ip_list)
+        for index, role in enumerate(IP_ROLES):
+            self._host_store.set_ip(
+                self._row, index, _parse_ip(ip.get(role, DATA_DEFAULT)))
+        self._host_store.touch(self._row)
+
+    @property
+    def data(self):
+        data = {
+            'rack_name': self.rack_name,
+            'host_profile': self.host_profile,
+            'type': self.type,
+            'ip': self.ip
+        }
+        data.update(self._host_store.extra.get(self._row, {}))
+        return data
+
+    def merge_additional_data(self, config_dict: dict):
+        if 'type' in config_dict:
+            self.type = config_dict['type']
+        if 'host_profile' in config_dict:
+            self.host_profile = config_dict['host_profile']
+        if 'ip' in config_dict:
+            self.ip.merge_additional_data(config_dict['ip'])
+        extra = {
+            key: value
+            for key, value in config_dict.items()
+            if key not in ('type', 'host_profile', 'ip')
+        }
+        if extra:
+            self._host_store.extra.setdefault(self._row, {}).update(extra)
+
+    def _fingerprint_content(self):
+        return [
+            {
+                'name': self.name,
+                'host_profile': self.host_profile,
+                'type': self.type
+            },
+            self.ip.fingerprint()
+        ]
+
+
+class _HostRows(abc.MutableSequence):
+    """List of the hosts of a ColumnarRack, as views of its rows"""
+    def __init__(self, rack):
+        self._rack = rack
+
+    def _view(self, row):
+        return _HostView(self._rack.host_store, row)
+
+    def _add(self, host):
+        return self._rack.host_store.add_host(host, self._rack.rack_index)
+
+    def __len__(self):
+        return len(self._rack.rows)
+
+    def __iter__(self):
+        for row in self._rack.rows:
+            yield self._view(row)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._view(row) for row in self._rack.rows[index]]
+        return self._view(self._rack.rows[index])
+
+    def __setitem__(self, index, value):
+        rows = self._rack.rows
+        if isinstance(index, slice):
+            new_rows = array('I', [self._add(host) for host in value])
+            self._rack.host_store.detached += len(rows[index])
+            rows[index] = new_rows
+        else:
+            rows[index] = self._add(value)
+            self._rack.host_store.detached += 1
+        self._rack.touch()
+
+    def __delitem__(self, index):
+        rows = self._rack.rows
+        self._rack.host_store.detached += \
+            len(rows[index]) if isinstance(index, slice) else 1
+        del rows[index]
+        self._rack.touch()
+
+    def insert(self, index, value):
+        self._rack.rows.insert(index, self._add(value))
+        self._rack.touch()
+
+    def __eq__(self, other):
+        if not isinstance(other, abc.Sequence):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class ColumnarRack(Rack):
+    """Rack whose hosts are rows of a HostStore
+
+    ``hosts`` is a list-like sequence of Host views of the rack's rows, so
+    code reading ``rack.hosts`` or ``host.ip.pxe`` works unchanged. Looking
+    up, counting and sorting hosts scan the store's columns instead.
+    """
+    def __init__(self, name: str, host_store, networks: list = None):
+        """Creates an empty rack and adds it to a store
+
+        :param name: Rack name
+        :param host_store: the HostStore holding the hosts
+        :param networks: list of VLANNetworkData objects for the networks
+                         with subnets local to the rack
+        """
+        self.host_store = host_store
+        self.rack_index = len(host_store.racks)
+        self.rows = array('I')
+        host_store.racks.append(self)
+        self.name = name
+        self.networks = {}
+        for vlan_data in networks or []:
+            self.networks[vlan_data.name] = vlan_data
+
+    @property
+    def hosts(self):
+        return _HostRows(self)
+
+    @hosts.setter
+    def hosts(self, host_list):
+        rows = array('I')
+        for host in host_list:
+            rows.append(self.host_store.add_host(host, self.rack_index))
+        self.host_store.detached += len(getattr(self, 'rows', ()))
+        self.rows = rows
+
+    def add_intermediary_hosts(self, hosts: dict):
+        """Adds hosts to the rack from their intermediary data
+
+        :param hosts: intermediary data of the hosts keyed by host name
+        """
+        for name, host_data in hosts.items():
+            self.rows.append(
+                self.host_store.add_row(
+                    self.rack_index, name, host_data['type'],
+                    host_data['host_profile'], host_data['ip']))
+        self.touch()
+
+    def _fingerprint_children(self):
+        # Changes to the hosts mark the rack changed through the store
+        return list(self.networks.values())
+
+    def _fingerprint_content(self):
+        return [
+            self.name, {host.name: host.fingerprint()
+                        for host in self.hosts},
+            {
+                name: self._child_fingerprint(vlan_data)
+                for name, vlan_data in self.networks.items()
+            }
+        ]
+
+    def get_host_by_name(self, name: str):
+        names = self.host_store.names
+        for row in self.rows:
+            if names[row] == name:
+                return _HostView(self.host_store, row)
+        return None
+
+    def get_host_by_type(self, host_type: str):
+        code = self.host_store.types.codes.get(host_type)
+        if code is None:
+            return []
+        matches = map(
+            code.__eq__,
+            map(self.host_store.type_codes.__getitem__, self.rows))
+        return [
+            _HostView(self.host_store, row)
+            for row in itertools.compress(self.rows, matches)
+        ]
+
+    def count_hosts_by_type(self):
+        types = self.host_store.types.values
+        return collections.Counter(
+            {
+                types[code]: count
+                for code, count in collections.Counter(
+                    map(self.host_store.type_codes.__getitem__,
+                        self.rows)).items()
+            })
+
+    def sorted_hosts(self, field: str = 'name'):
+        store = self.host_store
+        if field in IP_ROLES:
+            index = IP_ROLES.index(field)
+            codes = store.ip_codes[index]
+            if all(codes[row] == _IPV4_CODE for row in self.rows):
+                rows = sorted(
+                    self.rows, key=store.ip_values[index].__getitem__)
+            else:
+                rows = sorted(
+                    self.rows,
+                    key=lambda row: _address_key(store.packed_ip(row, index)))
+        elif field in ('type', 'host_profile'):
+            codes = store.types if field == 'type' else store.profiles
+            column = store.type_codes if field == 'type' \
+                else store.profile_codes
+            rows = sorted(self.rows, key=lambda row: codes.values[column[row]])
+        else:
+            rows = sorted(self.rows, key=store.names.__getitem__)
+        return [_HostView(store, row) for row in rows]
+
+
+# Addresses and ranges defined for each subnet of a VLAN network
+SUBNET_RANGE_KEYS = (
+    'gateway', 'dhcp_start', 'dhcp_end', 'static_start', 'static_end',
+    'reserved_start', 'reserved_end')
+
+
+def _same_subnet(subnet, other):
+    """Returns True if two subnets given as text are the same network
+
+    Subnets are compared as networks, so ``FD00::/64`` matches
+    ``fd00::/64``. Values that are not networks only match themselves.
+    """
+    if subnet == other:
+        return True
+    try:
+        return ipaddress.ip_network(subnet, strict=False) == \
+            ipaddress.ip_network(other, strict=False)
+    except (TypeError, ValueError):
+        return False
+
+
+class VLANNetworkData(Fingerprinted):
     """Model for single entry of VLAN Network Data"""
+
+    fingerprint_kind = 'vlan_network_data'
+
     def __init__(self, name: str, **kwargs):
         """Stores single entry of VLAN Network Data
 
@@ -289,6 +1153,9 @@ class VLANNetworkData(object):
             * *static_end* - static IP range end
             * *reserved_start* - reserved IP range start
             * *reserved_end* - reserved IP range end
+            * *subnet_ranges* (``dict``) - gateway and ranges of each subnet
+              after the first, keyed by subnet, the ranges of the first
+              subnet being the ones above
         """
         self.name = name
         self.role = kwargs.get('role', self.name)
@@ -321,9 +1188,52 @@ class VLANNetworkData(object):
         self.static_end = kwargs.get('static_end', None)
         self.reserved_start = kwargs.get('reserved_start', None)
         self.reserved_end = kwargs.get('reserved_end', None)
+        self.subnet_ranges = {
+            subnet: dict(ranges)
+            for subnet, ranges in kwargs.get('subnet_ranges', {}).items()
+        }
 
         self.data = kwargs
 
+    def get_subnet_ranges(self, subnet: str):
+        """Returns the gateway and address ranges of a subnet
+
+        :param subnet: one of the subnets of the network
+        :return: dictionary of the keys in SUBNET_RANGE_KEYS, values missing
+                 for the subnet are None
+        :rtype: dict
+        """
+        if not self.subnet or _same_subnet(subnet, self.subnet[0]):
+            return {key: getattr(self, key) for key in SUBNET_RANGE_KEYS}
+        ranges = self.subnet_ranges.get(self._subnet_ranges_key(subnet), {})
+        return {key: ranges.get(key) for key in SUBNET_RANGE_KEYS}
+
+    def _subnet_ranges_key(self, subnet):
+        """Returns the key of a subnet in subnet_ranges
+
+        This is the key already holding the ranges of the subnet, or else
+        the subnet as written in ``subnet``.
+        """
+        for key in itertools.chain(self.subnet_ranges, self.subnet):
+            if _same_subnet(subnet, key):
+                return key
+        return subnet
+
+    def set_subnet_ranges(self, subnet: str, **ranges):
+        """Sets the gateway and address ranges of a subnet
+
+        :param subnet: one of the subnets of the network
+        :param ranges: values for the keys in SUBNET_RANGE_KEYS, keys not
+                       given are left unchanged
+        """
+        if not self.subnet or _same_subnet(subnet, self.subnet[0]):
+            for key, value in ranges.items():
+                setattr(self, key, value)
+        else:
+            self.subnet_ranges.setdefault(self._subnet_ranges_key(subnet),
+                                          {}).update(ranges)
+            self.touch()
+
     def dict_from_class(self):
         """Creates a writeable dict structure from the object"""
         vlan_dict = {self.role: {}}
@@ -346,6 +1256,8 @@ class VLANNetworkData(object):
         if self.reserved_start and self.reserved_end:
             vlan_dict[self.role]['reserved_start'] = self.reserved_start
             vlan_dict[self.role]['reserved_end'] = self.reserved_end
+        if self.subnet_ranges:
+            vlan_dict[self.role]['subnet_ranges'] = self.subnet_ranges
         return vlan_dict
 
     def merge_additional_data(self, config_dict: dict):
@@ -375,10 +1287,20 @@ class VLANNetworkData(object):
             self.reserved_start = config_dict['reserved_start']
         if 'reserved_end' in config_dict:
             self.reserved_end = config_dict['reserved_end']
+        if 'subnet_ranges' in config_dict:
+            self.subnet_ranges.update(config_dict['subnet_ranges'])
+            self.touch()
 
+    def _fingerprint_content(self):
+        return [self.name, self.dict_from_class()]
 
-class Network(object):
+
+class Network(Fingerprinted):
     """Model for network configurations"""
+
+    fingerprint_kind = 'network'
+    fingerprint_cached = False
+
     def __init__(self, vlan_network_data: list, **kwargs):
         """Stores data for Airship network configurations
 
@@ -406,17 +1328,24 @@ class Network(object):
         if 'bgp' in config_dict:
             self.bgp.update(config_dict['bgp'])
         if 'vlan_network_data' in config_dict:
+            entries = {entry.name: entry for entry in self.vlan_network_data}
             for key, value in config_dict['vlan_network_data'].items():
-                exists = False
-                for entry in self.vlan_network_data:
-                    if entry.name == key:
-                        exists = True
-                        entry.merge_additional_data(value)
-                if not exists:
-                    self.vlan_network_data.append(
-                        VLANNetworkData(key, **value))
+                if key in entries:
+                    entries[key].merge_additional_data(value)
+                else:
+                    entries[key] = VLANNetworkData(key, **value)
+                    self.vlan_network_data.append(entries[key])
         self.data.update(config_dict)
 
+    def _fingerprint_content(self):
+        return [
+            self.bgp,
+            {
+                vlan_data.name: self._child_fingerprint(vlan_data)
+                for vlan_data in self.vlan_network_data
+            }
+        ]
+
     def get_vlan_data_by_name(self, name: str):
         """Returns VLANNetworkData object with matching name
 
@@ -442,8 +1371,54 @@ class Network(object):
         return None
 
 
-class SiteInfo(object):
+class LazyNetwork(_LazyModel, Network):
+    """Network whose VLAN networks are built from the intermediary
+
+    The VLANNetworkData objects are created when ``vlan_network_data`` is
+    first read.
+    """
+
+    _lazy_sources = ('_vlan_data', )
+
+    def __init__(self, vlan_data: dict, **kwargs):
+        """Stores the intermediary data of the site networks
+
+        :param vlan_data: intermediary data of the VLAN networks, keyed by
+                          network name
+        :param kwargs: see ``Network``
+        """
+        self._vlan_data = vlan_data
+        self._vlan_network_data = None
+        self.bgp = kwargs.get('bgp', {})
+        self.data = kwargs
+
+    @property
+    def vlan_network_data(self):
+        if self._vlan_data is not None:
+            with _materialize_lock:
+                if self._vlan_data is not None:
+                    self._vlan_network_data = [
+                        VLANNetworkData(name, **data)
+                        for name, data in self._vlan_data.items()
+                    ]
+                    self._vlan_data = None
+        return self._vlan_network_data
+
+    @vlan_network_data.setter
+    def vlan_network_data(self, vlan_network_data):
+        self._vlan_data = None
+        self._vlan_network_data = vlan_network_data
+
+    def materialize(self):
+        self.vlan_network_data
+
+
+class SiteInfo(Fingerprinted):
     """Model for general site information"""
+
+    fingerprint_kind = 'site_info'
+    fingerprint_cached = False
+
     def __init__(self, name, **kwargs):
         """Stores general site information such as location data and site name
 
@@ -532,9 +1507,21 @@ class SiteInfo(object):
             self.ldap.update(config_dict['ldap'])
         self.data.update(config_dict)
 
+    def _fingerprint_content(self):
+        return [self.region_name, self.dict_from_class()]
+
+
+class SiteDocumentData(Fingerprinted):
+    """High level model for site data
+
+    Every model of the site data provides ``fingerprint()``, a hash of its
+    content maintained incrementally as the models change, see
+    ``spyglass.data_extractor.fingerprint``.
+    """
+
+    fingerprint_kind = 'site'
+    fingerprint_cached = False
 
-class SiteDocumentData(object):
-    """High level model for site data"""
     def __init__(
             self,
             site_info: SiteInfo,
@@ -558,9 +1545,27 @@ class SiteDocumentData(object):
         self.storage = storage
         self.network = network
         self.baremetal = baremetal
+        self._address_index = None
 
-    def dict_from_class(self):
-        """Creates a writeable dict structure from the object"""
+    @property
+    def address_index(self):
+        """Index of the subnets and host addresses of the site
+
+        The index is built on first use. It is discarded when additional
+        data is merged, but not when the models are modified directly.
+
+        :rtype: AddressIndex
+        """
+        if self._address_index is None:
+            self._address_index = AddressIndex(self)
+        return self._address_index
+
+    def dict_from_class(self, hosts: bool = True):
+        """Creates a writeable dict structure from the object
+
+        :param hosts: whether to include the racks and their hosts, otherwise
+                      baremetal is left empty
+        """
         document = {
             'baremetal': {},
             'network': self.network.dict_from_class(),
@@ -569,28 +1574,105 @@ class SiteDocumentData(object):
             'storage': self.storage
         }
         for rack in self.baremetal:
-            document['baremetal'].update(rack.dict_from_class())
+            if hosts:
+                document['baremetal'].update(rack.dict_from_class())
+            if rack.networks:
+                rack_networks = document['network'].setdefault(
+                    'rack_vlan_network_data', {})
+                rack_networks[rack.name] = {}
+                for vlan_data in rack.networks.values():
+                    rack_networks[rack.name].update(
+                        vlan_data.dict_from_class())
         return document
 
     def merge_additional_data(self, config_dict: dict):
-        if 'site_info' in config_dict:
-            self.site_info.merge_additional_data(config_dict['site_info'])
-        if 'storage' in config_dict:
-            if not self.storage:
-                self.storage = config_dict['storage']
-            else:
-                self.storage.update(config_dict['storage'])
-        if 'network' in config_dict:
-            self.network.merge_additional_data(config_dict['network'])
-        if 'baremetal' in config_dict:
-            for key, value in config_dict['baremetal']:
-                exists = False
-                for rack in self.baremetal:
-                    if key == rack.name:
-                        exists = True
-                        rack.merge_additional_data(value)
-                if not exists:
-                    self.baremetal.append(Rack(key, **value))
+        """Merges a site configuration into the site data
+
+        The configuration is validated as a whole before any data is
+        changed, and its ``baremetal`` section may use selector keys to
+        apply an override to many racks or hosts, see ``SiteConfigMerge``.
+
+        :param config_dict: the site configuration
+        :raises InvalidSiteConfiguration: if the configuration is not valid
+        """
+        merge = SiteConfigMerge(config_dict)
+        self._address_index = None
+        merge.merge_into(self, self._new_rack)
+
+    def _new_rack(self, name):
+        """Creates an empty rack, stored like the existing racks"""
+        for rack in self.baremetal:
+            if isinstance(rack, ColumnarRack):
+                return rack.host_store.add_rack(name)
+        return Rack(name, [])
+
+    def materialize_all(self):
+        """Builds every model of site data loaded lazily
+
+        Site data from ``site_document_data_factory`` builds its racks,
+        hosts and networks on first access. This builds all of them at once,
+        which validates every address of the site.
+
+        :return: the site data
+        :rtype: SiteDocumentData
+        """
+        for model in [self.network] + list(self.baremetal):
+            if isinstance(model, _LazyModel):
+                model.materialize()
+        return self
+
+    def _fingerprint_content(self):
+        return [
+            self.storage,
+            self._child_fingerprint(self.site_info),
+            self._child_fingerprint(self.network),
+            {
+                rack.name: self._child_fingerprint(rack)
+                for rack in self.baremetal
+            }
+        ]
+
+    def diff(self, other):
+        """Compares the site data with other site data
+
+        Unchanged racks, hosts and networks are skipped by comparing their
+        fingerprints, see ``spyglass.data_extractor.site_diff``.
+
+        :param other: the site data to compare to
+        :type other: SiteDocumentData
+        :return: list of changes from this site data to the other
+        :rtype: list of site_diff.Change
+        """
+        return diff_site_data(self, other)
+
+    def narrow(self, baremetal: list):
+        """Return a view of the site data limited to the given racks
+
+        The returned object shares site_info, network and storage with this
+        object, so it is cheap to create for each rack or host of a site.
+
+        :param baremetal: list of Rack objects to include
+        :return: site data containing only the given racks
+        :rtype: SiteDocumentData
+        """
+        return SiteDocumentData(
+            site_info=self.site_info,
+            network=self.network,
+            baremetal=baremetal,
+            storage=self.storage)
+
+    def get_vlan_data_for_rack(self, rack, name: str):
+        """Return the network used by the hosts of a rack
+
+        :param rack: the Rack object
+        :param name: name of the network
+        :return: the rack-level network of that name if the rack has one,
+                 the site-wide network otherwise
+        :rtype: VLANNetworkData or None
+        """
+        if name in rack.networks:
+            return rack.networks[name]
+        return self.network.get_vlan_data_by_name(name)
 
     def get_baremetal_rack_by_name(self, name: str):
         """Return baremetal rack with matching name
@@ -604,6 +1686,21 @@ class SiteDocumentData(object):
                 return rack
         return None
 
+    def count_hosts_by_type(self):
+        """Counts the baremetal hosts of each type
+
+        :return: number of hosts by host type
+        :rtype: collections.Counter
+        """
+        racks = self.baremetal
+        if racks and isinstance(racks[0], ColumnarRack) and \
+                racks[0].host_store.racks == racks:
+            return racks[0].host_store.count_hosts_by_type()
+        counts = collections.Counter()
+        for rack in self.baremetal:
+            counts.update(rack.count_hosts_by_type())
+        return counts
+
     def get_baremetal_host_by_type(self, *args):
         """Return baremetal host(s) with matching type
 
@@ -625,31 +1722,54 @@ def _validate_key_in_intermediary_dict(key: str, dictionary: dict):
         raise InvalidIntermediary(key=key)
 
 
-def site_document_data_factory(intermediary_dict: dict) -> SiteDocumentData:
+def site_document_data_factory(
+        intermediary_dict: dict, lazy: bool = True,
+        columnar: bool = False) -> SiteDocumentData:
     """Uses intermediary file data to create a SiteDocumentData object
 
-    :param intermediary_dict: A loaded intermediary file dictionary
+    The intermediary data can also be given as the path of an intermediary
+    file or directory, which is then loaded.
+
+    Racks and networks are created as ``LazyRack`` and ``LazyNetwork``
+    objects, whose hosts and VLAN networks are built from the intermediary
+    data when first read, so using only the site information of a large
+    site does not build its hosts. The intermediary data must not be changed
+    while the site data is in use.
+
+    :param intermediary_dict: A loaded intermediary file dictionary, or
+                              the path of an intermediary file or directory
+    :param lazy: whether to defer building the racks' hosts and the networks
+                 until they are used, otherwise they are built, and their
+                 addresses validated, before returning
+    :param columnar: whether to store the hosts in a ``HostStore`` rather
+                     than as Host objects, for very large sites. The store
+                     is filled before returning.
     :return: all intermediary dictionary data returned as an object
     """
+    if isinstance(intermediary_dict, str):
+        intermediary_dict = load_intermediary(intermediary_dict)
+
     # Validate baremetal in intermediary
     _validate_key_in_intermediary_dict('baremetal', intermediary_dict)
 
-    # Pull out baremetal data into Rack and Host objects
-    rack_list = []
-    for rack, hosts in intermediary_dict['baremetal'].items():
-        host_list = []
-        for host_name, host_data in hosts.items():
-            host_ip_list = IPList(**host_data['ip'])
-            host_kwargs = {
-                'rack_name': rack,
-                'host_profile': host_data['host_profile'],
-                'type': host_data['type'],
-                'ip': host_ip_list
-            }
-            new_host = Host(host_name, **host_kwargs)
-            host_list.append(new_host)
-        new_rack = Rack(rack, host_list)
-        rack_list.append(new_rack)
+    # Pull out baremetal data into racks building their Host objects on use
+    rack_networks = intermediary_dict.get('network', {}).get(
+        'rack_vlan_network_data', {})
+    if columnar:
+        host_store = HostStore()
+        rack_list = []
+        for rack, hosts in intermediary_dict['baremetal'].items():
+            networks = [
+                VLANNetworkData(network_type, **network_data) for network_type,
+                network_data in rack_networks.get(rack, {}).items()
+            ]
+            rack_list.append(host_store.add_rack(rack, networks))
+            rack_list[-1].add_intermediary_hosts(hosts)
+    else:
+        rack_list = [
+            LazyRack(rack, hosts, rack_networks.get(rack))
+            for rack, hosts in intermediary_dict['baremetal'].items()
+        ]
 
     # Validate network in intermediary
     _validate_key_in_intermediary_dict('network', intermediary_dict)
@@ -659,12 +1779,10 @@ def site_document_data_factory(intermediary_dict: dict) -> SiteDocumentData:
     # Validate bgp in intermediary
     _validate_key_in_intermediary_dict('bgp', intermediary_dict['network'])
 
-    # Pull out network data into Network object
-    vlan_data_list = []
-    for network_type, network_data in \
-            intermediary_dict['network']['vlan_network_data'].items():
-        vlan_data_list.append(VLANNetworkData(network_type, **network_data))
-    network = Network(vlan_data_list, bgp=intermediary_dict['network']['bgp'])
+    # Pull out network data into a Network object
+    network = LazyNetwork(
+        intermediary_dict['network']['vlan_network_data'],
+        bgp=intermediary_dict['network']['bgp'])
 
     # Validate site_info in intermediary
     _validate_key_in_intermediary_dict('site_info', intermediary_dict)
@@ -675,16 +1793,15 @@ def site_document_data_factory(intermediary_dict: dict) -> SiteDocumentData:
     # Validate region_name in intermediary
     _validate_key_in_intermediary_dict('region_name', intermediary_dict)
 
-    # Pull out site_info into a SiteInfo object
-    dns_server_list = ServerList(
+    # Pull out site_info into a SiteInfo object. Only ldap is updated in
+    # place by merges, so it is the only value copied.
+    site_info_dict = dict(intermediary_dict['site_info'])
+    site_info_dict['dns'] = ServerList(
         intermediary_dict['site_info']['dns']['servers'].split(','))
-    ntp_server_list = ServerList(
+    site_info_dict['ntp'] = ServerList(
         intermediary_dict['site_info']['ntp']['servers'].split(','))
-    site_info_dict = deepcopy(intermediary_dict['site_info'])
-    site_info_dict.pop('dns')
-    site_info_dict.pop('ntp')
-    site_info_dict['dns'] = dns_server_list
-    site_info_dict['ntp'] = ntp_server_list
+    if 'ldap' in site_info_dict:
+        site_info_dict['ldap'] = dict(site_info_dict['ldap'])
     site_info_dict['region_name'] = intermediary_dict['region_name']
     site_info = SiteInfo(**site_info_dict)
 
@@ -697,4 +1814,6 @@ def site_document_data_factory(intermediary_dict: dict) -> SiteDocumentData:
         network=network,
         baremetal=rack_list,
         storage=intermediary_dict['storage'])
+    if not lazy:
+        site_document_data.materialize_all()
     return site_document_data
@@ -0,0 +1,58 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fnmatch
+import logging
+import re
+
+from spyglass import exceptions
+
+LOG = logging.getLogger(__name__)
+
+
+def _pattern_regex(pattern):
+    """Returns the regular expression of a glob or /regex/ pattern"""
+    if len(pattern) > 1 and pattern.startswith('/') and pattern.endswith('/'):
+        regex = pattern[1:-1]
+    else:
+        regex = fnmatch.translate(pattern)
+    try:
+        re.compile(regex)
+    except re.error as e:
+        raise exceptions.InvalidPattern(pattern=pattern, error=e)
+    return regex
+
+
+def compile_patterns(patterns):
+    """Compiles name patterns into a single regular expression
+
+    Patterns are shell-style globs, such as ``cab2r72c1*``, or regular
+    expressions enclosed in slashes, such as ``/cab2r7[23]c\\d+/``. A name
+    matches if it fully matches any of the patterns, which is tested with a
+    single ``fullmatch`` of the compiled union however many patterns there
+    are.
+
+    :param patterns: a pattern or list of patterns
+    :return: the compiled expression, or None if there are no patterns
+    :rtype: re.Pattern or None
+    :raises InvalidPattern: if a regular expression is not valid
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    if not patterns:
+        return None
+    return re.compile(
+        '|'.join(
+            '(?:{})'.format(_pattern_regex(str(pattern)))
+            for pattern in patterns))
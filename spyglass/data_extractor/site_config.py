@@ -0,0 +1,235 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import logging
+
+from spyglass.data_extractor.selectors import compile_patterns
+from spyglass import exceptions
+
+LOG = logging.getLogger(__name__)
+
+# Host attributes selector keys can match, by key prefix
+HOST_SELECTOR_FIELDS = {
+    'name': 'name',
+    'type': 'type',
+    'profile': 'host_profile',
+}
+
+# Compiled selector key matching hosts whose field matches a pattern
+Selector = collections.namedtuple('Selector', ['key', 'field', 'matcher'])
+
+
+def is_pattern(key):
+    """Returns True if a key is a glob or /regex/ pattern, not a name"""
+    key = str(key)
+    if len(key) > 1 and key.startswith('/') and key.endswith('/'):
+        return True
+    return any(char in key for char in '*?[')
+
+
+def _host_selector(key):
+    """Returns the Selector of a host key, or None for a host name"""
+    field, sep, pattern = str(key).partition(':')
+    if sep and field in HOST_SELECTOR_FIELDS:
+        return Selector(
+            key, HOST_SELECTOR_FIELDS[field], compile_patterns(pattern))
+    if is_pattern(key):
+        return Selector(key, 'name', compile_patterns(key))
+    return None
+
+
+class _RackOverride(object):
+    """Host overrides of a rack entry, split into selectors and host names"""
+    def __init__(self, key, hosts):
+        self.key = key
+        self.selectors = []
+        self.hosts = {}
+        for host_key, value in hosts.items():
+            selector = _host_selector(host_key)
+            if selector is None:
+                self.hosts[host_key] = value
+            else:
+                self.selectors.append((selector, value))
+
+    def overrides(self, host):
+        """Yields the overrides of a host, selectors first"""
+        for selector, value in self.selectors:
+            if selector.matcher.fullmatch(str(getattr(host, selector.field,
+                                                      ''))):
+                yield value
+        if host.name in self.hosts:
+            yield self.hosts[host.name]
+
+
+def _check_mapping(errors, value, path):
+    if not isinstance(value, dict):
+        errors.append(
+            '{} must be a mapping, not {}'.format(path,
+                                                  type(value).__name__))
+        return False
+    return True
+
+
+def _check_list(errors, value, path):
+    if not isinstance(value, list):
+        errors.append(
+            '{} must be a list, not {}'.format(path,
+                                               type(value).__name__))
+
+
+class SiteConfigMerge(object):
+    """Validated and indexed site configuration to merge into site data
+
+    The whole configuration is validated when the merge is created, so a
+    configuration with errors is rejected before any site data is changed.
+    It is then merged in a single pass over the racks and hosts, using name
+    indexes built once instead of scanning the hosts for every key.
+
+    Besides rack and host names, the ``baremetal`` section accepts selector
+    keys applying an override to many hosts:
+
+    * rack keys that are glob patterns, such as ``rack7*``, or regular
+      expressions in slashes, such as ``/rack7[23]/``, select racks by name
+    * host keys that are patterns select hosts by name, and keys prefixed
+      with ``type:``, ``profile:`` or ``name:`` select hosts by type, host
+      profile or name, e.g. ``type:controller`` or ``profile:cp-*``
+
+    Overrides are applied from the least to the most specific, the entries
+    of matching rack patterns before the entry of the rack's name, and
+    within an entry the selector keys, in order, before the host's name.
+    Only rack and host names create racks and hosts.
+    """
+    def __init__(self, config_dict):
+        """Validates and compiles a site configuration
+
+        :param config_dict: the site configuration
+        :type config_dict: dict
+        :raises InvalidSiteConfiguration: listing every error found
+        """
+        self.config = config_dict
+        self.rack_patterns = []
+        self.racks = {}
+        errors = self._validate()
+        if errors:
+            raise exceptions.InvalidSiteConfiguration(
+                count=len(errors), errors='\n'.join(errors))
+
+    def _validate(self):
+        errors = []
+        if not _check_mapping(errors, self.config, 'site configuration'):
+            return errors
+        for section in ('site_info', 'network', 'storage', 'baremetal'):
+            if section in self.config:
+                _check_mapping(errors, self.config[section], section)
+        if errors:
+            return errors
+        site_info = self.config.get('site_info', {})
+        for key in ('dns', 'ntp'):
+            if key in site_info and _check_mapping(
+                    errors, site_info[key], 'site_info.' + key) and \
+                    'servers' not in site_info[key]:
+                errors.append('site_info.{}.servers is missing'.format(key))
+        if 'ldap' in site_info:
+            _check_mapping(errors, site_info['ldap'], 'site_info.ldap')
+        network = self.config.get('network', {})
+        if 'bgp' in network:
+            _check_mapping(errors, network['bgp'], 'network.bgp')
+        if 'vlan_network_data' in network and _check_mapping(
+                errors, network['vlan_network_data'],
+                'network.vlan_network_data'):
+            for name, vlan_data in network['vlan_network_data'].items():
+                path = 'network.vlan_network_data.{}'.format(name)
+                if not _check_mapping(errors, vlan_data, path):
+                    continue
+                for key in ('subnet', 'routes'):
+                    if key in vlan_data:
+                        _check_list(
+                            errors, vlan_data[key], '{}.{}'.format(path, key))
+        for rack_key, hosts in self.config.get('baremetal', {}).items():
+            path = 'baremetal.{}'.format(rack_key)
+            if not _check_mapping(errors, hosts, path):
+                continue
+            for host_key, host_data in hosts.items():
+                host_path = '{}.{}'.format(path, host_key)
+                if _check_mapping(errors, host_data, host_path) and \
+                        'ip' in host_data:
+                    _check_mapping(errors, host_data['ip'], host_path + '.ip')
+            try:
+                override = _RackOverride(rack_key, hosts)
+                if is_pattern(rack_key):
+                    self.rack_patterns.append(
+                        (compile_patterns(rack_key), override))
+                else:
+                    self.racks[rack_key] = override
+            except exceptions.InvalidPattern as e:
+                errors.append('{}: {}'.format(path, e.message))
+        return errors
+
+    def merge_into(self, site_data, rack_factory):
+        """Merges the configuration into site data
+
+        :param site_data: the site data to update
+        :type site_data: models.SiteDocumentData
+        :param rack_factory: callable creating an empty rack of a name, for
+                             the rack names not yet in the site data
+        """
+        if 'site_info' in self.config:
+            site_data.site_info.merge_additional_data(self.config['site_info'])
+        if 'storage' in self.config:
+            if not site_data.storage:
+                site_data.storage = self.config['storage']
+            else:
+                site_data.storage.update(self.config['storage'])
+        if 'network' in self.config:
+            site_data.network.merge_additional_data(self.config['network'])
+        if 'baremetal' in self.config:
+            self._merge_baremetal(site_data, rack_factory)
+
+    def _merge_baremetal(self, site_data, rack_factory):
+        existing = {rack.name for rack in site_data.baremetal}
+        for name in self.racks:
+            if name not in existing:
+                site_data.baremetal.append(rack_factory(name))
+        matched = collections.Counter()
+        for rack in site_data.baremetal:
+            entries = [
+                override for matcher, override in self.rack_patterns
+                if matcher.fullmatch(rack.name)
+            ]
+            if rack.name in self.racks:
+                entries.append(self.racks[rack.name])
+            if not entries:
+                continue
+            names = set()
+            for host in rack.hosts:
+                names.add(host.name)
+                for entry in entries:
+                    for value in entry.overrides(host):
+                        host.merge_additional_data(value)
+                        matched[entry.key] += 1
+            if rack.name in self.racks:
+                new_hosts = {
+                    name: value
+                    for name, value in self.racks[rack.name].hosts.items()
+                    if name not in names
+                }
+                if new_hosts:
+                    rack.merge_additional_data(new_hosts)
+        for matcher, override in self.rack_patterns:
+            if not matched[override.key]:
+                LOG.warning(
+                    "Site configuration baremetal.{} matches no "
+                    "host".format(override.key))
+        LOG.debug("Merged {} host overrides".format(sum(matched.values())))
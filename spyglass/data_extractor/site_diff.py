@@ -0,0 +1,186 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import logging
+
+LOG = logging.getLogger(__name__)
+
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+# A difference between two site data models. The path locates the changed
+# value, e.g. ('host', 'rack72', 'cab2r72c12', 'ip', 'oob'); old and new
+# are None for added and removed objects.
+Change = collections.namedtuple('Change', ['change', 'path', 'old', 'new'])
+
+# Host fields compared besides the addresses
+HOST_FIELDS = ('host_profile', 'type')
+
+
+def _diff_dicts(changes, path, old, new):
+    """Adds the changes between two flat dictionaries of values"""
+    old = old or {}
+    new = new or {}
+    for key in sorted(set(old) | set(new), key=str):
+        if key not in new:
+            changes.append(Change(REMOVED, path + (key, ), old[key], None))
+        elif key not in old:
+            changes.append(Change(ADDED, path + (key, ), None, new[key]))
+        elif old[key] != new[key]:
+            changes.append(
+                Change(MODIFIED, path + (key, ), old[key], new[key]))
+
+
+def _vlan_fields(vlan_data):
+    """Returns the fields of a VLAN network as written to the intermediary"""
+    fields = dict(vlan_data.dict_from_class()[vlan_data.role])
+    fields['role'] = vlan_data.role
+    return fields
+
+
+def _diff_named(changes, path, old, new, diff_item):
+    """Compares two collections of fingerprinted objects keyed by name
+
+    Objects with equal fingerprints are skipped without comparing them.
+    """
+    for name in sorted(set(old) | set(new), key=str):
+        if name not in new:
+            changes.append(Change(REMOVED, path + (name, ), None, None))
+        elif name not in old:
+            changes.append(Change(ADDED, path + (name, ), None, None))
+        elif old[name].fingerprint() != new[name].fingerprint():
+            diff_item(changes, path + (name, ), old[name], new[name])
+
+
+def _diff_vlan(changes, path, old, new):
+    _diff_dicts(changes, path, _vlan_fields(old), _vlan_fields(new))
+
+
+def _diff_host(changes, path, old, new):
+    old_fields = {field: getattr(old, field) for field in HOST_FIELDS}
+    new_fields = {field: getattr(new, field) for field in HOST_FIELDS}
+    _diff_dicts(changes, path, old_fields, new_fields)
+    if old.ip.fingerprint() != new.ip.fingerprint():
+        _diff_dicts(changes, path + ('ip', ), dict(old.ip), dict(new.ip))
+
+
+def _by_name(items):
+    return {item.name: item for item in items}
+
+
+def _diff_rack(changes, path, old, new):
+    rack_name = path[-1]
+    _diff_named(
+        changes, ('host', rack_name), _by_name(old.hosts), _by_name(new.hosts),
+        _diff_host)
+    _diff_named(
+        changes, ('rack_network', rack_name), old.networks, new.networks,
+        _diff_vlan)
+
+
+def diff_site_data(old, new):
+    """Compares two site data models
+
+    Racks, hosts and networks whose fingerprints are equal are skipped, so
+    the comparison takes time proportional to the size of the changes once
+    the fingerprints are computed. Hosts are compared within their racks, a
+    host moved to another rack is reported as removed and added.
+
+    Changes are reported with paths starting with the section of the site
+    data they belong to:
+
+    * ``('site_info', key)`` and ``('storage', )``
+    * ``('bgp', key)`` and ``('network', name[, field])``
+    * ``('rack', rack)`` for added and removed racks
+    * ``('host', rack, host[, field])`` and
+      ``('host', rack, host, 'ip', role)``
+    * ``('rack_network', rack, name[, field])``
+
+    :param old: the site data to compare from
+    :type old: models.SiteDocumentData
+    :param new: the site data to compare to
+    :type new: models.SiteDocumentData
+    :return: list of Change tuples in path order
+    :rtype: list
+    """
+    changes = []
+    if old.fingerprint() == new.fingerprint():
+        return changes
+    if old.site_info.fingerprint() != new.site_info.fingerprint():
+        _diff_dicts(
+            changes, ('site_info', ), old.site_info.dict_from_class(),
+            new.site_info.dict_from_class())
+        if old.site_info.region_name != new.site_info.region_name:
+            changes.append(
+                Change(
+                    MODIFIED, ('site_info', 'region_name'),
+                    old.site_info.region_name, new.site_info.region_name))
+    if old.storage != new.storage:
+        changes.append(
+            Change(MODIFIED, ('storage', ), old.storage, new.storage))
+    if old.network.fingerprint() != new.network.fingerprint():
+        _diff_dicts(changes, ('bgp', ), old.network.bgp, new.network.bgp)
+        _diff_named(
+            changes, ('network', ), _by_name(old.network.vlan_network_data),
+            _by_name(new.network.vlan_network_data), _diff_vlan)
+    _diff_named(
+        changes, ('rack', ), _by_name(old.baremetal), _by_name(new.baremetal),
+        _diff_rack)
+    LOG.debug("Found {} changes".format(len(changes)))
+    return sorted(changes, key=lambda change: tuple(map(str, change.path)))
+
+
+def format_change(change):
+    """Formats a change as a line of text
+
+    :param change: the Change
+    :return: e.g. ``modified host rack72/cab2r72c12 ip.oob: a -> b``
+    :rtype: str
+    """
+    section, path = change.path[0], change.path[1:]
+    if section == 'host':
+        host = '/'.join(map(str, path[:2]))
+        location = '{} {}'.format(host, '.'.join(map(str, path[2:])))
+    else:
+        location = '.'.join(map(str, path))
+    line = '{} {} {}'.format(change.change, section, location).strip()
+    if change.change == MODIFIED:
+        line += ': {} -> {}'.format(change.old, change.new)
+    elif change.old is not None or change.new is not None:
+        line += ': {}'.format(
+            change.new if change.change == ADDED else change.old)
+    return line
+
+
+def changes_as_dict(changes):
+    """Returns changes in a JSON serializable form
+
+    :param changes: list of Change tuples
+    :return: dictionary with the list of changes and their count by kind
+    :rtype: dict
+    """
+    return {
+        'changes': [
+            {
+                'change': change.change,
+                'path': list(change.path),
+                'old': change.old,
+                'new': change.new
+            } for change in changes
+        ],
+        'summary': dict(
+            collections.Counter(change.change for change in changes)),
+    }
@@ -0,0 +1,522 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""SQLite storage of site data
+
+A site store is a SQLite database holding the site data in the tables below,
+so hosts can be streamed from disk and queried with SQL instead of loading
+the whole intermediary:
+
+* ``site``: ``key``, ``value`` JSON of ``site_info``, ``region_name``,
+  ``storage`` and ``bgp``
+* ``racks``: ``id``, ``name``
+* ``hosts``: ``id``, ``rack_id``, ``name``, ``type``, ``host_profile``
+* ``ips``: ``host_id``, ``role``, ``address`` as written, and for addresses
+  the IP ``version`` and ``packed`` big-endian bytes, which sort in address
+  order within a version
+* ``vlans``: ``rack_id``, NULL for site-wide networks, ``name``, ``role``
+  and ``data`` JSON of the network's intermediary fields
+
+Hosts are indexed by name, type and rack, and addresses by version and
+packed value.
+"""
+
+import collections
+from collections import abc
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from spyglass.data_extractor.models import Host
+from spyglass.data_extractor.models import IP_ROLES
+from spyglass.data_extractor.models import IPList
+from spyglass.data_extractor.models import pack_ip
+from spyglass.data_extractor.models import Rack
+from spyglass.data_extractor.models import site_document_data_factory
+from spyglass.data_extractor.models import VLANNetworkData
+
+LOG = logging.getLogger(__name__)
+
+# Version of the table layout, stored in the site table
+STORE_VERSION = 1
+
+# First bytes of every SQLite database file
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS site (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS racks (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS hosts (
+    id INTEGER PRIMARY KEY,
+    rack_id INTEGER NOT NULL REFERENCES racks (id),
+    name TEXT NOT NULL,
+    type TEXT,
+    host_profile TEXT);
+CREATE TABLE IF NOT EXISTS ips (
+    host_id INTEGER NOT NULL REFERENCES hosts (id),
+    role TEXT NOT NULL,
+    address TEXT,
+    version INTEGER,
+    packed BLOB,
+    PRIMARY KEY (host_id, role)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS vlans (
+    id INTEGER PRIMARY KEY,
+    rack_id INTEGER REFERENCES racks (id),
+    name TEXT NOT NULL,
+    role TEXT,
+    data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS hosts_name ON hosts (name);
+CREATE INDEX IF NOT EXISTS hosts_type ON hosts (type);
+CREATE INDEX IF NOT EXISTS hosts_rack ON hosts (rack_id, id);
+CREATE INDEX IF NOT EXISTS ips_address ON ips (version, packed);
+CREATE INDEX IF NOT EXISTS vlans_rack ON vlans (rack_id, name);
+'''
+
+# Statements reading the hosts of a rack, one row per address, by field
+# filtered on and sort order. The 'ip' order sorts hosts by their address of
+# the role given as first parameter, hosts without one last.
+_HOST_QUERIES = {
+    (None, 'id'): (
+        'SELECT hosts.id, hosts.name, hosts.type, hosts.host_profile, '
+        'ips.role, ips.address FROM hosts '
+        'LEFT JOIN ips ON ips.host_id = hosts.id '
+        'WHERE hosts.rack_id = ? '
+        'ORDER BY hosts.id, ips.role'),
+    ('name', 'id'): (
+        'SELECT hosts.id, hosts.name, hosts.type, hosts.host_profile, '
+        'ips.role, ips.address FROM hosts '
+        'LEFT JOIN ips ON ips.host_id = hosts.id '
+        'WHERE hosts.rack_id = ? AND hosts.name = ? '
+        'ORDER BY hosts.id, ips.role'),
+    ('type', 'id'): (
+        'SELECT hosts.id, hosts.name, hosts.type, hosts.host_profile, '
+        'ips.role, ips.address FROM hosts '
+        'LEFT JOIN ips ON ips.host_id = hosts.id '
+        'WHERE hosts.rack_id = ? AND hosts.type = ? '
+        'ORDER BY hosts.id, ips.role'),
+    (None, 'name'): (
+        'SELECT hosts.id, hosts.name, hosts.type, hosts.host_profile, '
+        'ips.role, ips.address FROM hosts '
+        'LEFT JOIN ips ON ips.host_id = hosts.id '
+        'WHERE hosts.rack_id = ? '
+        'ORDER BY hosts.name, hosts.id, ips.role'),
+    (None, 'type'): (
+        'SELECT hosts.id, hosts.name, hosts.type, hosts.host_profile, '
+        'ips.role, ips.address FROM hosts '
+        'LEFT JOIN ips ON ips.host_id = hosts.id '
+        'WHERE hosts.rack_id = ? '
+        'ORDER BY hosts.type, hosts.id, ips.role'),
+    (None, 'host_profile'): (
+        'SELECT hosts.id, hosts.name, hosts.type, hosts.host_profile, '
+        'ips.role, ips.address FROM hosts '
+        'LEFT JOIN ips ON ips.host_id = hosts.id '
+        'WHERE hosts.rack_id = ? '
+        'ORDER BY hosts.host_profile, hosts.id, ips.role'),
+    (None, 'ip'): (
+        'SELECT hosts.id, hosts.name, hosts.type, hosts.host_profile, '
+        'ips.role, ips.address FROM hosts '
+        'LEFT JOIN ips ON ips.host_id = hosts.id '
+        'LEFT JOIN ips AS sort_ip ON sort_ip.host_id = hosts.id '
+        'AND sort_ip.role = ? '
+        'WHERE hosts.rack_id = ? '
+        'ORDER BY sort_ip.version IS NULL, sort_ip.version, '
+        'sort_ip.packed, hosts.id, ips.role'),
+}
+
+# Statements counting the hosts of a rack, by field filtered on
+_HOST_COUNTS = {
+    None: 'SELECT COUNT(*) FROM hosts WHERE rack_id = ?',
+    'name': 'SELECT COUNT(*) FROM hosts WHERE rack_id = ? AND name = ?',
+    'type': 'SELECT COUNT(*) FROM hosts WHERE rack_id = ? AND type = ?',
+}
+
+# Statements emptying the tables, children first
+_CLEAR_TABLES = (
+    'DELETE FROM ips',
+    'DELETE FROM hosts',
+    'DELETE FROM vlans',
+    'DELETE FROM racks',
+    'DELETE FROM site',
+)
+
+# A host address found in a store: names of the rack and host, and the role
+StoredAddress = collections.namedtuple(
+    'StoredAddress', ['rack', 'host', 'role'])
+
+
+def is_site_store(path):
+    """Returns True if a file is a SQLite database
+
+    :param path: path of the file
+    :rtype: bool
+    """
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+
+def _pack_address(address):
+    """Returns the (version, packed bytes) of an address, or (None, None)"""
+    packed = pack_ip(address)
+    if packed is None:
+        return None, None
+    version, value = packed
+    return version, value.to_bytes(4 if version == 4 else 16, 'big')
+
+
+def _vlan_row(rack_id, vlan_data):
+    fields = dict(vlan_data.dict_from_class()[vlan_data.role])
+    fields['role'] = vlan_data.role
+    return rack_id, vlan_data.name, vlan_data.role, json.dumps(fields)
+
+
+class _StoredHosts(abc.Sequence):
+    """Hosts of a StoredRack, read from the store when iterated over"""
+    def __init__(self, rack, field=None, value=None, order='id'):
+        """Selects the hosts of a rack
+
+        :param rack: the StoredRack
+        :param field: ``name`` or ``type`` to only read the hosts with that
+                      value, all hosts if not given
+        :param value: value of the field
+        :param order: field to sort by, ``id``, ``name``, ``type`` or
+                      ``host_profile``, or a role of ``IP_ROLES`` to sort by
+                      address
+        """
+        self._rack = rack
+        self._field = field
+        self._parameters = () if field is None else (value, )
+        self._order = order
+
+    def __iter__(self):
+        if self._order in IP_ROLES:
+            sql = _HOST_QUERIES[self._field, 'ip']
+            parameters = (self._order, self._rack.rack_id)
+        else:
+            sql = _HOST_QUERIES[self._field, self._order]
+            parameters = (self._rack.rack_id, )
+        cursor = self._rack.site_store.execute(
+            sql, parameters + self._parameters)
+        for _, rows in itertools.groupby(cursor, key=lambda row: row[0]):
+            rows = list(rows)
+            _, name, host_type, host_profile = rows[0][:4]
+            ip = {
+                role: address
+                for role, address in (row[4:] for row in rows)
+                if role is not None
+            }
+            yield Host(
+                name,
+                rack_name=self._rack.name,
+                type=host_type,
+                host_profile=host_profile,
+                ip=IPList(**ip))
+
+    def __len__(self):
+        return self._rack.site_store.execute(
+            _HOST_COUNTS[self._field],
+            (self._rack.rack_id, ) + self._parameters).fetchone()[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        for host in itertools.islice(self, index, None):
+            return host
+        raise IndexError('host index out of range')
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class StoredRack(Rack):
+    """Rack whose hosts are read from a SiteStore
+
+    Iterating over ``hosts`` streams the hosts from the database, building a
+    Host object for each one, so only the hosts in use are held in memory.
+    The hosts are a snapshot: changing them does not change the store.
+    """
+
+    fingerprint_cached = False
+
+    def __init__(
+            self, name: str, site_store, rack_id: int, networks: list = None):
+        """Creates a rack reading its hosts from a store
+
+        :param name: Rack name
+        :param site_store: the SiteStore holding the rack
+        :param rack_id: id of the rack in the store
+        :param networks: list of VLANNetworkData objects of the rack
+        """
+        self.site_store = site_store
+        self.rack_id = rack_id
+        self.name = name
+        self.networks = {}
+        for vlan_data in networks or []:
+            self.networks[vlan_data.name] = vlan_data
+
+    @property
+    def hosts(self):
+        return _StoredHosts(self)
+
+    def _fingerprint_children(self):
+        return list(self.networks.values())
+
+    def _fingerprint_content(self):
+        return [
+            self.name, {host.name: host.fingerprint()
+                        for host in self.hosts},
+            {
+                name: self._child_fingerprint(vlan_data)
+                for name, vlan_data in self.networks.items()
+            }
+        ]
+
+    def get_host_by_name(self, name: str):
+        for host in _StoredHosts(self, 'name', name):
+            return host
+        return None
+
+    def get_host_by_type(self, host_type: str):
+        return list(_StoredHosts(self, 'type', host_type))
+
+    def count_hosts_by_type(self):
+        return collections.Counter(
+            dict(
+                self.site_store.execute(
+                    'SELECT type, COUNT(*) FROM hosts WHERE rack_id = ? '
+                    'GROUP BY type', (self.rack_id, ))))
+
+    def sorted_hosts(self, field: str = 'name'):
+        return list(_StoredHosts(self, order=field))
+
+
+class SiteStore(object):
+    """Site data persisted in a SQLite database
+
+    The database is opened once per thread, so racks of the store can be
+    read from the threads rendering templates. The store closes the
+    connections of all threads when closed or used as a context manager.
+    """
+    def __init__(self, path):
+        """Opens a site store, creating the database if it does not exist
+
+        :param path: path of the database file
+        """
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        with self.connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connection(self):
+        """Returns the database connection of the calling thread
+
+        :rtype: sqlite3.Connection
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Connections are only used by the thread opening them, but
+            # are closed by the thread closing the store
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self):
+        """Closes the database connections of all threads
+
+        The store opens new connections if it is used again.
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for connection in connections:
+            connection.close()
+
+    def execute(self, sql, parameters=()):
+        """Runs a SQL statement, for example an ad-hoc query
+
+        :param sql: the statement, see the module documentation for tables
+        :param parameters: values of the statement's placeholders
+        :return: cursor iterating over the resulting rows
+        :rtype: sqlite3.Cursor
+        """
+        return self.connection().execute(sql, parameters)
+
+    def save(self, site_data):
+        """Replaces the content of the store with site data
+
+        Hosts are written as they are iterated over, one rack at a time.
+
+        :param site_data: the site data to store
+        :type site_data: models.SiteDocumentData
+        """
+        site_values = {
+            'version': STORE_VERSION,
+            'site_info': site_data.site_info.dict_from_class(),
+            'region_name': site_data.site_info.region_name,
+            'storage': site_data.storage,
+            'bgp': site_data.network.bgp,
+        }
+        host_id = 0
+        with self.connection() as connection:
+            for sql in _CLEAR_TABLES:
+                connection.execute(sql)
+            connection.executemany(
+                'INSERT INTO site VALUES (?, ?)', (
+                    (key, json.dumps(value, default=str))
+                    for key, value in site_values.items()))
+            connection.executemany(
+                'INSERT INTO vlans (rack_id, name, role, data) '
+                'VALUES (?, ?, ?, ?)', (
+                    _vlan_row(None, vlan_data)
+                    for vlan_data in site_data.network.vlan_network_data))
+            for rack_id, rack in enumerate(site_data.baremetal, 1):
+                connection.execute(
+                    'INSERT INTO racks VALUES (?, ?)', (rack_id, rack.name))
+                connection.executemany(
+                    'INSERT INTO vlans (rack_id, name, role, data) '
+                    'VALUES (?, ?, ?, ?)', (
+                        _vlan_row(rack_id, vlan_data)
+                        for vlan_data in rack.networks.values()))
+                ips = []
+                for host in rack.hosts:
+                    host_id += 1
+                    connection.execute(
+                        'INSERT INTO hosts VALUES (?, ?, ?, ?, ?)', (
+                            host_id, rack_id, host.name, host.type,
+                            host.host_profile))
+                    for role, address in host.ip:
+                        ips.append(
+                            (host_id, role, address) + _pack_address(address))
+                connection.executemany(
+                    'INSERT INTO ips VALUES (?, ?, ?, ?, ?)', ips)
+        LOG.info(
+            "Stored {} racks and {} hosts in {}".format(
+                len(site_data.baremetal), host_id, self.path))
+
+    def _site_value(self, key):
+        row = self.execute('SELECT value FROM site WHERE key = ?',
+                           (key, )).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _vlan_data(self, rack_id):
+        if rack_id is None:
+            rows = self.execute(
+                'SELECT name, data FROM vlans WHERE rack_id IS NULL '
+                'ORDER BY id')
+        else:
+            rows = self.execute(
+                'SELECT name, data FROM vlans WHERE rack_id = ? ORDER BY id',
+                (rack_id, ))
+        return {name: json.loads(data) for name, data in rows}
+
+    def site_data(self):
+        """Returns the stored site data, reading hosts from the store
+
+        Site information and networks are loaded, racks are ``StoredRack``
+        objects streaming their hosts from the database.
+
+        :rtype: models.SiteDocumentData
+        """
+        site_data = site_document_data_factory(
+            {
+                'baremetal': {},
+                'network': {
+                    'bgp': self._site_value('bgp'),
+                    'vlan_network_data': self._vlan_data(None),
+                },
+                'region_name': self._site_value('region_name'),
+                'site_info': self._site_value('site_info'),
+                'storage': self._site_value('storage'),
+            })
+        for rack_id, name in self.execute(
+                'SELECT id, name FROM racks ORDER BY id').fetchall():
+            networks = [
+                VLANNetworkData(vlan_name, **fields)
+                for vlan_name, fields in self._vlan_data(rack_id).items()
+            ]
+            site_data.baremetal.append(
+                StoredRack(name, self, rack_id, networks))
+        return site_data
+
+    def count_hosts_by_type(self):
+        """Counts the stored hosts of each type
+
+        :return: number of hosts by host type
+        :rtype: collections.Counter
+        """
+        return collections.Counter(
+            dict(
+                self.execute(
+                    'SELECT type, COUNT(*) FROM hosts GROUP BY type')))
+
+    def host_for(self, address):
+        """Finds the hosts an address is assigned to
+
+        :param address: the address as a string
+        :return: list of StoredAddress tuples
+        :rtype: list
+        """
+        version, packed = _pack_address(address)
+        if version is None:
+            return []
+        return [
+            StoredAddress(*row) for row in self.execute(
+                'SELECT racks.name, hosts.name, ips.role FROM ips '
+                'JOIN hosts ON hosts.id = ips.host_id '
+                'JOIN racks ON racks.id = hosts.rack_id '
+                'WHERE ips.version = ? AND ips.packed = ? '
+                'ORDER BY hosts.id, ips.role', (version, packed))
+        ]
+
+    def duplicate_addresses(self):
+        """Finds the addresses assigned to more than one host or role
+
+        :return: dictionary of each address to the StoredAddress tuples
+                 it is assigned to
+        :rtype: dict
+        """
+        duplicates = collections.OrderedDict()
+        rows = self.execute(
+            'SELECT ips.address, racks.name, hosts.name, ips.role FROM ips '
+            'JOIN (SELECT version, packed FROM ips '
+            'WHERE version IS NOT NULL GROUP BY version, packed '
+            'HAVING COUNT(*) > 1) AS dup '
+            'ON ips.version = dup.version AND ips.packed = dup.packed '
+            'JOIN hosts ON hosts.id = ips.host_id '
+            'JOIN racks ON racks.id = hosts.rack_id '
+            'ORDER BY ips.version, ips.packed, hosts.id, ips.role')
+        for address, rack, host, role in rows:
+            duplicates.setdefault(address,
+                                  []).append(StoredAddress(rack, host, role))
+        return duplicates
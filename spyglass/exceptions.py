@@ -62,6 +62,63 @@ class InvalidIntermediary(SpyglassBaseException):
     message = '%(key) is not defined in the given intermediary file.'
 
 
+class IPPoolExhausted(SpyglassBaseException):
+    """Exception that occurs when a network has no free host addresses left
+
+    :keyword network: name of the network
+    :keyword first: first address of the network's host address pool
+    :keyword last: last address of the network's host address pool
+    """
+    message = (
+        'No free host addresses left in network {network} '
+        '(pool {first} - {last}).')
+
+
+class AddressConflict(SpyglassBaseException):
+    """Exception that occurs when site data assigns conflicting addresses
+
+    :keyword count: number of conflicts found
+    :keyword conflicts: description of each conflict, one per line
+    """
+    message = 'Found {count} address conflicts:\n{conflicts}'
+
+
+class InvalidSiteConfiguration(SpyglassBaseException):
+    """Exception that occurs when a site configuration cannot be merged
+
+    :keyword count: number of errors found
+    :keyword errors: description of each error, one per line
+    """
+    message = 'Found {count} errors in the site configuration:\n{errors}'
+
+
+class UnknownDesignRule(SpyglassBaseException):
+    """Exception that occurs when rules.yaml lists a rule that does not exist
+
+    :keyword rule_name: name of the rule
+    """
+    message = (
+        'Design rule {rule_name} is neither built in nor registered under '
+        'the spyglass_design_rules entry point.')
+
+
+class DesignRuleCycle(SpyglassBaseException):
+    """Exception that occurs when design rules depend on each other
+
+    :keyword rules: names of the rules that cannot be ordered
+    """
+    message = 'Design rules {rules} read fields written by each other.'
+
+
+class InvalidPattern(SpyglassBaseException):
+    """Exception that occurs when a name pattern cannot be compiled
+
+    :keyword pattern: the pattern
+    :keyword error: the error compiling the pattern
+    """
+    message = 'Invalid name pattern {pattern}: {error}'
+
+
 # Validator exceptions
 
 
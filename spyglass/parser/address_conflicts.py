@@ -0,0 +1,180 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import collections
+import heapq
+import ipaddress
+import logging
+
+from spyglass.data_extractor.models import IP_ROLES
+from spyglass.data_extractor.models import pack_ip
+
+LOG = logging.getLogger(__name__)
+
+# Address ranges of a subnet, as (label, start key, end key)
+RANGES = (
+    ('reserved', 'reserved_start', 'reserved_end'),
+    ('static', 'static_start', 'static_end'),
+    ('dhcp', 'dhcp_start', 'dhcp_end'),
+)
+
+# An inclusive range of addresses, start and end being packed addresses
+Interval = collections.namedtuple(
+    'Interval', ['start', 'end', 'network', 'label'])
+
+
+def _subnet_interval(network_name, subnet):
+    """Returns the Interval covered by a subnet string, or None"""
+    try:
+        net = ipaddress.ip_network(subnet, strict=False)
+    except (TypeError, ValueError):
+        return None
+    return Interval(
+        (net.version, int(net.network_address)),
+        (net.version, int(net.broadcast_address)), network_name,
+        'subnet {}'.format(subnet))
+
+
+def _range_intervals(network_name, vlan_data):
+    """Yields the Interval of each address range of a VLAN network"""
+    for subnet in vlan_data.subnet or [None]:
+        ranges = vlan_data.get_subnet_ranges(subnet)
+        for label, start_key, end_key in RANGES:
+            start = pack_ip(ranges[start_key])
+            end = pack_ip(ranges[end_key])
+            if start is None or end is None or start[0] != end[0]:
+                continue
+            yield Interval(
+                start, end, network_name, '{} range {} - {}'.format(
+                    label, ranges[start_key], ranges[end_key]))
+
+
+def overlapping_intervals(intervals):
+    """Finds every pair of overlapping intervals
+
+    The intervals are swept in order of their start, keeping a heap of the
+    intervals still open, so the search takes O(n log n + k) time for k
+    overlapping pairs.
+
+    :param intervals: iterable of Interval objects
+    :return: list of (earlier, later) Interval pairs
+    :rtype: list
+    """
+    pairs = []
+    open_intervals = []
+    for index, interval in enumerate(sorted(intervals)):
+        while open_intervals and open_intervals[0][0] < interval.start:
+            heapq.heappop(open_intervals)
+        for _, _, other in open_intervals:
+            pairs.append((other, interval))
+        heapq.heappush(open_intervals, (interval.end, index, interval))
+    return pairs
+
+
+class _SubnetIndex(object):
+    """Sorted index of the subnets of a network for containment queries"""
+    def __init__(self, intervals):
+        intervals = sorted(intervals)
+        self.starts = [interval.start for interval in intervals]
+        # Largest end of the subnets starting at or before each position, so
+        # nested or overlapping subnets are handled
+        self.max_ends = []
+        for interval in intervals:
+            self.max_ends.append(
+                max(interval.end, self.max_ends[-1]) if self.
+                max_ends else interval.end)
+
+    def __contains__(self, address):
+        index = bisect.bisect_right(self.starts, address) - 1
+        return index >= 0 and self.max_ends[index] >= address
+
+
+def find_address_conflicts(site_data):
+    """Finds conflicting addresses, subnets and ranges in site data
+
+    The following conflicts are reported:
+
+    * an address assigned to more than one host or role
+    * a host address outside of the subnets of the network of its role,
+      the rack-level network if its rack has one
+    * subnets of the VLAN networks overlapping each other
+    * reserved, static and DHCP ranges overlapping each other
+
+    :param site_data: the site data to check
+    :type site_data: models.SiteDocumentData
+    :return: description of each conflict
+    :rtype: list
+    """
+    conflicts = []
+
+    # Site-wide networks, then the rack-level networks of each rack
+    networks = [
+        (None, vlan_data.name, vlan_data)
+        for vlan_data in site_data.network.vlan_network_data
+    ]
+    for rack in site_data.baremetal:
+        for vlan_data in rack.networks.values():
+            networks.append(
+                (
+                    rack.name,
+                    '{} of rack {}'.format(vlan_data.name,
+                                           rack.name), vlan_data))
+
+    subnets = []
+    ranges = []
+    subnet_index = {}
+    for rack_name, network_name, vlan_data in networks:
+        network_subnets = [
+            interval for interval in (
+                _subnet_interval(network_name, subnet)
+                for subnet in vlan_data.subnet) if interval is not None
+        ]
+        subnets.extend(network_subnets)
+        ranges.extend(_range_intervals(network_name, vlan_data))
+        if network_subnets:
+            subnet_index[rack_name, vlan_data.name] = _SubnetIndex(
+                network_subnets)
+
+    for intervals in (subnets, ranges):
+        for first, second in overlapping_intervals(intervals):
+            conflicts.append(
+                '{} of network {} overlaps {} of network {}'.format(
+                    first.label, first.network, second.label, second.network))
+
+    assigned = {}
+    for rack in site_data.baremetal:
+        for host in rack.hosts:
+            for role in IP_ROLES:
+                address = host.ip.packed(role)
+                if address is None:
+                    continue
+                owner = '{} {}'.format(host.name, role)
+                if address in assigned:
+                    conflicts.append(
+                        'Address {} is assigned to both {} and {}'.format(
+                            getattr(host.ip, role), assigned[address], owner))
+                else:
+                    assigned[address] = owner
+                index = subnet_index.get((rack.name, role))
+                if index is None:
+                    index = subnet_index.get((None, role))
+                if index is not None and address not in index:
+                    conflicts.append(
+                        'Address {} of {} is outside of the subnets of '
+                        'network {}'.format(
+                            getattr(host.ip, role), owner, role))
+
+    LOG.debug("Found {} address conflicts".format(len(conflicts)))
+    return conflicts
@@ -23,6 +23,16 @@ from pkg_resources import resource_filename
 import yaml
 
 from spyglass import exceptions
+from spyglass.data_extractor.intermediary_file import write_intermediary
+from spyglass.data_extractor.intermediary_file import \
+    write_intermediary_dir
+from spyglass.data_extractor.models import DATA_DEFAULT
+from spyglass.data_extractor.models import log_invalid_ip_summary
+from spyglass.parser.address_conflicts import find_address_conflicts
+from spyglass.parser.host_roles import assign_host_types
+from spyglass.parser.host_roles import HostRoleMatcher
+from spyglass.parser.ip_allocator import ip_pool_chain_from_vlan_data
+from spyglass.parser.rules import RuleRunner
 
 LOG = logging.getLogger(__name__)
 
@@ -34,7 +44,9 @@ class ProcessDataSource(object):
             extracted_data,
             rules_config,
             intermediary_schema=None,
-            no_validation=True):
+            no_validation=True,
+            ip_ledger=None,
+            rules_state=None):
         # Initialize intermediary and save site type
         self.host_type = {}
         self.sitetype = None
@@ -43,6 +55,8 @@ class ProcessDataSource(object):
         self.region_name = region
         self.rules = rules_config
         self.no_validation = no_validation
+        self.ip_ledger = ip_ledger
+        self.rule_runner = RuleRunner(rules_state)
         if intermediary_schema and not self.no_validation:
             with open(intermediary_schema, 'r') as loaded_schema:
                 self.intermediary_schema = json.load(loaded_schema)
@@ -62,8 +76,8 @@ class ProcessDataSource(object):
     def _get_network_subnets(self):
         """Extract subnet information for networks.
 
-        In some networks, there are multiple subnets, in that case
-        we assign only the first subnet
+        Networks may have multiple subnets, which are returned in the order
+        they are listed and used for allocation in that order.
         """
 
         LOG.info("Extracting network subnets")
@@ -71,7 +85,9 @@ class ProcessDataSource(object):
         for net_type in self.data.network.vlan_network_data:
             # One of the type is ingress and we don't want that here
             if net_type.name != "ingress":
-                network_subnets[net_type.name] = IPNetwork(net_type.subnet[0])
+                network_subnets[net_type.name] = [
+                    IPNetwork(subnet) for subnet in net_type.subnet
+                ]
 
         LOG.debug(
             "Network subnets:\n{}".format(pprint.pformat(network_subnets)))
@@ -104,13 +120,31 @@ class ProcessDataSource(object):
         LOG.info("Data validation Passed!")
         return
 
+    def _check_address_conflicts(self):
+        """Checks the site data for conflicting addresses and ranges
+
+        Conflicts are logged as warnings when validation is disabled.
+
+        :raises AddressConflict: listing every conflict found
+        """
+        LOG.info("Checking for address conflicts")
+        conflicts = find_address_conflicts(self.data)
+        if not conflicts:
+            return
+        if self.no_validation:
+            for conflict in conflicts:
+                LOG.warning(conflict)
+            return
+        raise exceptions.AddressConflict(
+            count=len(conflicts), conflicts='\n'.join(conflicts))
+
     def _apply_design_rules(self):
         """Applies design rules from rules.yaml
 
         These rules are used to determine ip address allocation ranges,
         host profile interfaces and also to create hardware profile
-        information. The method calls corresponding rule handler function
-        based on rule name and applies them to appropriate data objects.
+        information. The rules are looked up by name in the rule registry
+        and applied by the rule runner, see ``spyglass.parser.rules``.
         """
         # TODO(ian-pittwood): We may want to let users specify these in cli
         #                     opts. We also need better guidelines over how
@@ -124,40 +158,23 @@ class ProcessDataSource(object):
             rules_file = self.rules
         rules_data_raw = self._read_file(rules_file)
         rules_yaml = yaml.safe_load(rules_data_raw)
-        for rule in rules_yaml.keys():
-            rule_name = rules_yaml[rule]["name"]
-            function_str = "_apply_rule_" + rule_name
-            rule_data_name = rules_yaml[rule][rule_name]
-            function = getattr(self, function_str)
-            function(rule_data_name)
-            LOG.info("Applying rule:{}".format(rule_name))
+        self.rule_runner.run(self, rules_yaml)
 
     def _apply_rule_hardware_profile(self, rule_data):
         """Apply rules to define host type from hardware profile info.
 
         Host profile will define host types as "controller, compute or
         genesis". The rule_data has pre-defined information to define
-        compute or controller based on host_profile. For defining 'genesis'
-        the first controller host is defined as genesis.
+        compute or controller based on host_profile, optionally extended
+        with controller profile lists and host and rack name patterns, see
+        ``HostRoleMatcher.from_hardware_profile``. For defining 'genesis'
+        the first controller host of the first rack is defined as genesis.
         """
 
-        is_genesis = False
         hardware_profile = rule_data[self.data.site_info.sitetype]
-        # Getting individual racks. The racks are sorted to ensure that the
-        # first controller of the first rack is assigned as 'genesis' node.
-        for rack in sorted(self.data.baremetal, key=lambda x: x.name):
-            # Getting individual hosts in each rack. Sorting of the hosts are
-            # done to determine the genesis node.
-            for host in sorted(rack.hosts, key=lambda x: x.name):
-                if host.host_profile == \
-                        hardware_profile["profile_name"]["ctrl"]:
-                    if not is_genesis:
-                        host.type = "genesis"
-                        is_genesis = True
-                    else:
-                        host.type = "controller"
-                else:
-                    host.type = "compute"
+        assign_host_types(
+            self.data.baremetal,
+            HostRoleMatcher.from_hardware_profile(hardware_profile))
 
     def _apply_rule_ip_alloc_offset(self, rule_data):
         """Apply offset rules to update baremetal host
@@ -171,26 +188,171 @@ class ProcessDataSource(object):
         self._update_vlan_net_data(rule_data)
         self._update_baremetal_host_ip_data(rule_data)
 
+    def _get_ip_pools(self):
+        """Creates a host address pool for each network
+
+        :return: dictionary of network names to IPPoolChain objects spanning
+                 all subnets of the network
+        :rtype: dict
+        """
+        ip_pools = {}
+        for net_type, subnets in self.network_subnets.items():
+            vlan_data = self.data.network.get_vlan_data_by_name(net_type)
+            ip_pools[net_type] = ip_pool_chain_from_vlan_data(
+                subnets, vlan_data)
+        return ip_pools
+
+    @staticmethod
+    def _get_rack_subnets(rack):
+        """Returns the subnets of the rack-level networks of a rack
+
+        :return: dictionary of network names to lists of subnets
+        :rtype: dict
+        """
+        return {
+            net_type: [IPNetwork(subnet) for subnet in vlan_data.subnet]
+            for net_type, vlan_data in rack.networks.items()
+            if net_type != "ingress" and vlan_data.subnet
+        }
+
+    def _get_rack_ip_pools(self, rack):
+        """Creates a host address pool for each rack-level network of a rack
+
+        :return: dictionary of network names to IPPoolChain objects
+        :rtype: dict
+        """
+        return {
+            net_type:
+            ip_pool_chain_from_vlan_data(subnets, rack.networks[net_type])
+            for net_type, subnets in self._get_rack_subnets(rack).items()
+        }
+
+    def _read_ip_ledger(self):
+        """Reads the host IP ledger, if one is configured
+
+        The ledger is a YAML file mapping each host name to its IPs by
+        network, as assigned by a previous run.
+
+        :return: dictionary of host names to dictionaries of network names
+                 to IPs
+        :rtype: dict
+        """
+        if not self.ip_ledger or not os.path.isfile(self.ip_ledger):
+            return {}
+        LOG.info("Reading IP ledger: {}".format(self.ip_ledger))
+        ledger = yaml.safe_load(self._read_file(self.ip_ledger))
+        return ledger or {}
+
+    def _write_ip_ledger(self):
+        """Records the IPs of every host in the ledger, if one is configured
+
+        The file is replaced atomically so an interrupted run never leaves a
+        truncated ledger behind.
+        """
+        if not self.ip_ledger:
+            return
+        ledger = {}
+        for rack in self.data.baremetal:
+            for host in rack.hosts:
+                ledger[host.name] = {
+                    net_type: net_ip
+                    for net_type, net_ip in iter(host.ip)
+                    if net_type in self.network_subnets
+                    or net_type in rack.networks
+                }
+        LOG.info("Writing IP ledger: {}".format(self.ip_ledger))
+        ledger_tmp = self.ip_ledger + '.tmp'
+        with open(ledger_tmp, 'w') as f:
+            yaml.safe_dump(ledger, f, default_flow_style=False)
+        os.replace(ledger_tmp, self.ip_ledger)
+
+    def _assign_host_ips(self, host_pools, ledger):
+        """Assigns host IPs for the networks of the given pools
+
+        :param host_pools: list of (host, pools) pairs, pools being a
+                           dictionary of network names to the pool the host's
+                           IP in that network is taken from
+        :param ledger: IP ledger as returned by ``_read_ip_ledger``
+        :return: the number of allocated IPs
+        :rtype: int
+        """
+        # Claim the existing addresses first, so that new addresses are
+        # allocated around them
+        unassigned = []
+        for host, pools in host_pools:
+            for net_type, net_ip in iter(host.ip):
+                if net_type not in pools:
+                    continue
+                if pools[net_type].claim(net_ip):
+                    continue
+                if net_ip and net_ip != DATA_DEFAULT:
+                    LOG.warning(
+                        "Replacing {} IP {} of host {}, it is not "
+                        "available in the static range".format(
+                            net_type, net_ip, host.name))
+                unassigned.append((host, net_type, pools[net_type]))
+
+        # Hosts without a usable address keep the one recorded in the
+        # ledger, if it is still available
+        allocate = []
+        for host, net_type, pool in unassigned:
+            ledger_ip = ledger.get(host.name, {}).get(net_type)
+            if ledger_ip and pool.claim(ledger_ip):
+                host.ip.set_ip_by_role(net_type, ledger_ip)
+            else:
+                allocate.append((host, net_type, pool))
+
+        # Allocate all addresses of a pool in one batch
+        allocate_by_pool = {}
+        for host, net_type, pool in allocate:
+            allocate_by_pool.setdefault(id(pool), (pool, net_type, []))
+            allocate_by_pool[id(pool)][2].append(host)
+        for pool, net_type, hosts in allocate_by_pool.values():
+            addresses = pool.allocate_many(len(hosts))
+            for host, address in zip(hosts, addresses):
+                host.ip.set_ip_by_role(net_type, address)
+        return len(allocate)
+
     def _update_baremetal_host_ip_data(self, rule_data):
         """Update baremetal host ip's for applicable networks.
 
         The applicable networks are oob, oam, ksn, storage and overlay.
-        These IPs are assigned based on network subnets ranges.
-        If a particular ip exists it is overridden.
+        These IPs are assigned from the static ranges of the subnets of each
+        network, filling the subnets in the order they are listed. Racks
+        with their own subnets for a network are assigned IPs from those
+        instead; as racks do not share these subnets, each rack is assigned
+        its IPs independently.
+        Existing host IPs are kept if they are in a static range and do not
+        collide with the gateway, the reserved or DHCP ranges or another
+        host. Hosts missing an IP get the one recorded for them in the IP
+        ledger if it is still available, so adding a host does not renumber
+        the others. Only the remaining IPs are allocated, and the ledger is
+        updated with the result.
         """
 
-        # Ger default ip offset
-        default_ip_offset = rule_data["default"]
-
-        host_idx = 0
         LOG.info("Update baremetal host ip's")
+        ip_pools = self._get_ip_pools()
+        ledger = self._read_ip_ledger()
+
+        site_host_pools = []
+        rack_host_pools = []
         for rack in self.data.baremetal:
-            for host in rack.hosts:
-                for net_type, net_ip in iter(host.ip):
-                    ips = list(self.network_subnets[net_type])
-                    host.ip.set_ip_by_role(
-                        net_type, str(ips[host_idx + default_ip_offset]))
-                host_idx += 1
+            rack_pools = self._get_rack_ip_pools(rack)
+            site_pools = {
+                net_type: pool
+                for net_type, pool in ip_pools.items()
+                if net_type not in rack_pools
+            }
+            site_host_pools.extend((host, site_pools) for host in rack.hosts)
+            if rack_pools:
+                rack_host_pools.append(
+                    [(host, rack_pools) for host in rack.hosts])
+
+        allocated = self._assign_host_ips(site_host_pools, ledger)
+        for host_pools in rack_host_pools:
+            allocated += self._assign_host_ips(host_pools, ledger)
+        LOG.debug("Allocated {} host IPs".format(allocated))
+        self._write_ip_ledger()
         return
 
     def _update_vlan_net_data(self, rule_data):
@@ -216,9 +378,8 @@ class ProcessDataSource(object):
         LOG.info("Apply network design rules:bgp")
         ingress_data = self.data.network.get_vlan_data_by_name('ingress')
         subnet = IPNetwork(ingress_data.subnet[0])
-        ips = list(subnet)
         self.data.network.bgp["ingress_vip"] = \
-            str(ips[ingress_vip_offset])
+            str(subnet[ingress_vip_offset])
         self.data.network.bgp["public_service_cidr"] = \
             ingress_data.subnet[0]
         LOG.debug(
@@ -226,37 +387,38 @@ class ProcessDataSource(object):
                 pprint.pformat(self.data.network.bgp)))
 
         LOG.info("Apply network design rules:vlan")
-        # Apply rules to vlan networks
-        for net_type in self.network_subnets.keys():
-            vlan_network_data_ = \
-                self.data.network.get_vlan_data_by_name(net_type)
+        # Apply rules to vlan networks, site-wide and rack-level
+        vlan_networks = [
+            (
+                net_type, self.data.network.get_vlan_data_by_name(net_type),
+                subnets) for net_type, subnets in self.network_subnets.items()
+        ]
+        for rack in self.data.baremetal:
+            for net_type, subnets in self._get_rack_subnets(rack).items():
+                vlan_networks.append(
+                    (net_type, rack.networks[net_type], subnets))
+        for net_type, vlan_network_data_, subnets in vlan_networks:
             if net_type == "oob":
                 ip_offset = oob_ip_offset
             else:
                 ip_offset = default_ip_offset
 
-            subnet = self.network_subnets[net_type]
-            ips = list(subnet)
-
-            vlan_network_data_.gateway = str(ips[gateway_ip_offset])
-
-            vlan_network_data_.reserved_start = str(ips[1])
-            vlan_network_data_.reserved_end = str(ips[ip_offset])
-
-            static_start = str(ips[ip_offset + 1])
-            static_end = str(ips[static_ip_end_offset])
-
-            if net_type == "pxe":
-                mid = len(ips) // 2
-                static_end = str(ips[mid - 1])
-                dhcp_start = str(ips[mid])
-                dhcp_end = str(ips[dhcp_ip_end_offset])
-
-                vlan_network_data_.dhcp_start = dhcp_start
-                vlan_network_data_.dhcp_end = dhcp_end
-
-            vlan_network_data_.static_start = static_start
-            vlan_network_data_.static_end = static_end
+            # Every subnet gets the same layout, addresses are looked up by
+            # offset so large subnets are never enumerated
+            for subnet in subnets:
+                ranges = {
+                    'gateway': str(subnet[gateway_ip_offset]),
+                    'reserved_start': str(subnet[1]),
+                    'reserved_end': str(subnet[ip_offset]),
+                    'static_start': str(subnet[ip_offset + 1]),
+                    'static_end': str(subnet[static_ip_end_offset]),
+                }
+                if net_type == "pxe":
+                    mid = subnet.size // 2
+                    ranges['static_end'] = str(subnet[mid - 1])
+                    ranges['dhcp_start'] = str(subnet[mid])
+                    ranges['dhcp_end'] = str(subnet[dhcp_ip_end_offset])
+                vlan_network_data_.set_subnet_ranges(str(subnet), **ranges)
 
             # OAM have default routes. Only for cruiser. TBD
             if net_type == "oam":
@@ -268,31 +430,47 @@ class ProcessDataSource(object):
             "Updated vlan network data:\n{}".format(
                 pprint.pformat(vlan_network_data_.dict_from_class())))
 
-    def dump_intermediary_file(self, intermediary_dir):
-        """Writing intermediary yaml"""
+    def dump_intermediary_file(
+            self, intermediary_dir, index=False, sharded=False):
+        """Writing intermediary yaml
+
+        Hosts are written as they are read from the site data, without
+        building its ``dict_from_class()`` tree.
+
+        :param intermediary_dir: directory to write the file to, the current
+                                 directory if None
+        :param index: whether to also write an index of the file's sections
+                      and racks, letting loaders parse only some of them
+        :param sharded: whether to write the intermediary as a directory
+                        with a header file and a file per rack, named after
+                        the region without the .yaml extension
+        """
 
         LOG.info("Writing intermediary yaml")
         intermediary_file = "{}_intermediary.yaml" \
                             .format(self.region_name)
+        if sharded:
+            intermediary_file = os.path.splitext(intermediary_file)[0]
         # Check of if output dir = intermediary_dir exists
         if intermediary_dir is not None:
             outfile = os.path.join(intermediary_dir, intermediary_file)
         else:
             outfile = intermediary_file
         LOG.info("Intermediary file:{}".format(outfile))
-        yaml_file = yaml.dump(
-            self.data.dict_from_class(), default_flow_style=False)
-        with open(outfile, "w") as f:
-            f.write(yaml_file)
-        f.close()
+        if sharded:
+            write_intermediary_dir(self.data, outfile)
+        else:
+            write_intermediary(self.data, outfile, index=index)
 
     def generate_intermediary_yaml(self):
         """Generating intermediary yaml"""
 
         LOG.info("Start: Generate Intermediary")
         self._apply_design_rules()
+        self._check_address_conflicts()
         self._get_genesis_node_details()
         # This will validate the extracted data from different sources.
         if not self.no_validation and self.intermediary_schema:
             self._validate_intermediary_data()
+        log_invalid_ip_summary()
         return self.data
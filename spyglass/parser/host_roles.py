@@ -0,0 +1,119 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import logging
+
+from spyglass.data_extractor.selectors import compile_patterns
+
+LOG = logging.getLogger(__name__)
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+class HostRoleMatcher(object):
+    """Selects the controller hosts of a site from a hardware profile
+
+    A host is a controller if its rack is selected and either its profile is
+    one of the controller profiles or its name matches one of the controller
+    host patterns. All the profiles are kept in a set and all the patterns
+    are compiled into one expression, so each host is tested in constant
+    time however many profiles and patterns are given.
+    """
+    def __init__(self, profiles=None, hosts=None, racks=None):
+        """Compiles the controller selectors
+
+        :param profiles: list of controller host profile names
+        :param hosts: list of host name patterns, see ``compile_patterns``
+        :param racks: list of rack name patterns the controllers are limited
+                      to, all racks if not given
+        """
+        self.profiles = frozenset(_as_list(profiles))
+        self.hosts = compile_patterns(_as_list(hosts))
+        self.racks = compile_patterns(_as_list(racks))
+
+    @classmethod
+    def from_hardware_profile(cls, hardware_profile):
+        """Creates the matcher of the hardware profile of a site type
+
+        Controllers are the hosts with the ``profile_name.ctrl`` profile,
+        which may be a single name or a list, together with those selected
+        by the optional ``controller`` section::
+
+            controller:
+              profiles: [cp-r740]
+              hosts: ['cab2r72c1*', '/cab2r73c0[12]/']
+              racks: [rack72, rack73]
+
+        :param hardware_profile: the hardware profile of the site type from
+                                 the hardware_profile rule
+        :rtype: HostRoleMatcher
+        """
+        selectors = hardware_profile.get('controller') or {}
+        profiles = _as_list(
+            (hardware_profile.get('profile_name') or {}).get('ctrl'))
+        profiles.extend(_as_list(selectors.get('profiles')))
+        return cls(profiles, selectors.get('hosts'), selectors.get('racks'))
+
+    def rack_selected(self, rack_name):
+        """Returns True if controllers may be in the rack of a name"""
+        return self.racks is None or \
+            self.racks.fullmatch(rack_name) is not None
+
+    def is_controller(self, host):
+        """Returns True if a host of a selected rack is a controller"""
+        return host.host_profile in self.profiles or (
+            self.hosts is not None
+            and self.hosts.fullmatch(host.name) is not None)
+
+
+def assign_host_types(racks, matcher):
+    """Sets the type of every host in a single pass
+
+    Controllers are typed ``controller`` and all other hosts ``compute``,
+    except the controller with the lowest rack name and host name, which
+    is typed ``genesis``. It is found with a heap of the controllers rather
+    than by sorting the racks and hosts.
+
+    :param racks: list of models.Rack
+    :param matcher: the HostRoleMatcher selecting controllers
+    :return: the genesis host, or None if there are no controllers
+    :rtype: models.Host or None
+    """
+    controllers = []
+    for rack in racks:
+        rack_selected = matcher.rack_selected(rack.name)
+        for host in rack.hosts:
+            if rack_selected and matcher.is_controller(host):
+                host.type = 'controller'
+                controllers.append(
+                    (rack.name, host.name, len(controllers), host))
+            else:
+                host.type = 'compute'
+    if not controllers:
+        LOG.warning("No controller host found for the genesis node")
+        return None
+    heapq.heapify(controllers)
+    genesis = heapq.heappop(controllers)[-1]
+    genesis.type = 'genesis'
+    LOG.debug(
+        "Found {} controllers, genesis node is {}".format(
+            len(controllers) + 1, genesis.name))
+    return genesis
@@ -0,0 +1,374 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import logging
+
+from netaddr import AddrFormatError
+from netaddr import IPAddress
+
+from spyglass import exceptions
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LOG = logging.getLogger(__name__)
+
+
+def _to_int(address):
+    """Returns the integer value of an address given as str or IPAddress"""
+    if isinstance(address, int):
+        return address
+    return int(IPAddress(str(address)))
+
+
+class IPPool(object):
+    """Allocates host addresses from the static range of a network
+
+    Free addresses are tracked as a sorted run-length list of disjoint
+    ``[start, end]`` intervals, so pools of any size, including IPv6
+    networks, are handled without enumerating their addresses. Reserving a
+    range or claiming an address splits at most one interval, and each
+    allocation takes the lowest free address in amortised O(1) time.
+    """
+    def __init__(self, name, network, first=None, last=None):
+        """Creates a pool over a range of a network
+
+        :param name: name of the network, used in error messages
+        :param network: the network the pool belongs to
+        :type network: netaddr.IPNetwork
+        :param first: first address of the pool, defaults to the first
+                      usable address of the network
+        :param last: last address of the pool, defaults to the last usable
+                     address of the network
+        """
+        self.name = name
+        self.network = network
+        if first is None:
+            first = network.first + 1 if network.size > 2 else network.first
+        if last is None:
+            last = network.last - 1 if network.size > 2 else network.last
+        self.first = _to_int(first)
+        self.last = _to_int(last)
+        self._starts = [self.first] if self.first <= self.last else []
+        self._ends = [self.last] if self.first <= self.last else []
+        # Intervals before the cursor have been fully allocated
+        self._cursor = 0
+
+    def available(self):
+        """Returns the number of free addresses left in the pool"""
+        return sum(
+            end - start + 1 for start, end in zip(
+                self._starts[self._cursor:], self._ends[self._cursor:]))
+
+    def empty(self):
+        """Returns True if no free address is left in the pool"""
+        return self._cursor >= len(self._starts)
+
+    def _find(self, value):
+        """Returns the index of the free interval containing value or -1"""
+        index = bisect.bisect_right(self._starts, value) - 1
+        if index >= self._cursor and self._ends[index] >= value:
+            return index
+        return -1
+
+    def is_free(self, address):
+        """Returns True if the address belongs to the pool and is free"""
+        return self._find(_to_int(address)) >= 0
+
+    def reserve(self, first, last=None):
+        """Removes a range of addresses from the pool
+
+        Addresses of the range outside of the pool are ignored.
+
+        :param first: first address of the range
+        :param last: last address of the range, defaults to first
+        """
+        first = _to_int(first)
+        last = first if last is None else _to_int(last)
+        index = bisect.bisect_right(self._starts, last) - 1
+        while index >= self._cursor and self._ends[index] >= first:
+            start, end = self._starts[index], self._ends[index]
+            starts, ends = [], []
+            if start < first:
+                starts.append(start)
+                ends.append(first - 1)
+            if end > last:
+                starts.append(last + 1)
+                ends.append(end)
+            self._starts[index:index + 1] = starts
+            self._ends[index:index + 1] = ends
+            index -= 1
+
+    def claim(self, address):
+        """Marks an existing address as used if it is free in the pool
+
+        :param address: address as a string or IPAddress
+        :return: False if the address is not valid, outside of the pool,
+                 reserved or already claimed
+        :rtype: bool
+        """
+        try:
+            value = IPAddress(str(address))
+        except (AddrFormatError, ValueError, TypeError):
+            return False
+        if value.version != self.network.version or \
+                not self.is_free(int(value)):
+            return False
+        self.reserve(int(value))
+        return True
+
+    def allocate(self):
+        """Allocates the lowest free address of the pool
+
+        :return: the allocated address
+        :rtype: netaddr.IPAddress
+        :raises IPPoolExhausted: if no free address is left
+        """
+        if self.empty():
+            raise exceptions.IPPoolExhausted(
+                network=self.name,
+                first=IPAddress(self.first, self.network.version),
+                last=IPAddress(self.last, self.network.version))
+        value = self._starts[self._cursor]
+        if value == self._ends[self._cursor]:
+            self._cursor += 1
+        else:
+            self._starts[self._cursor] = value + 1
+        return IPAddress(value, self.network.version)
+
+    def _allocate_runs(self, count):
+        """Allocates the lowest free addresses as runs of consecutive values
+
+        :param count: number of addresses to allocate
+        :return: list of (first value, number of values) tuples
+        :rtype: list
+        :raises IPPoolExhausted: if fewer than count free addresses are left
+        """
+        if count > self.available():
+            raise exceptions.IPPoolExhausted(
+                network=self.name,
+                first=IPAddress(self.first, self.network.version),
+                last=IPAddress(self.last, self.network.version))
+        runs = []
+        while count > 0:
+            start = self._starts[self._cursor]
+            taken = min(count, self._ends[self._cursor] - start + 1)
+            runs.append((start, taken))
+            if start + taken > self._ends[self._cursor]:
+                self._cursor += 1
+            else:
+                self._starts[self._cursor] = start + taken
+            count -= taken
+        return runs
+
+    def allocate_many(self, count, vectorize=None):
+        """Allocates the lowest free addresses of the pool in one batch
+
+        The result is identical to calling ``allocate`` count times, but the
+        addresses are taken a whole free interval at a time and formatted in
+        bulk, see ``format_address_runs``.
+
+        :param count: number of addresses to allocate
+        :param vectorize: whether to format with NumPy, defaults to using it
+                          when it is installed
+        :return: the allocated addresses as strings
+        :rtype: list
+        :raises IPPoolExhausted: if fewer than count free addresses are left
+        """
+        return format_address_runs(
+            self._allocate_runs(count), self.network.version, vectorize)
+
+
+def _format_ipv4_array(values):
+    """Formats an array of IPv4 address values as dotted quad strings
+
+    Each octet is looked up in a table of its decimal string, so the whole
+    array is formatted with a handful of array operations.
+    """
+    octet_dot = numpy.array(
+        ['{}.'.format(i) for i in range(256)], dtype=object)
+    octet = numpy.array([str(i) for i in range(256)], dtype=object)
+    return (
+        octet_dot[values >> 24] + octet_dot[(values >> 16) & 0xFF]
+        + octet_dot[(values >> 8) & 0xFF] + octet[values & 0xFF]).tolist()
+
+
+def format_address_runs(runs, version, vectorize=None):
+    """Formats runs of consecutive address values as strings
+
+    IPv4 addresses are computed and formatted as a single NumPy array
+    operation when NumPy is installed. IPv6 addresses, whose canonical text
+    form depends on their runs of zero groups, are always formatted one at
+    a time. Both paths give the same strings as ``str(IPAddress(...))``.
+
+    :param runs: list of (first value, number of values) tuples
+    :param version: IP version of the addresses
+    :param vectorize: whether to format with NumPy, defaults to using it
+                      when it is installed
+    :return: list of address strings
+    :rtype: list
+    """
+    if vectorize is None:
+        vectorize = numpy is not None
+    if vectorize and numpy is None:
+        raise ImportError('NumPy is required for vectorized formatting.')
+    if vectorize and version == 4 and runs:
+        values = numpy.concatenate(
+            [
+                numpy.arange(start, start + count, dtype=numpy.uint32)
+                for start, count in runs
+            ])
+        return _format_ipv4_array(values)
+    return [
+        str(IPAddress(value, version)) for start, count in runs
+        for value in range(start, start + count)
+    ]
+
+
+class IPPoolChain(object):
+    """Allocates host addresses from the pools of several subnets in turn
+
+    Addresses are taken from the first pool until it is exhausted, then
+    from the next one, so a network is grown by adding a subnet to it.
+    """
+    def __init__(self, name, pools):
+        """Creates a chain of pools
+
+        :param name: name of the network, used in error messages
+        :param pools: list of IPPool objects in allocation order
+        """
+        self.name = name
+        self.pools = pools
+        # Pools before the cursor have no free address left
+        self._cursor = 0
+
+    def available(self):
+        """Returns the number of free addresses left in all pools"""
+        return sum(pool.available() for pool in self.pools)
+
+    def is_free(self, address):
+        """Returns True if the address belongs to a pool and is free"""
+        return any(pool.is_free(address) for pool in self.pools)
+
+    def claim(self, address):
+        """Marks an existing address as used in the pool it belongs to
+
+        :param address: address as a string or IPAddress
+        :return: False if the address is not free in any of the pools
+        :rtype: bool
+        """
+        return any(pool.claim(address) for pool in self.pools)
+
+    def _exhausted(self):
+        return exceptions.IPPoolExhausted(
+            network=self.name,
+            first=IPAddress(
+                self.pools[0].first, self.pools[0].network.version)
+            if self.pools else None,
+            last=IPAddress(
+                self.pools[-1].last, self.pools[-1].network.version)
+            if self.pools else None)
+
+    def allocate(self):
+        """Allocates the lowest free address of the first non-empty pool
+
+        :rtype: netaddr.IPAddress
+        :raises IPPoolExhausted: if no free address is left
+        """
+        while self._cursor < len(self.pools):
+            pool = self.pools[self._cursor]
+            if not pool.empty():
+                return pool.allocate()
+            self._cursor += 1
+        raise self._exhausted()
+
+    def allocate_many(self, count, vectorize=None):
+        """Allocates addresses from the pools in order, in one batch
+
+        :param count: number of addresses to allocate
+        :param vectorize: whether to format with NumPy, see
+                          ``format_address_runs``
+        :return: the allocated addresses as strings
+        :rtype: list
+        :raises IPPoolExhausted: if fewer than count free addresses are left,
+                                 in which case no address is allocated
+        """
+        if count > self.available():
+            raise self._exhausted()
+        addresses = []
+        for pool in self.pools:
+            if len(addresses) == count:
+                break
+            taken = min(count - len(addresses), pool.available())
+            if taken:
+                addresses.extend(pool.allocate_many(taken, vectorize))
+        return addresses
+
+
+def ip_pool_from_ranges(name, network, ranges):
+    """Creates the host address pool of a subnet from its ranges
+
+    The pool covers the static range of the subnet if one is defined, or
+    every usable address of the subnet otherwise. The gateway, reserved
+    range and DHCP range are removed from the pool.
+
+    :param name: name of the network
+    :param network: the subnet addresses are allocated from
+    :type network: netaddr.IPNetwork
+    :param ranges: dictionary with the gateway and ranges of the subnet, as
+                   returned by ``VLANNetworkData.get_subnet_ranges``
+    :rtype: IPPool
+    """
+    if ranges.get('static_start') and ranges.get('static_end'):
+        pool = IPPool(
+            name, network, ranges['static_start'], ranges['static_end'])
+    else:
+        pool = IPPool(name, network)
+    if ranges.get('gateway'):
+        pool.reserve(ranges['gateway'])
+    if ranges.get('reserved_start') and ranges.get('reserved_end'):
+        pool.reserve(ranges['reserved_start'], ranges['reserved_end'])
+    if ranges.get('dhcp_start') and ranges.get('dhcp_end'):
+        pool.reserve(ranges['dhcp_start'], ranges['dhcp_end'])
+    return pool
+
+
+def ip_pool_from_vlan_data(network, vlan_data):
+    """Creates the host address pool of a subnet of a VLAN network
+
+    :param network: the subnet addresses are allocated from
+    :type network: netaddr.IPNetwork
+    :param vlan_data: VLAN network data holding the subnet's ranges
+    :type vlan_data: models.VLANNetworkData
+    :rtype: IPPool
+    """
+    return ip_pool_from_ranges(
+        vlan_data.name, network, vlan_data.get_subnet_ranges(str(network)))
+
+
+def ip_pool_chain_from_vlan_data(networks, vlan_data):
+    """Creates a pool chain over all subnets of a VLAN network
+
+    :param networks: the subnets of the network in allocation order
+    :type networks: list of netaddr.IPNetwork
+    :param vlan_data: VLAN network data holding the subnets' ranges
+    :type vlan_data: models.VLANNetworkData
+    :rtype: IPPoolChain
+    """
+    return IPPoolChain(
+        vlan_data.name,
+        [ip_pool_from_vlan_data(network, vlan_data) for network in networks])
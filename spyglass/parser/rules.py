@@ -0,0 +1,415 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import abc
+import hashlib
+import json
+import logging
+import os
+import time
+
+import pkg_resources
+
+from spyglass.data_extractor import models
+from spyglass import exceptions
+
+LOG = logging.getLogger(__name__)
+
+# Entry point group under which packages register additional design rules
+RULES_ENTRY_POINT = 'spyglass_design_rules'
+
+# Field standing for the whole site data
+ALL_FIELDS = '*'
+
+
+class DesignRule(object):
+    """Base class of the design rules applied to extracted site data
+
+    A rule declares the site data fields it reads and writes as dotted
+    paths of model attributes, e.g. ``baremetal.hosts.ip``. Paths through a
+    list, such as ``baremetal`` or ``hosts``, stand for the attribute of
+    every item. The declarations decide the order rules are applied in and
+    when a rule can be skipped, so they must list every field the rule
+    uses.
+
+    Rules are registered under the ``spyglass_design_rules`` entry point
+    group, with the rule name used in rules.yaml as entry point name.
+    """
+
+    #: Fields of the site data the rule reads
+    reads = (ALL_FIELDS, )
+
+    #: Fields of the site data the rule writes
+    writes = (ALL_FIELDS, )
+
+    def inputs(self, engine, rule_data):
+        """Returns the inputs of the rule other than the site data
+
+        Rules depending on files or other state outside of the site data
+        include them here, so a change to them is not skipped. The inputs
+        recorded are taken after the rule is applied, so files the rule
+        writes itself, such as the IP ledger, do not make the next run
+        apply it again.
+
+        :param engine: the engine processing the site data
+        :param rule_data: configuration of the rule from rules.yaml
+        :return: a JSON serializable value, by default the configuration
+        """
+        return rule_data
+
+    def apply(self, engine, rule_data):
+        """Applies the rule to the site data of the engine
+
+        :param engine: the engine processing the site data, the data is
+                       available as ``engine.data``
+        :type engine: spyglass.parser.engine.ProcessDataSource
+        :param rule_data: configuration of the rule from rules.yaml
+        """
+        raise NotImplementedError()
+
+    def save_outputs(self, engine):
+        """Returns the values the rule wrote, to replay them in later runs
+
+        Rules returning None are only skipped when the site data still
+        holds what they wrote.
+
+        :param engine: the engine processing the site data
+        :return: a JSON serializable value, or None
+        """
+        return None
+
+    def restore_outputs(self, engine, outputs):
+        """Writes the values returned by ``save_outputs`` to the site data
+
+        :param engine: the engine processing the site data
+        :param outputs: the value returned by ``save_outputs``
+        """
+        raise NotImplementedError()
+
+
+class HardwareProfileRule(DesignRule):
+    """Sets host types from the hardware profiles of the site type"""
+
+    reads = (
+        'site_info.sitetype', 'baremetal.name', 'baremetal.hosts.name',
+        'baremetal.hosts.host_profile')
+    writes = ('baremetal.hosts.type', )
+
+    def apply(self, engine, rule_data):
+        engine._apply_rule_hardware_profile(rule_data)
+
+
+class IPAllocOffsetRule(DesignRule):
+    """Lays out the address ranges of networks and assigns host IPs"""
+
+    reads = (
+        'network.vlan_network_data', 'baremetal.name', 'baremetal.networks',
+        'baremetal.hosts.name', 'baremetal.hosts.ip')
+    writes = (
+        'network.bgp', 'network.vlan_network_data', 'baremetal.networks',
+        'baremetal.hosts.ip')
+
+    def inputs(self, engine, rule_data):
+        ledger = None
+        if engine.ip_ledger and os.path.isfile(engine.ip_ledger):
+            ledger = engine._read_file(engine.ip_ledger)
+        return [rule_data, ledger]
+
+    def apply(self, engine, rule_data):
+        engine._apply_rule_ip_alloc_offset(rule_data)
+
+    def save_outputs(self, engine):
+        network = engine.data.dict_from_class(hosts=False)['network']
+        return {
+            'network': network,
+            'hosts': {
+                rack.name: {host.name: dict(host.ip)
+                            for host in rack.hosts}
+                for rack in engine.data.baremetal
+            },
+        }
+
+    def restore_outputs(self, engine, outputs):
+        network = outputs['network']
+        engine.data.network.bgp = network.get('bgp', {})
+        engine.data.network.vlan_network_data = [
+            models.VLANNetworkData(name, **vlan_data)
+            for name, vlan_data in network['vlan_network_data'].items()
+        ]
+        rack_networks = network.get('rack_vlan_network_data', {})
+        for rack in engine.data.baremetal:
+            rack.networks = {
+                name: models.VLANNetworkData(name, **vlan_data)
+                for name, vlan_data in rack_networks.get(rack.name,
+                                                         {}).items()
+            }
+            host_ips = outputs['hosts'].get(rack.name, {})
+            for host in rack.hosts:
+                for role, address in host_ips.get(host.name, {}).items():
+                    host.ip.set_ip_by_role(role, address)
+
+
+class _MethodRule(DesignRule):
+    """Rule implemented by an ``_apply_rule_<name>`` method of the engine
+
+    Such rules declare no fields, so they are assumed to read and write the
+    whole site data.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def apply(self, engine, rule_data):
+        getattr(engine, '_apply_rule_' + self.name)(rule_data)
+
+
+BUILTIN_RULES = {
+    'hardware_profile': HardwareProfileRule,
+    'ip_alloc_offset': IPAllocOffsetRule,
+}
+
+
+def get_rule_registry():
+    """Returns the design rules available by name
+
+    Rules registered under the entry point group take precedence over the
+    built-in rules of the same name.
+
+    :return: dictionary of rule names to DesignRule classes
+    :rtype: dict
+    """
+    registry = dict(BUILTIN_RULES)
+    for entry_point in pkg_resources.iter_entry_points(RULES_ENTRY_POINT):
+        try:
+            registry[entry_point.name] = entry_point.load()
+        except ImportError:
+            LOG.warning(
+                "Unable to load design rule {}".format(entry_point.name))
+    return registry
+
+
+def _fields_overlap(first, second):
+    """Returns True if one field path is, or contains, the other"""
+    if ALL_FIELDS in (first, second) or first == second:
+        return True
+    return first.startswith(second + '.') or second.startswith(first + '.')
+
+
+def _any_overlap(fields, other_fields):
+    return any(
+        _fields_overlap(field, other) for field in fields
+        for other in other_fields)
+
+
+def order_rules(rules):
+    """Groups rules into stages of rules independent of each other
+
+    A rule writing a field is applied before the rules reading it. Rules
+    writing the same field, or writing fields each other reads, are applied
+    in the order they are listed. Rules sharing no field written by either
+    of them are independent.
+
+    :param rules: list of (name, DesignRule) tuples in the listed order
+    :return: list of stages, each a list of (name, DesignRule) tuples
+    :rtype: list
+    :raises DesignRuleCycle: if the rules depend on each other
+    """
+    after = {index: set() for index in range(len(rules))}
+    for i, (_, first) in enumerate(rules):
+        for j, (_, second) in enumerate(rules):
+            if i == j:
+                continue
+            if _any_overlap(first.writes, second.reads):
+                if i < j or not _any_overlap(second.writes, first.reads):
+                    after[j].add(i)
+            elif i < j and _any_overlap(first.writes, second.writes):
+                after[j].add(i)
+
+    stages = []
+    done = set()
+    while len(done) < len(rules):
+        stage = [
+            index for index in range(len(rules))
+            if index not in done and after[index] <= done
+        ]
+        if not stage:
+            raise exceptions.DesignRuleCycle(
+                rules=', '.join(
+                    rules[index][0] for index in range(len(rules))
+                    if index not in done))
+        stages.append([rules[index] for index in stage])
+        done.update(stage)
+    return stages
+
+
+def _get_field(value, step):
+    """Returns an attribute of a value, or of every item of nested lists"""
+    if isinstance(value, abc.Sequence) and not isinstance(value, str):
+        return [_get_field(item, step) for item in value]
+    return getattr(value, step, None)
+
+
+def _resolve(data, path):
+    """Returns the value of a dotted field path in the site data"""
+    if path == ALL_FIELDS:
+        return data
+    value = data
+    for step in path.split('.'):
+        value = _get_field(value, step)
+    return value
+
+
+def _serialize(value):
+    if hasattr(value, 'dict_from_class'):
+        return value.dict_from_class()
+    return str(value)
+
+
+def fields_digest(data, fields):
+    """Returns a digest of the values of site data fields
+
+    :param data: the site data
+    :param fields: iterable of field paths
+    :rtype: str
+    """
+    values = [(field, _resolve(data, field)) for field in sorted(fields)]
+    return hashlib.sha256(
+        json.dumps(values, sort_keys=True,
+                   default=_serialize).encode()).hexdigest()
+
+
+class RuleRunner(object):
+    """Applies the design rules listed in rules.yaml to site data
+
+    Rules are applied in the order of the stages from ``order_rules``, the
+    rules of a stage in the order they are listed. A rule is skipped when
+    its configuration is unchanged since it was last applied and either the
+    fields it reads and writes still hold what it left there, or the fields
+    it reads hold what they held before it was applied and the values it
+    wrote can be replayed with ``DesignRule.restore_outputs``. These digests
+    and values are kept in a JSON state file when one is given, so rules are
+    also skipped across runs.
+    """
+    def __init__(self, state_file=None, registry=None):
+        """Creates a rule runner
+
+        :param state_file: path of the JSON file keeping the rule digests
+        :param registry: dictionary of rule names to DesignRule classes,
+                         defaults to ``get_rule_registry()``
+        """
+        self.state_file = state_file
+        self.registry = registry if registry is not None \
+            else get_rule_registry()
+        self.state = self._read_state()
+        # Seconds taken to apply each rule in the last run
+        self.timings = {}
+
+    def _read_state(self):
+        if not self.state_file or not os.path.isfile(self.state_file):
+            return {}
+        with open(self.state_file, 'r') as f:
+            return json.load(f)
+
+    def _write_state(self):
+        if not self.state_file:
+            return
+        state_tmp = self.state_file + '.tmp'
+        with open(state_tmp, 'w') as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(state_tmp, self.state_file)
+
+    def get_rule(self, engine, name):
+        """Returns the rule of a name
+
+        :raises UnknownDesignRule: if no rule of that name exists
+        """
+        if name in self.registry:
+            return self.registry[name]()
+        if hasattr(engine, '_apply_rule_' + name):
+            return _MethodRule(name)
+        raise exceptions.UnknownDesignRule(rule_name=name)
+
+    def _skip(
+            self, engine, name, rule, previous, config_digest, inputs_digest):
+        """Returns True if a rule need not be applied, replaying its outputs
+
+        :param previous: state recorded when the rule was last applied
+        :param inputs_digest: digest of the fields the rule reads, taken
+                              before applying it
+        """
+        if previous.get('config') != config_digest:
+            return False
+        if previous.get('reads') == inputs_digest and \
+                previous.get('writes') == fields_digest(
+                    engine.data, rule.writes):
+            return True
+        if previous.get('inputs') != inputs_digest or \
+                previous.get('outputs') is None:
+            return False
+        rule.restore_outputs(engine, previous['outputs'])
+        if fields_digest(engine.data, rule.writes) != previous['writes']:
+            LOG.warning(
+                "Replaying the outputs of rule {} did not give the recorded "
+                "fields, applying it".format(name))
+            return False
+        return True
+
+    @staticmethod
+    def _config_digest(engine, rule, rule_data):
+        """Returns a digest of the inputs of a rule besides the site data"""
+        return hashlib.sha256(
+            json.dumps(
+                rule.inputs(engine, rule_data), sort_keys=True,
+                default=str).encode()).hexdigest()
+
+    def _apply(self, engine, name, rule, rule_data):
+        """Applies a single rule unless it can be skipped"""
+        config_digest = self._config_digest(engine, rule, rule_data)
+        # Taken before the rule runs, as it may write fields it reads
+        inputs_digest = fields_digest(engine.data, rule.reads)
+        if self._skip(engine, name, rule, self.state.get(name, {}),
+                      config_digest, inputs_digest):
+            LOG.info("Skipping rule {}, its inputs are unchanged".format(name))
+            self.timings[name] = 0.0
+            return
+        LOG.info("Applying rule:{}".format(name))
+        start = time.monotonic()
+        rule.apply(engine, rule_data)
+        self.timings[name] = time.monotonic() - start
+        LOG.info("Applied rule {} in {:.3f}s".format(name, self.timings[name]))
+        self.state[name] = {
+            # Taken again as the rule may write files it reads
+            'config': self._config_digest(engine, rule, rule_data),
+            'inputs': inputs_digest,
+            'reads': fields_digest(engine.data, rule.reads),
+            'writes': fields_digest(engine.data, rule.writes),
+            'outputs': rule.save_outputs(engine),
+        }
+
+    def run(self, engine, rules_yaml):
+        """Applies the rules of a loaded rules.yaml to the engine's data
+
+        :param engine: the engine processing the site data
+        :param rules_yaml: the loaded rules.yaml
+        """
+        rules = []
+        rule_data = {}
+        for rule in rules_yaml.keys():
+            name = rules_yaml[rule]["name"]
+            rules.append((name, self.get_rule(engine, name)))
+            rule_data[name] = rules_yaml[rule][name]
+
+        for stage in order_rules(rules):
+            for name, rule in stage:
+                self._apply(engine, name, rule, rule_data[name])
+        self._write_state()
@@ -12,21 +12,177 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import hashlib
+import json
 import logging
 import os
+import re
 import shutil
+import time
 
 import jinja2
+from jinja2 import meta
+import yaml
 
+from spyglass.data_extractor.models import Rack
 from spyglass.data_extractor.models import site_document_data_factory
 from spyglass.data_extractor.models import SiteDocumentData
 from spyglass.site_processors.base import BaseProcessor
+from spyglass.site_processors.template_analysis import \
+    check_data_dependencies
+from spyglass.site_processors.template_analysis import \
+    find_data_dependencies
+from spyglass.site_processors.template_analysis import find_data_sections
+from spyglass.site_processors.template_analysis import \
+    find_undeclared_names
+from spyglass.site_processors.template_analysis import format_path
 
 LOG = logging.getLogger(__name__)
 
+# Index of the files written by the previous run, stored in the region's
+# manifest directory and used to detect outputs that are no longer produced
+MANIFEST_INDEX_FILE = '.spyglass-manifest.json'
+
+# Suffixes of the sibling directories used to stage a region's manifests and
+# to hold the previous manifests while the staged directory is swapped in
+STAGING_DIR_SUFFIX = '.staging'
+BACKUP_DIR_SUFFIX = '.previous'
+
+# Size of the blocks read when hashing existing manifest files
+HASH_BLOCK_SIZE = 65536
+
+# Size of the buffer used when streaming rendered templates to disk
+WRITE_BUFFER_SIZE = 1048576
+
+# Leading Jinja2 comment holding template directives as YAML, for example
+# ``{# shard_by: rack #}``
+DIRECTIVE_RE = re.compile(r'\A\s*{#(.*?)#}', re.DOTALL)
+
+# Supported values of the ``shard_by`` template directive
+SHARD_KEYS = ('rack', 'host')
+
+# Attributes of the site data outside of baremetal. Templates using only
+# these are keyed by a digest of them, so rendering them does not build the
+# racks and hosts of lazily loaded site data.
+SITE_SECTIONS = ('site_info', 'network', 'storage')
+
+# A single output file of a template: its path relative to the region's
+# manifest directory, the data passed to the template and the key
+# identifying the inputs it was rendered from
+_Output = collections.namedtuple('_Output', ['rel_path', 'data', 'key'])
+
+
+def _digest(*values):
+    """Returns a SHA-256 hex digest over JSON serialized values"""
+    digest = hashlib.sha256()
+    for value in values:
+        digest.update(
+            json.dumps(value, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def get_template_directives(source):
+    """Parses the directives from the leading comment of a template
+
+    Directives are given as a YAML mapping inside a Jinja2 comment at the
+    very start of the template, so they are ignored when rendering::
+
+        {# shard_by: rack #}
+
+    :param source: template source
+    :return: directives, empty if the template does not declare any
+    :rtype: dict
+    """
+    match = DIRECTIVE_RE.match(source)
+    if not match:
+        return {}
+    try:
+        directives = yaml.safe_load(match.group(1))
+    except yaml.YAMLError:
+        return {}
+    if not isinstance(directives, dict):
+        return {}
+    return directives
+
+
+def get_template_sources(environment, name, source):
+    """Collects the sources of a template and of the templates it uses
+
+    Templates referenced by ``include``, ``import`` and ``extends`` are
+    followed recursively, so a digest of the result changes whenever any of
+    them is edited.
+
+    :param environment: Jinja2 environment whose loader finds the templates
+    :param name: name of the template
+    :param source: source of the template
+    :return: dictionary of template names to sources, or None if a
+             referenced template is computed at render time or not found
+    :rtype: dict
+    """
+    sources = {name: source}
+    pending = [source]
+    while pending:
+        try:
+            template_ast = environment.parse(pending.pop())
+        except jinja2.TemplateSyntaxError:
+            return None
+        for referenced in meta.find_referenced_templates(template_ast):
+            if referenced is None:
+                return None
+            if referenced in sources:
+                continue
+            try:
+                sources[referenced] = environment.loader.get_source(
+                    environment, referenced)[0]
+            except jinja2.TemplateNotFound:
+                return None
+            pending.append(sources[referenced])
+    return sources
+
+
+def _file_digest(path):
+    """Returns the SHA-256 hex digest of a file, or None if it is missing
+
+    The file is read in blocks so large manifests are never fully loaded.
+    """
+    if not os.path.isfile(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _link_or_copy(src, dst):
+    """Links src to dst, copying it if hard links are not supported"""
+    dst_dir = os.path.dirname(dst)
+    if not os.path.isdir(dst_dir):
+        os.makedirs(dst_dir)
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
 
 class SiteProcessor(BaseProcessor):
-    def __init__(self, site_data, manifest_dir, force_write):
+    def __init__(
+            self, site_data, manifest_dir, force_write, resume=False,
+            racks=None):
+        """Creates a processor rendering the manifests of a site
+
+        :param site_data: the site data, or the intermediary dictionary
+        :param manifest_dir: directory the manifests are written to
+        :param force_write: whether to write manifests regardless of
+                            undefined data
+        :param resume: whether to reuse files staged by a failed run
+        :param racks: names of racks to render the sharded templates of,
+                      keeping every other output of the previous run. All
+                      templates are rendered if not given.
+        """
         super().__init__()
         if isinstance(site_data, SiteDocumentData):
             self.site_data = site_data
@@ -34,6 +190,391 @@ class SiteProcessor(BaseProcessor):
             self.site_data = site_document_data_factory(site_data)
         self.manifest_dir = manifest_dir
         self.force_write = force_write
+        self.resume = resume
+        self.racks = None if racks is None else set(racks)
+        self._reset_data_digests()
+
+    def _reset_data_digests(self):
+        """Forgets the digests of the site data, which may have changed"""
+        self._data_digest = None
+        self._shared_data_digest = None
+        self._section_digests = {}
+
+    def _get_data_digest(self):
+        """Returns a digest of the site data used to validate staged files
+
+        The content fingerprint of the site data is used, so hosts are
+        streamed through rather than copied into a dictionary.
+        """
+        if self._data_digest is None:
+            self._data_digest = _digest(self.site_data.fingerprint())
+        return self._data_digest
+
+    def _get_shared_data_digest(self):
+        """Returns a digest of the site data outside of baremetal
+
+        This is combined with the digest of a single rack or host to key
+        the outputs of sharded templates.
+        """
+        if self._shared_data_digest is None:
+            self._shared_data_digest = _digest(
+                self.site_data.site_info.dict_from_class(),
+                self.site_data.site_info.region_name,
+                self.site_data.network.dict_from_class(),
+                self.site_data.storage)
+        return self._shared_data_digest
+
+    def _get_section_digest(self, sections):
+        """Returns a digest of some of the SITE_SECTIONS of the site data"""
+        sections = tuple(sorted(sections))
+        if sections not in self._section_digests:
+            values = []
+            for section in sections:
+                if section == 'site_info':
+                    values.append(self.site_data.site_info.dict_from_class())
+                    values.append(self.site_data.site_info.region_name)
+                elif section == 'network':
+                    values.append(self.site_data.network.dict_from_class())
+                else:
+                    values.append(self.site_data.storage)
+            self._section_digests[sections] = _digest(sections, *values)
+        return self._section_digests[sections]
+
+    def _get_template_data_digest(self, source):
+        """Returns a digest of the site data a template may use
+
+        :param source: template source
+        :rtype: str
+        """
+        environment = jinja2.Environment(autoescape=True)
+        try:
+            sections = find_data_sections(environment.parse(source))
+        except jinja2.TemplateSyntaxError:
+            sections = None
+        if sections is None or not sections.issubset(SITE_SECTIONS):
+            return self._get_data_digest()
+        return self._get_section_digest(sections)
+
+    def _get_outputs(self, source, rel_path, shard_by, template_sources):
+        """Lists the files to render from a template
+
+        Templates declaring a ``shard_by`` directive are rendered once per
+        rack or host into a directory named after the template, with the
+        ``data`` passed to the template narrowed to that rack or host.
+
+        :param source: template source
+        :param rel_path: output path of an unsharded template relative to
+                         the region's manifest directory
+        :param shard_by: value of the template's shard_by directive, if any
+        :param template_sources: sources of the template and of the
+                                 templates it references, from
+                                 ``get_template_sources``. If None, the
+                                 outputs have no key and are always rendered.
+        :return: list of outputs
+        :rtype: list of _Output
+        """
+        if shard_by is None:
+            return [
+                _Output(
+                    rel_path, self.site_data,
+                    None if template_sources is None else _digest(
+                        template_sources,
+                        self._get_template_data_digest(source)))
+            ]
+        if shard_by not in SHARD_KEYS:
+            raise ValueError(
+                'Unsupported shard_by value {} in template for {}, expected '
+                'one of {}'.format(shard_by, rel_path, ', '.join(SHARD_KEYS)))
+
+        shard_dir, ext = os.path.splitext(rel_path)
+        shared_digest = self._get_shared_data_digest()
+        outputs = []
+        for rack in self.site_data.baremetal:
+            if self.racks is not None and rack.name not in self.racks:
+                continue
+            if shard_by == 'rack':
+                shards = [(rack.name, rack)]
+            else:
+                # Host shards keep the networks local to their rack
+                networks = list(rack.networks.values())
+                shards = [
+                    (host.name, Rack(rack.name, [host], networks))
+                    for host in rack.hosts
+                ]
+            for shard_name, shard_rack in shards:
+                outputs.append(
+                    _Output(
+                        os.path.join(shard_dir, shard_name + ext),
+                        self.site_data.narrow([shard_rack]),
+                        None if template_sources is None else _digest(
+                            template_sources, shared_digest,
+                            shard_rack.fingerprint())))
+        return outputs
+
+    @staticmethod
+    def _load_manifest_index(index_dir):
+        """Loads the index of files written to a manifest directory
+
+        :param index_dir: directory containing a region's manifests
+        :return: dictionary of relative file paths to index entries holding
+                 the SHA-256 digest of the file and the key of its inputs
+        :rtype: dict
+        """
+        index_file = os.path.join(index_dir, MANIFEST_INDEX_FILE)
+        if not os.path.isfile(index_file):
+            return {}
+        try:
+            with open(index_file, 'r') as f:
+                index = json.load(f)
+        except ValueError:
+            LOG.warning(
+                "Ignoring unreadable manifest index: {}".format(index_file))
+            return {}
+        for rel_path, entry in index.items():
+            if not isinstance(entry, dict):
+                index[rel_path] = {'sha256': entry, 'source': None}
+        return index
+
+    @staticmethod
+    def _write_manifest_index(index_dir, index):
+        if not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        index_file = os.path.join(index_dir, MANIFEST_INDEX_FILE)
+        with open(index_file, 'w') as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+
+    def _prepare_staging_dir(self, region_manifest_dir, staging_dir):
+        """Creates the staging directory for a region's manifests
+
+        A previous manifest directory left behind by an interrupted swap is
+        restored first. Files staged by a failed run are kept only when
+        resuming.
+
+        :return: index of the files that may be reused from the staging dir
+        :rtype: dict
+        """
+        backup_dir = region_manifest_dir + BACKUP_DIR_SUFFIX
+        if os.path.isdir(backup_dir):
+            if os.path.isdir(region_manifest_dir):
+                shutil.rmtree(backup_dir)
+            else:
+                LOG.warning(
+                    "Restoring manifests from interrupted run: {}".format(
+                        backup_dir))
+                os.rename(backup_dir, region_manifest_dir)
+
+        staged_index = {}
+        if os.path.isdir(staging_dir):
+            if self.resume:
+                staged_index = self._load_manifest_index(staging_dir)
+                LOG.info(
+                    "Resuming from {} staged files".format(len(staged_index)))
+            else:
+                shutil.rmtree(staging_dir)
+        if not os.path.isdir(staging_dir):
+            os.makedirs(staging_dir)
+        return staged_index
+
+    @staticmethod
+    def _carry_over_unmanaged_files(
+            region_manifest_dir, staging_dir, previous_index, index):
+        """Links files not written by Spyglass into the staging directory
+
+        Anything placed in the manifest directory by hand survives the swap.
+        Files listed in the previous index that were not rendered again are
+        left behind and so removed by the swap.
+
+        :return: number of previously rendered files that were dropped
+        :rtype: int
+        """
+        for dirpath, dirs, files in os.walk(region_manifest_dir):
+            for filename in files:
+                live_file = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(live_file, region_manifest_dir)
+                if rel_path == MANIFEST_INDEX_FILE or rel_path in index \
+                        or rel_path in previous_index:
+                    continue
+                _link_or_copy(live_file, os.path.join(staging_dir, rel_path))
+
+        removed = 0
+        for rel_path in sorted(set(previous_index) - set(index)):
+            if os.path.isfile(os.path.join(region_manifest_dir, rel_path)):
+                LOG.info("Removing stale manifest {}".format(rel_path))
+                removed += 1
+        return removed
+
+    @staticmethod
+    def _carry_over_previous_files(
+            region_manifest_dir, staging_dir, previous_index, index):
+        """Keeps the files of the previous run that were not rendered again
+
+        Used when rendering is limited to some racks, the kept files are
+        linked into the staging directory and added to the index.
+        """
+        for rel_path, entry in previous_index.items():
+            live_file = os.path.join(region_manifest_dir, rel_path)
+            if rel_path in index or not os.path.isfile(live_file):
+                continue
+            _link_or_copy(live_file, os.path.join(staging_dir, rel_path))
+            index[rel_path] = entry
+
+    @staticmethod
+    def _swap_staging_dir(region_manifest_dir, staging_dir):
+        """Moves the staging directory into place as the region's manifests
+
+        Both directories are on the same filesystem, so each step is an
+        atomic rename and the previous manifests are only deleted once the
+        staged ones are in place.
+        """
+        backup_dir = region_manifest_dir + BACKUP_DIR_SUFFIX
+        if os.path.isdir(region_manifest_dir):
+            os.rename(region_manifest_dir, backup_dir)
+        os.rename(staging_dir, region_manifest_dir)
+        if os.path.isdir(backup_dir):
+            shutil.rmtree(backup_dir)
+
+    @staticmethod
+    def _stream_template(template_j2, data, outfile):
+        """Renders a template to a file one chunk at a time
+
+        Chunks produced by ``Template.generate`` are hashed and written
+        through a buffered writer as they are produced, so the full output
+        is never held in memory. A partially written file is removed if
+        rendering fails.
+
+        :param template_j2: Jinja2 template to render
+        :param data: site data passed to the template
+        :param outfile: path of the file to write
+        :return: SHA-256 hex digest of the rendered content
+        :rtype: str
+        """
+        # The staged file may be a hard link to the live manifest, which
+        # must not be truncated
+        if os.path.lexists(outfile):
+            os.remove(outfile)
+        digest = hashlib.sha256()
+        try:
+            with open(outfile, "wb", buffering=WRITE_BUFFER_SIZE) as out:
+                for chunk in template_j2.generate(data=data):
+                    encoded = chunk.encode('utf-8')
+                    digest.update(encoded)
+                    out.write(encoded)
+        except Exception:
+            if os.path.exists(outfile):
+                os.remove(outfile)
+            raise
+        return digest.hexdigest()
+
+    def _render_output(
+            self, template_j2, output, staging_dir, region_manifest_dir,
+            staged_index, previous_index, reuse_unchanged):
+        """Renders a single output file into the staging directory
+
+        A file staged by a failed run is reused when resuming if its inputs
+        are unchanged. When ``reuse_unchanged`` is set, the live file is also
+        reused without rendering if its inputs are unchanged since the
+        previous run.
+
+        :return: digests of the staged file and of the live file
+        :rtype: tuple
+        """
+        outfile = os.path.join(staging_dir, output.rel_path)
+        live_file = os.path.join(region_manifest_dir, output.rel_path)
+        LOG.debug("outfile: %s", live_file)
+        outfile_dir = os.path.dirname(outfile)
+        if not os.path.exists(outfile_dir):
+            os.makedirs(outfile_dir, exist_ok=True)
+        live_digest = _file_digest(live_file)
+
+        staged_entry = staged_index.get(output.rel_path)
+        if output.key is not None and staged_entry \
+                and staged_entry['source'] == output.key \
+                and staged_entry['sha256'] == _file_digest(outfile):
+            LOG.debug("Reusing staged file: %s", outfile)
+            return staged_entry['sha256'], live_digest
+
+        previous_entry = previous_index.get(output.rel_path)
+        if reuse_unchanged and output.key is not None and previous_entry \
+                and previous_entry['source'] == output.key \
+                and previous_entry['sha256'] == live_digest:
+            LOG.debug("Inputs unchanged, skipping: %s", live_file)
+            _link_or_copy(live_file, outfile)
+            return live_digest, live_digest
+
+        LOG.info("Rendering {}".format(output.rel_path))
+        digest = self._stream_template(template_j2, output.data, outfile)
+        if digest == live_digest:
+            _link_or_copy(live_file, outfile)
+        return digest, live_digest
+
+    @staticmethod
+    def _parse_templates(environment, template_dir):
+        """Parses every template in the template directory
+
+        :return: dictionary of template paths relative to template_dir to
+                 their ASTs
+        :rtype: dict
+        """
+        template_asts = {}
+        for dirpath, dirs, files in os.walk(template_dir):
+            for filename in files:
+                templatefile = os.path.join(dirpath, filename)
+                with open(templatefile, 'r') as f:
+                    template_ast = environment.parse(f.read())
+                template_asts[os.path.relpath(templatefile,
+                                              template_dir)] = template_ast
+        return template_asts
+
+    def get_template_dependencies(self, template_dir):
+        """Maps each template to the site data it references
+
+        :param template_dir: directory containing the J2 templates
+        :return: dictionary of template paths relative to template_dir to
+                 sorted lists of referenced paths, such as
+                 ``data.baremetal[].hosts[].ip.oob``
+        :rtype: dict
+        """
+        environment = jinja2.Environment(autoescape=True)
+        return {
+            rel_path: sorted(
+                format_path(path) for path in find_data_dependencies(
+                    template_ast, include_optional=True))
+            for rel_path, template_ast in self._parse_templates(
+                environment, template_dir).items()
+        }
+
+    def check_templates(self, template_dir):
+        """Checks that the site data defines everything the templates use
+
+        Each template is parsed once and every ``data`` path it references
+        is looked up in the site data without rendering, so all problems are
+        reported together before any file is written. Paths only used under
+        an ``if``, a test or ``and``/``or`` are not required.
+
+        :param template_dir: directory containing the J2 templates
+        :raises jinja2.UndefinedError: listing every undefined reference
+        """
+        start = time.time()
+        environment = jinja2.Environment(autoescape=True)
+        errors = []
+        template_asts = self._parse_templates(environment, template_dir)
+        for rel_path, template_ast in sorted(template_asts.items()):
+            for name in find_undeclared_names(environment, template_ast):
+                errors.append("{}: '{}' is undefined".format(rel_path, name))
+            for path in check_data_dependencies(
+                    environment, self.site_data,
+                    find_data_dependencies(template_ast)):
+                errors.append("{}: {} is undefined".format(rel_path, path))
+        LOG.info(
+            "Checked data for {} templates in {:.3f}s".format(
+                len(template_asts),
+                time.time() - start))
+        if errors:
+            for error in errors:
+                LOG.error(error)
+            raise jinja2.UndefinedError(
+                "Undefined data found in templates:\n{}".format(
+                    "\n".join(errors)))
 
     def render_template(self, template_dir):
         """The method  renders network config yaml from j2 templates.
@@ -41,6 +582,32 @@ class SiteProcessor(BaseProcessor):
         Network configs common to all racks (i.e oam, overlay, storage,
         calico) are generated in a single file. Rack specific
         configs( pxe and oob) are generated per rack.
+
+        Manifests are rendered into a staging directory next to the region's
+        manifest directory, which is swapped into place only once every
+        template has rendered successfully. On failure the previous
+        manifests are left untouched and the staged files are kept, so a run
+        with ``resume`` enabled can reuse those that are still valid.
+
+        Files whose rendered content matches the existing manifest are
+        linked rather than rewritten, so they keep their modification times.
+        Files produced by a previous run that no longer have a template are
+        removed.
+
+        Templates starting with a ``{# shard_by: rack #}`` or
+        ``{# shard_by: host #}`` directive are rendered once per rack or
+        host, and shards whose data is unchanged since the previous run are
+        not rendered again.
+
+        When the processor is limited to some racks, only the shards of those
+        racks are rendered. Every other file listed in the previous index is
+        kept as it is, including shards of hosts removed from those racks.
+
+        Unless writing is forced, the templates are checked for references
+        to undefined data before anything is written.
+
+        :return: counts of written, unchanged and removed files
+        :rtype: dict
         """
         # Check if manifest_dir exists
         if self.manifest_dir is not None:
@@ -49,6 +616,9 @@ class SiteProcessor(BaseProcessor):
         else:
             site_manifest_dir = os.path.join('pegleg_manifests', 'site')
         LOG.info("Site manifest output dir:{}".format(site_manifest_dir))
+        region_manifest_dir = os.path.join(
+            site_manifest_dir, self.site_data.site_info.region_name)
+        staging_dir = region_manifest_dir + STAGING_DIR_SUFFIX
 
         LOG.debug("Template Path: %s", template_dir)
 
@@ -59,9 +629,16 @@ class SiteProcessor(BaseProcessor):
             logging_undefined = \
                 jinja2.make_logging_undefined(LOG, base=jinja2.StrictUndefined)
 
+        if not self.force_write:
+            self.check_templates(template_dir)
+        self._reset_data_digests()
+
         template_folder_name = os.path.split(template_dir.rstrip(os.sep))[1]
-        created_file_list = []
-        created_dir_list = []
+        previous_index = self._load_manifest_index(region_manifest_dir)
+        staged_index = self._prepare_staging_dir(
+            region_manifest_dir, staging_dir)
+        index = {}
+        stats = {'written': 0, 'unchanged': 0, 'removed': 0}
 
         for dirpath, dirs, files in os.walk(template_dir):
             loader = jinja2.FileSystemLoader(dirpath)
@@ -77,34 +654,52 @@ class SiteProcessor(BaseProcessor):
                 outdirs = dirpath.split(template_folder_name)[1].lstrip(os.sep)
                 LOG.debug("outdirs: %s", outdirs)
 
-                outfile_path = os.path.join(
-                    site_manifest_dir, self.site_data.site_info.region_name,
-                    outdirs)
-                LOG.debug("outfile path: %s", outfile_path)
                 outfile_yaml = os.path.split(templatefile)[1]
                 outfile_yaml = os.path.splitext(outfile_yaml)[0]
-                outfile = os.path.join(outfile_path, outfile_yaml)
-                LOG.debug("outfile: %s", outfile)
-                outfile_dir = os.path.dirname(outfile)
-                if not os.path.exists(outfile_dir):
-                    os.makedirs(outfile_dir)
-                    created_dir_list.append(outfile_dir)
+                source = loader.get_source(j2_env, filename)[0]
+                shard_by = get_template_directives(source).get('shard_by')
+                if self.racks is not None and shard_by is None:
+                    continue
+                outputs = self._get_outputs(
+                    source, os.path.join(outdirs, outfile_yaml), shard_by,
+                    get_template_sources(j2_env, filename, source))
+                sharded = shard_by is not None
                 template_j2 = j2_env.get_template(filename)
                 try:
-                    out = open(outfile, "w")
-                    created_file_list.append(outfile)
-                    LOG.info("Rendering {}".format(outfile_yaml))
-                    rendered = template_j2.render(data=self.site_data)
-                    out.write(rendered)
-                    out.close()
+                    for output in outputs:
+                        digest, live_digest = self._render_output(
+                            template_j2, output, staging_dir,
+                            region_manifest_dir, staged_index, previous_index,
+                            sharded)
+                        index[output.rel_path] = {
+                            'sha256': digest,
+                            'source': output.key
+                        }
+                        if digest == live_digest:
+                            stats['unchanged'] += 1
+                        else:
+                            stats['written'] += 1
                 except IOError as ioe:
                     LOG.error(
                         "IOError during rendering:{}".format(outfile_yaml))
                     raise SystemExit(
                         "Error when generating {:s}:\n{:s}".format(
-                            outfile, ioe.strerror))
+                            ioe.filename or outfile_yaml, ioe.strerror))
                 except jinja2.UndefinedError as e:
-                    LOG.info('Undefined data found, rolling back changes...')
-                    out.close()
-                    shutil.rmtree(site_manifest_dir)
+                    LOG.info(
+                        'Undefined data found, keeping previous '
+                        'manifests in {}'.format(region_manifest_dir))
+                    self._write_manifest_index(staging_dir, index)
                     raise e
+
+        if self.racks is not None:
+            self._carry_over_previous_files(
+                region_manifest_dir, staging_dir, previous_index, index)
+        stats['removed'] = self._carry_over_unmanaged_files(
+            region_manifest_dir, staging_dir, previous_index, index)
+        self._write_manifest_index(staging_dir, index)
+        self._swap_staging_dir(region_manifest_dir, staging_dir)
+        LOG.info(
+            "Manifests written: {written}, unchanged: {unchanged}, "
+            "removed: {removed}".format(**stats))
+        return stats
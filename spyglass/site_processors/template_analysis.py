@@ -0,0 +1,272 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import logging
+
+import jinja2
+from jinja2 import meta
+from jinja2 import nodes
+
+LOG = logging.getLogger(__name__)
+
+# Name of the site data variable passed to templates
+DATA_VARIABLE = 'data'
+
+# Path step standing for every item of an iterated value
+ITEM = '[]'
+
+# Path step for a method called with constant arguments
+Call = collections.namedtuple('Call', ['name', 'args'])
+
+# Tests and filters that make a missing value acceptable
+_OPTIONAL_TESTS = ('defined', 'undefined', 'none')
+_OPTIONAL_FILTERS = ('default', 'd')
+
+# Nodes under which a missing value does not break rendering
+_GUARD_NODES = (nodes.If, nodes.CondExpr, nodes.Test, nodes.And, nodes.Or)
+
+
+def format_path(path):
+    """Formats a dependency path as written in a template
+
+    :param path: tuple of path steps
+    :return: the path as a string, e.g. ``data.baremetal[].hosts[].ip.oob``
+    :rtype: str
+    """
+    formatted = DATA_VARIABLE
+    for step in path:
+        if step == ITEM:
+            formatted += ITEM
+        elif isinstance(step, Call):
+            formatted += '.{}({})'.format(
+                step.name, ', '.join(repr(arg) for arg in step.args))
+        else:
+            formatted += '.{}'.format(step)
+    return formatted
+
+
+def _target_names(target):
+    """Returns the variable names bound by a loop or assignment target"""
+    if isinstance(target, nodes.Name):
+        return [target.name]
+    return [name.name for name in target.find_all(nodes.Name)]
+
+
+class _DependencyVisitor(object):
+    """Collects the paths into the site data used by a template AST
+
+    Loop variables and ``set`` assignments bound to site data are followed,
+    so ``host.ip.oob`` inside ``for host in rack.hosts`` is reported as
+    ``data.baremetal[].hosts[].ip.oob``.
+
+    Paths used under a guard, in an ``if`` statement or expression, a test
+    or either side of ``and``/``or``, are collected as optional: the
+    template may render without them.
+    """
+    def __init__(self):
+        self.paths = set()
+        self.optional_paths = set()
+
+    def path_of(self, node, scope):
+        """Returns the site data path of an expression, or None"""
+        if isinstance(node, nodes.Name):
+            return scope.get(node.name)
+        if isinstance(node, nodes.Getattr):
+            base = self.path_of(node.node, scope)
+            return None if base is None else base + (node.attr, )
+        if isinstance(node, nodes.Getitem):
+            base = self.path_of(node.node, scope)
+            if base is None or not isinstance(node.arg, nodes.Const):
+                return None
+            return base + (node.arg.value, )
+        if isinstance(node, nodes.Call) and \
+                isinstance(node.node, nodes.Getattr):
+            base = self.path_of(node.node.node, scope)
+            if base is None or node.kwargs or node.dyn_args or \
+                    node.dyn_kwargs or not all(
+                        isinstance(arg, nodes.Const) for arg in node.args):
+                return None
+            args = tuple(arg.value for arg in node.args)
+            return base + (Call(node.node.attr, args), )
+        return None
+
+    def visit(self, node, scope, optional=False):
+        if isinstance(node, nodes.For):
+            self.visit(node.iter, scope, optional)
+            iter_path = self.path_of(node.iter, scope)
+            body_scope = dict(scope)
+            for name in _target_names(node.target):
+                body_scope.pop(name, None)
+            if iter_path is not None and isinstance(node.target, nodes.Name):
+                body_scope[node.target.name] = iter_path + (ITEM, )
+            for child in node.body:
+                self.visit(child, body_scope, optional)
+            if node.test is not None:
+                self.visit(node.test, body_scope, True)
+            for child in node.else_:
+                self.visit(child, scope, optional)
+            return
+        if isinstance(node, nodes.Assign):
+            self.visit(node.node, scope, optional)
+            path = self.path_of(node.node, scope)
+            for name in _target_names(node.target):
+                scope.pop(name, None)
+            if path is not None and isinstance(node.target, nodes.Name):
+                scope[node.target.name] = path
+            return
+        if isinstance(node, nodes.Test) and node.name in _OPTIONAL_TESTS:
+            return
+        if isinstance(node, nodes.Filter) and node.name in _OPTIONAL_FILTERS:
+            for child in node.args:
+                self.visit(child, scope, optional)
+            return
+        if isinstance(node, _GUARD_NODES):
+            optional = True
+        path = self.path_of(node, scope)
+        if path:
+            if optional:
+                self.optional_paths.add(path)
+            else:
+                self.paths.add(path)
+        if isinstance(node, nodes.Call):
+            for child in node.args:
+                self.visit(child, scope, optional)
+            if path is not None:
+                return
+        elif path is not None:
+            return
+        for child in node.iter_child_nodes():
+            self.visit(child, scope, optional)
+
+
+def find_data_dependencies(template_ast, include_optional=False):
+    """Finds the site data paths referenced by a parsed template
+
+    :param template_ast: template AST from ``Environment.parse``
+    :param include_optional: whether to include paths only used under an
+                             ``if``, a test or ``and``/``or``, which may be
+                             missing without breaking the template
+    :return: set of paths, each a tuple of attribute names, item keys,
+             ``ITEM`` steps for iterated values and ``Call`` steps
+    :rtype: set
+    """
+    visitor = _DependencyVisitor()
+    visitor.visit(template_ast, {DATA_VARIABLE: ()})
+    if include_optional:
+        return visitor.paths | visitor.optional_paths
+    return visitor.paths
+
+
+def find_data_sections(template_ast):
+    """Finds the top level attributes of the site data a template uses
+
+    :param template_ast: template AST from ``Environment.parse``
+    :return: set of attribute names, such as ``site_info`` or ``baremetal``,
+             or None if the template may use the site data in other ways:
+             passing it whole, looking up a computed key or including other
+             templates
+    :rtype: set
+    """
+    if any(True
+           for _ in template_ast.find_all((nodes.Include, nodes.Import,
+                                           nodes.FromImport, nodes.Extends))):
+        return None
+    references = sum(
+        1 for name in template_ast.find_all(nodes.Name)
+        if name.name == DATA_VARIABLE)
+    sections = set()
+    for node in template_ast.find_all((nodes.Getattr, nodes.Getitem)):
+        if not isinstance(node.node, nodes.Name) or \
+                node.node.name != DATA_VARIABLE:
+            continue
+        if isinstance(node, nodes.Getattr):
+            sections.add(node.attr)
+        elif isinstance(node.arg, nodes.Const) and \
+                isinstance(node.arg.value, str):
+            sections.add(node.arg.value)
+        else:
+            return None
+        references -= 1
+    if references:
+        return None
+    return sections
+
+
+def find_undeclared_names(environment, template_ast):
+    """Finds variables a template uses that are never passed to it
+
+    :return: sorted list of variable names other than the site data
+    :rtype: list
+    """
+    undeclared = meta.find_undeclared_variables(template_ast)
+    return sorted(
+        name for name in undeclared
+        if name != DATA_VARIABLE and name not in environment.globals)
+
+
+def _step(environment, value, step):
+    """Follows a single path step the way a template would"""
+    if isinstance(step, Call):
+        method = environment.getattr(value, step.name)
+        if isinstance(method, jinja2.Undefined) or not callable(method):
+            return method
+        return method(*step.args)
+    if isinstance(step, str):
+        return environment.getattr(value, step)
+    return environment.getitem(value, step)
+
+
+def check_data_dependencies(environment, data, paths):
+    """Checks that the site data provides every path a template uses
+
+    Every item of an iterated value is checked, except that items of a type
+    already checked at the same step are skipped unless they are mappings,
+    as model objects of the same type always have the same attributes.
+
+    :param environment: Jinja2 environment used to look up attributes
+    :param data: site data passed to the template
+    :param paths: paths from ``find_data_dependencies``
+    :return: sorted list of the paths, as strings, that cannot be resolved
+    :rtype: list
+    """
+    missing = set()
+    for path in paths:
+        values = [data]
+        for depth, step in enumerate(path, 1):
+            next_values = []
+            seen_types = set()
+            for value in values:
+                if step == ITEM:
+                    if isinstance(value, (str, jinja2.Undefined)) or \
+                            not hasattr(value, '__iter__'):
+                        missing.add(format_path(path[:depth]))
+                        break
+                    for item in value:
+                        if not isinstance(item, dict):
+                            if type(item) in seen_types:
+                                continue
+                            seen_types.add(type(item))
+                        next_values.append(item)
+                    continue
+                result = _step(environment, value, step)
+                if isinstance(result, jinja2.Undefined):
+                    missing.add(format_path(path[:depth]))
+                    break
+                next_values.append(result)
+            else:
+                values = next_values
+                continue
+            break
+    return sorted(missing)
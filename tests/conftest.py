@@ -22,11 +22,23 @@ from spyglass.data_extractor.models import site_document_data_factory
 FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'shared')
 
 
-@pytest.fixture(scope='class')
-def site_document_data_objects(request):
+def _load_site_document_data():
+    """Returns new site data objects of the test intermediary"""
     with open(os.path.join(FIXTURE_DIR, 'test_intermediary.yaml'), 'r') as f:
         yaml_data = yaml.safe_load(f)
-    request.cls.site_document_data = site_document_data_factory(yaml_data)
+    return site_document_data_factory(yaml_data)
+
+
+@pytest.fixture(scope='class')
+def site_document_data_objects(request):
+    request.cls.site_document_data = _load_site_document_data()
+
+
+@pytest.fixture(scope='class')
+def site_document_data_loader(request):
+    """Lets tests load new site data objects they can change"""
+    request.cls.load_site_document_data = staticmethod(
+        _load_site_document_data)
 
 
 @pytest.fixture(scope='class')
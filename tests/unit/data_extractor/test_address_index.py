@@ -0,0 +1,139 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ipaddress
+import random
+import unittest
+
+from pytest import mark
+
+from spyglass.data_extractor.address_index import AddressIndex
+from spyglass.data_extractor.address_index import PrefixTrie
+from spyglass.data_extractor import models
+
+
+def _insert(trie, subnet, value=None):
+    network = ipaddress.ip_network(subnet)
+    trie.insert(
+        int(network.network_address), network.prefixlen, value or subnet)
+
+
+def _match(trie, address):
+    return trie.longest_match(int(ipaddress.ip_address(address)))
+
+
+class TestPrefixTrie(unittest.TestCase):
+    def test_longest_match(self):
+        trie = PrefixTrie(32)
+        for subnet in ('10.0.0.0/8', '10.1.0.0/16', '10.1.2.0/24',
+                       '10.1.2.128/25', '192.168.0.0/16', '10.1.2.7/32'):
+            _insert(trie, subnet)
+        self.assertEqual('10.1.2.128/25', _match(trie, '10.1.2.200'))
+        self.assertEqual('10.1.2.0/24', _match(trie, '10.1.2.1'))
+        self.assertEqual('10.1.2.7/32', _match(trie, '10.1.2.7'))
+        self.assertEqual('10.1.0.0/16', _match(trie, '10.1.3.1'))
+        self.assertEqual('10.0.0.0/8', _match(trie, '10.2.0.1'))
+        self.assertEqual('192.168.0.0/16', _match(trie, '192.168.7.7'))
+        self.assertIsNone(_match(trie, '11.0.0.1'))
+
+    def test_default_route(self):
+        trie = PrefixTrie(32)
+        _insert(trie, '10.1.0.0/16')
+        _insert(trie, '0.0.0.0/0')
+        self.assertEqual('0.0.0.0/0', _match(trie, '8.8.8.8'))
+        self.assertEqual('10.1.0.0/16', _match(trie, '10.1.0.1'))
+
+    def test_replace(self):
+        trie = PrefixTrie(32)
+        _insert(trie, '10.1.0.0/16', 'first')
+        _insert(trie, '10.1.0.0/16', 'second')
+        self.assertEqual('second', _match(trie, '10.1.0.1'))
+
+    def test_matches_linear_search(self):
+        """Tests the trie against a linear search of random subnets"""
+        rng = random.Random(42)
+        networks = set()
+        trie = PrefixTrie(32)
+        for _ in range(300):
+            length = rng.randint(8, 30)
+            host_bits = 32 - length
+            prefix = rng.getrandbits(32) >> host_bits << host_bits
+            network = ipaddress.ip_network((prefix, length))
+            networks.add(network)
+            _insert(trie, str(network))
+        for _ in range(2000):
+            address = ipaddress.ip_address(rng.getrandbits(32))
+            containing = [n for n in networks if address in n]
+            expected = str(max(containing, key=lambda n: n.prefixlen)) \
+                if containing else None
+            self.assertEqual(expected, _match(trie, str(address)))
+        # Every network address matches its own subnet or a longer one
+        for network in networks:
+            match = ipaddress.ip_network(
+                _match(trie, str(network.network_address)))
+            self.assertGreaterEqual(match.prefixlen, network.prefixlen)
+
+    def test_ipv6(self):
+        trie = PrefixTrie(128)
+        _insert(trie, '2001:db8::/32')
+        _insert(trie, '2001:db8:1::/48')
+        self.assertEqual('2001:db8:1::/48', _match(trie, '2001:db8:1::5'))
+        self.assertEqual('2001:db8::/32', _match(trie, '2001:db8:2::5'))
+        self.assertIsNone(_match(trie, '2001:db9::1'))
+
+
+@mark.usefixtures('site_document_data_loader')
+class TestAddressIndex(unittest.TestCase):
+    def setUp(self):
+        self.site_data = self.load_site_document_data()
+        self.index = AddressIndex(self.site_data)
+
+    def test_network_for(self):
+        self.assertEqual('oob', self.index.network_for('10.0.220.200').name)
+        self.assertEqual('oam', self.index.network_for('10.0.220.5').name)
+        self.assertEqual('pxe', self.index.network_for('30.30.5.1').name)
+        self.assertIsNone(self.index.network_for('10.0.221.1'))
+        self.assertIsNone(self.index.network_for('not an address'))
+
+    def test_host_for(self):
+        rack = self.site_data.baremetal[1]
+        host = rack.hosts[2]
+        result = self.index.host_for(host.ip.calico)
+        self.assertIs(rack, result.rack)
+        self.assertIs(host, result.host)
+        self.assertEqual('calico', result.role)
+        self.assertIsNone(self.index.host_for('30.29.1.126'))
+        self.assertIsNone(self.index.host_for(models.DATA_DEFAULT))
+
+    def test_in_network(self):
+        self.assertTrue(self.index.in_network('30.29.1.5', 'calico'))
+        self.assertFalse(self.index.in_network('30.29.1.5', 'storage'))
+        self.assertFalse(self.index.in_network('30.29.2.5', 'calico'))
+
+    def test_rack_networks(self):
+        rack = self.site_data.baremetal[1]
+        rack.networks['oob'] = models.VLANNetworkData(
+            'oob', subnet=['10.0.230.0/27'])
+        index = AddressIndex(self.site_data)
+        self.assertIs(rack.networks['oob'], index.network_for('10.0.230.5'))
+        self.assertEqual('oob', index.network_for('10.0.220.200').name)
+
+    def test_subnet_host_bits(self):
+        """Tests that subnets written with host bits set are indexed"""
+        rack = self.site_data.baremetal[1]
+        rack.networks['oob'] = models.VLANNetworkData(
+            'oob', subnet=['10.0.230.5/27'])
+        index = AddressIndex(self.site_data)
+        self.assertIs(rack.networks['oob'], index.network_for('10.0.230.31'))
+        self.assertIsNone(index.network_for('10.0.230.32'))
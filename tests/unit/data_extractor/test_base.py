@@ -34,12 +34,25 @@ class TestBaseDataSourcePlugin(unittest.TestCase):
         self.assertIsNone(self.instance.raw_data)
         self.assertIsNone(self.instance.data)
 
-    @mock.patch.object(
-        BaseDataSourcePlugin, 'parse_racks', return_value='success')
+    @mock.patch.object(BaseDataSourcePlugin, 'parse_racks')
     def test_parse_baremetal_information(self, mock_parse_racks):
+        racks = [models.Rack('rack01', []), models.Rack('rack02', [])]
+        mock_parse_racks.return_value = racks
         result = self.instance.parse_baremetal_information()
-        self.assertEqual('success', result)
+        self.assertEqual(racks, result)
         mock_parse_racks.assert_called_once()
+        self.assertDictEqual({}, result[0].networks)
+
+    @mock.patch.object(BaseDataSourcePlugin, 'parse_rack_networks')
+    @mock.patch.object(BaseDataSourcePlugin, 'parse_racks')
+    def test_parse_baremetal_information_rack_networks(
+            self, mock_parse_racks, mock_parse_rack_networks):
+        oob = models.VLANNetworkData('oob', subnet=['10.0.1.0/27'])
+        mock_parse_racks.return_value = [models.Rack('rack01', [])]
+        mock_parse_rack_networks.return_value = [oob]
+        result = self.instance.parse_baremetal_information()
+        mock_parse_rack_networks.assert_called_once_with('rack01')
+        self.assertDictEqual({'oob': oob}, result[0].networks)
 
     @mock.patch.object(
         BaseDataSourcePlugin, 'parse_dns_servers', return_value='1.1.1.1')
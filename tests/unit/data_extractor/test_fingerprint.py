@@ -0,0 +1,106 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import unittest
+from unittest import mock
+
+from pytest import mark
+
+from spyglass.data_extractor import fingerprint
+from spyglass.data_extractor import models
+
+
+@mark.usefixtures('site_document_data_loader')
+class TestFingerprint(unittest.TestCase):
+    def setUp(self):
+        self.site_data = self.load_site_document_data()
+        self.rack = self.site_data.baremetal[0]
+        self.host = self.rack.hosts[0]
+
+    def test_algorithm(self):
+        """Tests the documented algorithm on the address of an IPList"""
+        ip_list = models.IPList(
+            oob='10.0.220.140',
+            oam='',
+            calico='',
+            overlay='',
+            pxe='#CHANGE_ME',
+            storage='')
+        expected = hashlib.sha256(
+            b'[1,"ip_list",{"oob":[4,167828620],"pxe":"#CHANGE_ME"}]'
+        ).hexdigest()
+        self.assertEqual(expected, ip_list.fingerprint())
+
+    def test_equal_content(self):
+        other = self.load_site_document_data()
+        other.baremetal.reverse()
+        other.baremetal[0].hosts.reverse()
+        self.assertEqual(self.site_data.fingerprint(), other.fingerprint())
+
+    def test_changes(self):
+        site_fingerprint = self.site_data.fingerprint()
+        rack_fingerprint = self.rack.fingerprint()
+        other_rack_fingerprint = self.site_data.baremetal[1].fingerprint()
+
+        self.host.ip.oob = '10.0.220.150'
+        self.assertNotEqual(rack_fingerprint, self.rack.fingerprint())
+        self.assertNotEqual(site_fingerprint, self.site_data.fingerprint())
+        self.assertEqual(
+            other_rack_fingerprint, self.site_data.baremetal[1].fingerprint())
+
+        self.host.ip.oob = '10.0.220.140'
+        self.assertEqual(rack_fingerprint, self.rack.fingerprint())
+        self.assertEqual(site_fingerprint, self.site_data.fingerprint())
+
+    def test_structure_changes(self):
+        site_fingerprint = self.site_data.fingerprint()
+        host = self.rack.hosts.pop()
+        self.assertNotEqual(site_fingerprint, self.site_data.fingerprint())
+        self.rack.hosts.append(host)
+        self.assertEqual(site_fingerprint, self.site_data.fingerprint())
+
+    def test_site_level_changes(self):
+        site_fingerprint = self.site_data.fingerprint()
+        self.site_data.network.bgp['asnumber'] = 64000
+        self.assertNotEqual(site_fingerprint, self.site_data.fingerprint())
+        del self.site_data.network.bgp['asnumber']
+        self.site_data.network.vlan_network_data[0].set_subnet_ranges(
+            '10.0.230.0/24', gateway='10.0.230.1')
+        self.assertNotEqual(site_fingerprint, self.site_data.fingerprint())
+
+    def test_only_changed_objects_rehashed(self):
+        self.site_data.fingerprint()
+        self.host.type = 'compute_new'
+        with mock.patch.object(fingerprint, 'content_hash',
+                               wraps=fingerprint.content_hash) as hashed:
+            self.site_data.fingerprint()
+        self.assertCountEqual(
+            ['host', 'rack', 'site_info', 'network', 'site'],
+            [call[0][0] for call in hashed.call_args_list])
+
+    def test_touch(self):
+        vlan_data = self.site_data.network.vlan_network_data[0]
+        site_fingerprint = self.site_data.fingerprint()
+        vlan_data.routes.append('10.0.0.0/8')
+        self.assertEqual(site_fingerprint, self.site_data.fingerprint())
+        vlan_data.touch()
+        self.assertNotEqual(site_fingerprint, self.site_data.fingerprint())
+
+    def test_narrow(self):
+        view = self.site_data.narrow([self.rack])
+        view_fingerprint = view.fingerprint()
+        self.site_data.fingerprint()
+        self.host.host_profile = 'cp-r740'
+        self.assertNotEqual(view_fingerprint, view.fingerprint())
@@ -0,0 +1,437 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pytest import mark
+import yaml
+
+from spyglass.data_extractor import intermediary_file
+from spyglass.data_extractor import models
+
+FIXTURE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'shared')
+
+
+@mark.usefixtures('site_document_data_loader')
+class TestIntermediaryFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'test_intermediary.yaml')
+        self.intermediary = self.load_site_document_data().dict_from_class()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read(self):
+        with open(self.path, 'r') as f:
+            return f.read()
+
+    def test_write_intermediary(self):
+        intermediary_file.write_intermediary(self.intermediary, self.path)
+        self.assertEqual(
+            yaml.dump(self.intermediary, default_flow_style=False),
+            self._read())
+        self.assertFalse(
+            os.path.exists(intermediary_file.index_path(self.path)))
+
+    def test_write_intermediary_index(self):
+        intermediary_file.write_intermediary(
+            self.intermediary, self.path, index=True)
+        content = self._read()
+        self.assertEqual(
+            yaml.dump(self.intermediary, default_flow_style=False), content)
+
+        index = intermediary_file.read_index(self.path)
+        self.assertEqual(sorted(self.intermediary), sorted(index['sections']))
+        self.assertEqual(['rack72', 'rack73'], sorted(index['racks']))
+        rack = index['racks']['rack73']
+        self.assertTrue(content[rack['offset']:].startswith('  rack73:\n'))
+        baremetal = index['sections']['baremetal']
+        self.assertEqual(
+            sum(entry['length']
+                for entry in index['racks'].values()) + len('baremetal:\n'),
+            baremetal['length'])
+
+    def test_write_intermediary_index_empty_baremetal(self):
+        self.intermediary['baremetal'] = {}
+        intermediary_file.write_intermediary(
+            self.intermediary, self.path, index=True)
+        self.assertEqual(
+            yaml.dump(self.intermediary, default_flow_style=False),
+            self._read())
+        self.assertEqual(
+            self.intermediary, intermediary_file.load_intermediary(self.path))
+
+    def test_load_intermediary(self):
+        intermediary_file.write_intermediary(
+            self.intermediary, self.path, index=True)
+        self.assertEqual(
+            self.intermediary, intermediary_file.load_intermediary(self.path))
+
+        loaded = intermediary_file.load_intermediary(
+            self.path, sections={'baremetal', 'region_name'}, racks={'rack73'})
+        self.assertEqual(
+            {
+                'baremetal': {
+                    'rack73': self.intermediary['baremetal']['rack73']
+                },
+                'region_name': 'test'
+            }, loaded)
+
+    def test_load_intermediary_reads_only_requested_blocks(self):
+        intermediary_file.write_intermediary(
+            self.intermediary, self.path, index=True)
+        with mock.patch.object(intermediary_file.yaml, 'load',
+                               wraps=yaml.load) as mock_load:
+            intermediary_file.load_intermediary(
+                self.path, sections={'baremetal'}, racks={'rack72'})
+        self.assertEqual(1, mock_load.call_count)
+        text = mock_load.call_args[0][0]
+        self.assertIn('rack72:', text)
+        self.assertNotIn('rack73:', text)
+
+    def test_load_intermediary_stale_index(self):
+        intermediary_file.write_intermediary(
+            self.intermediary, self.path, index=True)
+        changed = copy.deepcopy(self.intermediary)
+        changed['baremetal']['rack72']['cab2r72c12']['ip']['oob'] = \
+            '10.0.220.150'
+        intermediary_file.write_intermediary(changed, self.path)
+
+        self.assertIsNone(intermediary_file.read_index(self.path))
+        self.assertEqual(
+            {'rack72': changed['baremetal']['rack72']},
+            intermediary_file.load_intermediary(self.path,
+                                                racks={'rack72'})['baremetal'])
+
+    def test_read_index_missing(self):
+        intermediary_file.write_intermediary(self.intermediary, self.path)
+        self.assertIsNone(intermediary_file.read_index(self.path))
+
+    def test_changed_racks(self):
+        old_path = os.path.join(self.tmp_dir, 'old.yaml')
+        intermediary_file.write_intermediary(
+            self.intermediary, old_path, index=True)
+        changed = copy.deepcopy(self.intermediary)
+        changed['baremetal']['rack72']['cab2r72c12']['ip']['oob'] = \
+            '10.0.220.150'
+        changed['baremetal']['rack74'] = changed['baremetal'].pop('rack73')
+        intermediary_file.write_intermediary(changed, self.path, index=True)
+        self.assertEqual(
+            {'rack72', 'rack73', 'rack74'},
+            intermediary_file.changed_racks(
+                intermediary_file.read_index(old_path),
+                intermediary_file.read_index(self.path)))
+
+    def test_scan_index(self):
+        intermediary_file.write_intermediary(
+            self.intermediary, self.path, index=True)
+        self.assertEqual(
+            intermediary_file.read_index(self.path),
+            intermediary_file.scan_index(self.path))
+
+        self.intermediary['baremetal'] = {}
+        intermediary_file.write_intermediary(
+            self.intermediary, self.path, index=True)
+        self.assertEqual(
+            intermediary_file.read_index(self.path),
+            intermediary_file.scan_index(self.path))
+
+    def test_scan_index_unrecognised(self):
+        content = yaml.dump(self.intermediary, default_flow_style=False)
+        for text in ('# comment\n' + content,
+                     content.replace('  rack73:\n', '  rack73: {}\n  x:\n'),
+                     yaml.dump(self.intermediary, default_flow_style=True)):
+            with open(self.path, 'w') as f:
+                f.write(text)
+            self.assertIsNone(intermediary_file.scan_index(self.path))
+
+    def test_load_changed_racks(self):
+        old_path = os.path.join(self.tmp_dir, 'old.yaml')
+        intermediary_file.write_intermediary(self.intermediary, old_path)
+        changed = copy.deepcopy(self.intermediary)
+        changed['baremetal']['rack72']['cab2r72c12']['ip']['oob'] = \
+            '10.0.220.150'
+        intermediary_file.write_intermediary(changed, self.path)
+        old, new = intermediary_file.load_changed_racks(old_path, self.path)
+        self.assertEqual(['rack72'], list(old['baremetal']))
+        self.assertEqual(
+            changed['baremetal']['rack72'], new['baremetal']['rack72'])
+        self.assertEqual(changed['network'], new['network'])
+
+        # Files with another layout are compared as data
+        with open(old_path, 'w') as f:
+            f.write('# comment\n')
+            f.write(yaml.dump(self.intermediary, default_flow_style=False))
+        with self.assertLogs(intermediary_file.LOG, 'WARNING'):
+            old, new = intermediary_file.load_changed_racks(
+                old_path, self.path)
+        self.assertEqual(['rack72'], list(old['baremetal']))
+        self.assertEqual(['rack72'], list(new['baremetal']))
+
+    def test_drop_unchanged_racks(self):
+        changed = copy.deepcopy(self.intermediary)
+        changed['baremetal']['rack74'] = changed['baremetal'].pop('rack73')
+        self.assertEqual(
+            {'rack73', 'rack74'},
+            intermediary_file.drop_unchanged_racks(self.intermediary, changed))
+        self.assertEqual(['rack73'], list(self.intermediary['baremetal']))
+        self.assertEqual(['rack74'], list(changed['baremetal']))
+
+
+@mark.usefixtures('site_document_data_loader')
+class TestIntermediaryDir(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'test_intermediary')
+        self.intermediary = self.load_site_document_data().dict_from_class()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write_intermediary_dir(self):
+        stats = intermediary_file.write_intermediary_dir(
+            self.intermediary, self.path)
+        self.assertEqual({'written': 3, 'removed': 0}, stats)
+        self.assertEqual(
+            ['rack72.yaml', 'rack73.yaml'],
+            sorted(os.listdir(os.path.join(self.path, 'racks'))))
+        with open(os.path.join(self.path, 'site.yaml'), 'r') as f:
+            header = yaml.safe_load(f)
+        self.assertNotIn('baremetal', header)
+        self.assertEqual(self.intermediary['network'], header['network'])
+        with open(intermediary_file.rack_file(self.path, 'rack72')) as f:
+            self.assertEqual(
+                self.intermediary['baremetal']['rack72'], yaml.safe_load(f))
+
+    def test_write_intermediary_dir_changed_rack(self):
+        intermediary_file.write_intermediary_dir(self.intermediary, self.path)
+        self.assertEqual(
+            {
+                'written': 0,
+                'removed': 0
+            },
+            intermediary_file.write_intermediary_dir(
+                self.intermediary, self.path))
+
+        self.intermediary['baremetal']['rack72']['cab2r72c12']['ip'][
+            'oob'] = '10.0.220.150'
+        self.intermediary['baremetal']['rack74'] = \
+            self.intermediary['baremetal'].pop('rack73')
+        with mock.patch.object(intermediary_file, '_write_if_changed',
+                               wraps=intermediary_file._write_if_changed) \
+                as mock_write:
+            stats = intermediary_file.write_intermediary_dir(
+                self.intermediary, self.path)
+        self.assertEqual({'written': 2, 'removed': 1}, stats)
+        self.assertEqual(3, mock_write.call_count)
+        self.assertEqual(
+            ['rack72.yaml', 'rack74.yaml'],
+            sorted(os.listdir(os.path.join(self.path, 'racks'))))
+
+    def test_write_intermediary_dir_racks(self):
+        intermediary_file.write_intermediary_dir(self.intermediary, self.path)
+        self.intermediary['baremetal']['rack72']['cab2r72c12']['ip'][
+            'oob'] = '10.0.220.150'
+        del self.intermediary['baremetal']['rack73']
+        self.assertEqual(
+            {
+                'written': 1,
+                'removed': 0
+            },
+            intermediary_file.write_intermediary_dir(
+                self.intermediary, self.path, racks={'rack72'}))
+        self.assertEqual(
+            ['rack72.yaml', 'rack73.yaml'],
+            sorted(os.listdir(os.path.join(self.path, 'racks'))))
+
+    def test_load_intermediary_dir(self):
+        intermediary_file.write_intermediary_dir(self.intermediary, self.path)
+        self.assertEqual(
+            self.intermediary, intermediary_file.load_intermediary(self.path))
+        self.assertEqual(
+            {
+                'baremetal': {
+                    'rack73': self.intermediary['baremetal']['rack73']
+                },
+                'region_name': 'test'
+            },
+            intermediary_file.load_intermediary(
+                self.path,
+                sections={'baremetal', 'region_name'},
+                racks={'rack73'}))
+        self.assertEqual(
+            {'storage': self.intermediary['storage']},
+            intermediary_file.load_intermediary(
+                self.path, sections={'storage'}))
+
+    def test_load_intermediary_dir_empty_baremetal(self):
+        self.intermediary['baremetal'] = {}
+        intermediary_file.write_intermediary_dir(self.intermediary, self.path)
+        self.assertEqual(
+            self.intermediary, intermediary_file.load_intermediary(self.path))
+
+    def test_load_changed_racks(self):
+        intermediary_file.write_intermediary_dir(self.intermediary, self.path)
+        changed = copy.deepcopy(self.intermediary)
+        changed['baremetal']['rack73']['cab2r73c12']['ip']['oob'] = \
+            '10.0.220.150'
+        new_path = os.path.join(self.tmp_dir, 'new')
+        intermediary_file.write_intermediary_dir(changed, new_path)
+        old, new = intermediary_file.load_changed_racks(self.path, new_path)
+        self.assertEqual(['rack73'], list(old['baremetal']))
+        self.assertEqual(
+            changed['baremetal']['rack73'], new['baremetal']['rack73'])
+        self.assertEqual(changed['site_info'], new['site_info'])
+
+    def test_write_intermediary_dir_rack_names(self):
+        baremetal = self.intermediary['baremetal']
+        baremetal['../../x'] = baremetal.pop('rack72')
+        baremetal[101] = baremetal.pop('rack73')
+        baremetal['.hidden%'] = {}
+        intermediary_file.write_intermediary_dir(self.intermediary, self.path)
+        self.assertEqual(
+            ['%2E.%2F..%2Fx.yaml', '%2Ehidden%25.yaml', '101.yaml'],
+            sorted(os.listdir(os.path.join(self.path, 'racks'))))
+        self.assertEqual(['racks', 'site.yaml'], sorted(os.listdir(self.path)))
+        self.assertEqual(['test_intermediary'], os.listdir(self.tmp_dir))
+
+        # Rack names are read back from the file names, as strings
+        loaded = intermediary_file.load_intermediary(self.path)
+        self.assertEqual(
+            ['../../x', '.hidden%', '101'], sorted(loaded['baremetal']))
+        self.assertEqual(baremetal['../../x'], loaded['baremetal']['../../x'])
+
+        # Files of racks no longer in the intermediary are still removed
+        del baremetal['../../x']
+        stats = intermediary_file.write_intermediary_dir(
+            self.intermediary, self.path)
+        self.assertEqual(1, stats['removed'])
+
+    def test_site_document_data_factory(self):
+        intermediary_file.write_intermediary_dir(self.intermediary, self.path)
+        site_data = models.site_document_data_factory(self.path)
+        self.assertEqual(self.intermediary, site_data.dict_from_class())
+
+
+class TestEmitIntermediary(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(os.path.join(FIXTURE_DIR, 'test_intermediary.yaml'),
+                  'r') as f:
+            self.intermediary = yaml.safe_load(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _assert_emits_dump(self, site_data):
+        stream = io.StringIO()
+        intermediary_file.emit_intermediary(site_data, stream)
+        self.assertEqual(
+            yaml.dump(site_data.dict_from_class(), default_flow_style=False),
+            stream.getvalue())
+
+    def test_emit_intermediary(self):
+        for kwargs in ({}, {'lazy': False}, {'columnar': True}):
+            self._assert_emits_dump(
+                models.site_document_data_factory(
+                    copy.deepcopy(self.intermediary), **kwargs))
+
+    def test_emit_intermediary_quoted_values(self):
+        site_data = models.site_document_data_factory(self.intermediary)
+        rack72 = site_data.get_baremetal_rack_by_name('rack72')
+        rack72.hosts.extend(
+            [
+                models.Host(
+                    'host 1',
+                    type='yes',
+                    host_profile=None,
+                    ip=models.IPList(oob='fe80::1', pxe='10.0.220.150')),
+                models.Host(
+                    'host2', type='10', host_profile='p', ip=models.IPList()),
+                models.Host(
+                    'cab2r72c12',
+                    type='compute',
+                    host_profile='p',
+                    ip=models.IPList(
+                        oob='',
+                        oam='',
+                        calico='',
+                        overlay='',
+                        pxe='',
+                        storage='')),
+            ])
+        site_data.baremetal.append(models.Rack('empty', []))
+        self._assert_emits_dump(site_data)
+
+        site_data.baremetal.append(
+            models.Rack(
+                'rack 74', [
+                    models.Host(
+                        'host3',
+                        type='compute',
+                        host_profile='p',
+                        ip=models.IPList(oob='10.0.220.151'))
+                ]))
+        self._assert_emits_dump(site_data)
+
+    def test_emit_intermediary_empty_baremetal(self):
+        site_data = models.site_document_data_factory(self.intermediary)
+        site_data.baremetal = []
+        self._assert_emits_dump(site_data)
+
+    def test_is_plain(self):
+        for value in ('10.0.220.140', 'fe80::1', 'cab2r72c12', '-a',
+                      'x' * 122):
+            self.assertTrue(intermediary_file._is_plain(value), value)
+        for value in ('10', 'yes', 'null', '1.5', '10:20', '2019-01-01', '-',
+                      'a:', '#CHANGE_ME', 'a b', '---a', '...', 'x' * 123, ''):
+            self.assertFalse(intermediary_file._is_plain(value), value)
+
+    def test_write_intermediary_site_data(self):
+        site_data = models.site_document_data_factory(self.intermediary)
+        data_path = os.path.join(self.tmp_dir, 'data.yaml')
+        dict_path = os.path.join(self.tmp_dir, 'dict.yaml')
+        for index in (False, True):
+            intermediary_file.write_intermediary(
+                site_data, data_path, index=index)
+            intermediary_file.write_intermediary(
+                site_data.dict_from_class(), dict_path, index=index)
+            with open(data_path, 'r') as f, open(dict_path, 'r') as g:
+                self.assertEqual(g.read(), f.read())
+        with open(intermediary_file.index_path(data_path), 'r') as f, \
+                open(intermediary_file.index_path(dict_path), 'r') as g:
+            self.assertEqual(json.load(g), json.load(f))
+
+    def test_write_intermediary_dir_site_data(self):
+        site_data = models.site_document_data_factory(self.intermediary)
+        site_data.baremetal.append(models.Rack('empty', []))
+        data_dir = os.path.join(self.tmp_dir, 'data')
+        dict_dir = os.path.join(self.tmp_dir, 'dict')
+        intermediary_file.write_intermediary_dir(site_data, data_dir)
+        intermediary_file.write_intermediary_dir(
+            site_data.dict_from_class(), dict_dir)
+        for path in ('site.yaml', 'racks/empty.yaml', 'racks/rack72.yaml',
+                     'racks/rack73.yaml'):
+            with open(os.path.join(data_dir, path), 'r') as f, \
+                    open(os.path.join(dict_dir, path), 'r') as g:
+                self.assertEqual(g.read(), f.read())
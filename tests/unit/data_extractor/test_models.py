@@ -13,7 +13,9 @@
 # limitations under the License.
 
 from copy import copy
+import gc
 import os
+import tracemalloc
 import unittest
 from unittest import mock
 
@@ -28,6 +30,9 @@ FIXTURE_DIR = os.path.join(
 
 class TestParseIp(unittest.TestCase):
     """Tests the _parse_ip validator for Spyglass models"""
+    def setUp(self):
+        models._invalid_ips.clear()
+
     def test__parse_ip(self):
         """Tests basic function of _parse_ip validator"""
         addr = '10.23.0.1'
@@ -48,6 +53,58 @@ class TestParseIp(unittest.TestCase):
             self.assertIn(expected_message, test_log.output[0])
         self.assertEqual(addr, result)
 
+    def test__parse_ip_warns_once(self):
+        """Tests that an invalid address is only logged the first time"""
+        addr = 'not4nip4ddr3$$'
+        with self.assertLogs(level='WARNING') as test_log:
+            for _ in range(3):
+                self.assertEqual(addr, models._parse_ip(addr))
+            self.assertEqual(len(test_log.records), 1)
+        self.assertEqual(3, models._invalid_ips[addr])
+
+    def test__parse_ip_default(self):
+        """Tests that the placeholder value is not reported as invalid"""
+        with mock.patch.object(models, 'LOG') as mock_log:
+            result = models._parse_ip(models.DATA_DEFAULT)
+        self.assertEqual(models.DATA_DEFAULT, result)
+        mock_log.warning.assert_not_called()
+        self.assertEqual(0, len(models._invalid_ips))
+
+    def test_is_valid_ip(self):
+        """Tests validation of addresses, networks and non-string values"""
+        self.assertTrue(models.is_valid_ip('10.23.0.1'))
+        self.assertTrue(models.is_valid_ip('10.23.0.0/24'))
+        self.assertTrue(models.is_valid_ip('2001:db8::/64'))
+        self.assertFalse(models.is_valid_ip('10.23.0.1/24'))
+        self.assertFalse(models.is_valid_ip('10.23.0.256'))
+        self.assertFalse(models.is_valid_ip('dead.beef'))
+        self.assertFalse(models.is_valid_ip(''))
+        self.assertFalse(models.is_valid_ip(None))
+        self.assertFalse(models.is_valid_ip(['10.23.0.1']))
+
+    def test_is_valid_ip_cached(self):
+        """Tests that each string is only parsed once"""
+        models._is_valid_ip_str.cache_clear()
+        with mock.patch.object(models.ipaddress, 'ip_network') as mock_parse:
+            for _ in range(3):
+                models.is_valid_ip('10.23.0.2')
+            models.is_valid_ip('not-an-address')
+        mock_parse.assert_called_once_with('10.23.0.2')
+        models._is_valid_ip_str.cache_clear()
+
+    def test_log_invalid_ip_summary(self):
+        """Tests that repeated invalid addresses are summarised with counts"""
+        with self.assertLogs(level='WARNING'):
+            models._parse_ip('bad-one')
+            models._parse_ip('bad-one')
+            models._parse_ip('bad-two')
+        with self.assertLogs(level='WARNING') as test_log:
+            models.log_invalid_ip_summary()
+            self.assertEqual(len(test_log.records), 1)
+            self.assertIn('bad-one', test_log.output[0])
+            self.assertIn('seen 2 times', test_log.output[0])
+        self.assertEqual(0, len(models._invalid_ips))
+
 
 class TestServerList(unittest.TestCase):
     """Tests for the ServerList model"""
@@ -55,6 +112,9 @@ class TestServerList(unittest.TestCase):
     VALID_SERVERS = ['121.12.13.1', '193.153.1.1', '12.23.9.11']
     INVALID_SERVERS = ['not4nip4ddr3$$', '124.34.1.1', 'ALSONOTVALID']
 
+    def setUp(self):
+        models._invalid_ips.clear()
+
     def test___init__(self):
         """Tests basic initialization of ServerList"""
         result = models.ServerList(self.VALID_SERVERS)
@@ -147,6 +207,9 @@ class TestIPList(unittest.TestCase):
         'storage': '252.63.220.22'
     }
 
+    def setUp(self):
+        models._invalid_ips.clear()
+
     def test___init__(self):
         """Tests basic initialization of an IPList"""
         result = models.IPList(**self.VALID_IP)
@@ -270,6 +333,71 @@ class TestIPList(unittest.TestCase):
         self.assertEqual(self.MISSING_IP['pxe'], ip_list.pxe)
         self.assertEqual(self.MISSING_IP['storage'], ip_list.storage)
 
+    def test_packed(self):
+        """Tests that addresses are stored and compared as integers"""
+        ip_list = models.IPList(oob='10.0.0.2', oam='2001:db8::1')
+        self.assertEqual((4, 0x0A000002), ip_list.packed('oob'))
+        self.assertEqual((6, 0x20010DB8 << 96 | 1), ip_list.packed('oam'))
+        self.assertIsNone(ip_list.packed('calico'))
+        hosts = [
+            models.IPList(oob='10.0.0.10'),
+            models.IPList(oob='10.0.0.9'),
+            models.IPList(oob='9.255.255.255')
+        ]
+        self.assertEqual(
+            ['9.255.255.255', '10.0.0.9', '10.0.0.10'],
+            [ip.oob for ip in sorted(hosts, key=lambda i: i.packed('oob'))])
+
+    def test_render(self):
+        """Tests that addresses are rendered to text when read, not kept"""
+        ip_list = models.IPList(oob='10.0.0.2', oam='2001:db8::1')
+        self.assertEqual('10.0.0.2', ip_list.oob)
+        self.assertEqual('2001:db8::1', ip_list.oam)
+        self.assertEqual(models.DATA_DEFAULT, ip_list.calico)
+        self.assertIsNone(ip_list._other)
+        self.assertEqual(6 * models._IP_SLOT_SIZE, len(ip_list._packed))
+
+    def test_memory(self):
+        """Tests the memory held by the addresses of a host"""
+        count = 1000
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            ip_lists = [
+                models.IPList(
+                    *(
+                        '10.{}.{}.{}'.format(role, i // 250, i % 250)
+                        for role in range(6))) for i in range(count)
+            ]
+            for ip_list in ip_lists:
+                self.assertEqual(6, len(list(ip_list)))
+            # Validation caches are bounded and shared by all hosts
+            models._pack_ip_str.cache_clear()
+            models._is_valid_ip_str.cache_clear()
+            gc.collect()
+            per_host = (tracemalloc.get_traced_memory()[0] - before) / count
+        finally:
+            tracemalloc.stop()
+        # The object and its buffer, without the address strings
+        self.assertLess(per_host, 256)
+
+    def test_ipv6_text_preserved(self):
+        """Tests that an IPv6 address keeps the text it was given in"""
+        ip_list = models.IPList(oob='2001:DB8:0::1')
+        self.assertEqual('2001:DB8:0::1', ip_list.oob)
+        self.assertEqual((6, 0x20010DB8 << 96 | 1), ip_list.packed('oob'))
+
+    def test_set_non_address(self):
+        """Tests that values which are not addresses are kept as given"""
+        ip_list = models.IPList(oob='10.0.0.2')
+        ip_list.oob = '10.0.0.0/24'
+        self.assertEqual('10.0.0.0/24', ip_list.oob)
+        self.assertIsNone(ip_list.packed('oob'))
+        ip_list.oob = None
+        self.assertIsNone(ip_list.oob)
+        self.assertFalse(hasattr(ip_list, '__dict__'))
+
 
 class TestHost(unittest.TestCase):
     """Tests for the Host model"""
@@ -365,6 +493,14 @@ class TestRack(unittest.TestCase):
         result = models.Rack(self.RACK_NAME, self.hosts)
         self.assertEqual(self.RACK_NAME, result.name)
         self.assertEqual(self.hosts, result.hosts)
+        self.assertDictEqual({}, result.networks)
+
+    def test___init___networks(self):
+        """Tests that rack-level networks are indexed by name"""
+        oob = models.VLANNetworkData('oob', subnet=['10.0.1.0/27'])
+        pxe = models.VLANNetworkData('pxe', subnet=['10.0.2.0/25'])
+        result = models.Rack(self.RACK_NAME, self.hosts, [oob, pxe])
+        self.assertDictEqual({'oob': oob, 'pxe': pxe}, result.networks)
 
     def test_dict_from_class(self):
         """Tests production of a dictionary from a Rack object"""
@@ -419,6 +555,152 @@ class TestRack(unittest.TestCase):
             self.hosts[2],
             result.get_host_by_type('controller')[0])
 
+    def test_count_hosts_by_type(self):
+        result = models.Rack(self.RACK_NAME, self.hosts * 2)
+        self.assertEqual(
+            {
+                'genesis': 2,
+                'compute': 2,
+                'controller': 2
+            }, result.count_hosts_by_type())
+
+    def test_sorted_hosts(self):
+        hosts = [
+            models.Host('b', type='compute', ip=models.IPList(oob='10.0.0.2')),
+            models.Host('c', type='genesis', ip=models.IPList(oob='10.0.0.1')),
+            models.Host('a', type='controller', ip=models.IPList()),
+        ]
+        result = models.Rack(self.RACK_NAME, hosts)
+        self.assertEqual(
+            ['a', 'b', 'c'], [host.name for host in result.sorted_hosts()])
+        self.assertEqual(
+            ['b', 'a', 'c'],
+            [host.name for host in result.sorted_hosts('type')])
+        self.assertEqual(
+            ['c', 'b', 'a'],
+            [host.name for host in result.sorted_hosts('oob')])
+
+
+class TestHostStore(unittest.TestCase):
+    """Tests for the columnar HostStore and ColumnarRack"""
+    def setUp(self):
+        with open(os.path.join(FIXTURE_DIR, 'test_intermediary.yaml'),
+                  'r') as f:
+            self.intermediary_dict = yaml.safe_load(f)
+        self.site_data = models.site_document_data_factory(
+            self.intermediary_dict, columnar=True)
+        self.rack = self.site_data.baremetal[0]
+
+    def test_factory(self):
+        host_store = self.rack.host_store
+        self.assertIsInstance(host_store, models.HostStore)
+        self.assertEqual(12, len(host_store))
+        self.assertEqual(
+            ['rack72', 'rack73'], [rack.name for rack in host_store.racks])
+        objects = models.site_document_data_factory(self.intermediary_dict)
+        self.assertEqual(
+            objects.dict_from_class(), self.site_data.dict_from_class())
+        self.assertEqual(objects.fingerprint(), self.site_data.fingerprint())
+
+    def test_host_views(self):
+        host = self.rack.hosts[0]
+        self.assertIsInstance(host, models.Host)
+        self.assertEqual('cab2r72c12', host.name)
+        self.assertEqual('rack72', host.rack_name)
+        self.assertEqual('dp-r720', host.host_profile)
+        self.assertEqual('10.0.220.140', host.ip.oob)
+        self.assertEqual((4, 167828620), host.ip.packed('oob'))
+        self.assertEqual(host, self.rack.get_host_by_name('cab2r72c12'))
+        self.assertIsNone(self.rack.get_host_by_name('missing'))
+
+    def test_host_views_write_through(self):
+        fingerprint = self.site_data.fingerprint()
+        host = self.rack.hosts[0]
+        host.ip.oob = 'fd00::1'
+        host.type = 'genesis'
+        self.assertEqual('fd00::1', self.rack.hosts[0].ip.oob)
+        self.assertEqual(
+            (6, 0xfd00 << 112 | 1), self.rack.hosts[0].ip.packed('oob'))
+        self.assertEqual('genesis', self.rack.hosts[0].type)
+        self.assertNotEqual(fingerprint, self.site_data.fingerprint())
+
+        host.ip = models.IPList(oob='10.0.220.140')
+        self.assertEqual(models.DATA_DEFAULT, host.ip.pxe)
+        self.assertEqual('10.0.220.140', host.ip.oob)
+
+    def test_get_host_by_type(self):
+        self.assertEqual(
+            ['cab2r72c17'],
+            [host.name for host in self.rack.get_host_by_type('controller')])
+        self.assertEqual([], self.rack.get_host_by_type('missing'))
+        self.assertEqual(
+            len(self.site_data.get_baremetal_host_by_type('compute')),
+            self.site_data.count_hosts_by_type()['compute'])
+
+    def test_count_hosts_by_type(self):
+        objects = models.site_document_data_factory(self.intermediary_dict)
+        self.assertEqual(
+            objects.count_hosts_by_type(),
+            self.site_data.count_hosts_by_type())
+        self.assertEqual(
+            objects.baremetal[0].count_hosts_by_type(),
+            self.rack.count_hosts_by_type())
+
+    def test_sorted_hosts(self):
+        hosts = self.rack.hosts
+        hosts[0].ip.oob = models.DATA_DEFAULT
+        hosts[1].ip.oob = '10.0.220.100'
+        self.assertEqual(
+            [
+                'cab2r72c13', 'cab2r72c14', 'cab2r72c15', 'cab2r72c16',
+                'cab2r72c17', 'cab2r72c12'
+            ], [host.name for host in self.rack.sorted_hosts('oob')])
+        self.assertEqual(
+            sorted(host.name for host in hosts),
+            [host.name for host in self.rack.sorted_hosts()])
+
+    def test_add_hosts(self):
+        self.rack.hosts.append(
+            models.Host(
+                'new', type='compute', ip=models.IPList(oob='10.0.220.150')))
+        self.assertEqual(7, len(self.rack.hosts))
+        self.assertEqual('10.0.220.150', self.rack.hosts[-1].ip.oob)
+        self.assertEqual('new', self.rack.hosts[-1].name)
+
+        del self.rack.hosts[0]
+        self.assertEqual(6, len(self.rack.hosts))
+        self.assertEqual(12, len(self.rack.host_store))
+        self.assertEqual(
+            12, sum(self.site_data.count_hosts_by_type().values()))
+
+    def test_merge_additional_data(self):
+        self.site_data.merge_additional_data(
+            {
+                'baremetal': {
+                    'rack72': {
+                        'cab2r72c12': {
+                            'type': 'genesis',
+                            'ip': {
+                                'pxe': '172.30.0.10'
+                            }
+                        }
+                    },
+                    'rack74': {
+                        'cab2r74c12': {
+                            'host_profile': 'dp-r720',
+                            'type': 'compute'
+                        }
+                    }
+                }
+            })
+        host = self.rack.get_host_by_name('cab2r72c12')
+        self.assertEqual('genesis', host.type)
+        self.assertEqual('172.30.0.10', host.ip.pxe)
+        new_rack = self.site_data.get_baremetal_rack_by_name('rack74')
+        self.assertIsInstance(new_rack, models.ColumnarRack)
+        self.assertEqual(
+            ['cab2r74c12'], [host.name for host in new_rack.hosts])
+
 
 class TestVLANNetworkData(unittest.TestCase):
     """Tests for the VLANNetworkData model"""
@@ -514,6 +796,71 @@ class TestVLANNetworkData(unittest.TestCase):
             self.VLAN_DATA['reserved_start'], result.reserved_start)
         self.assertEqual(self.VLAN_DATA['reserved_end'], result.reserved_end)
 
+    def test_subnet_ranges(self):
+        """Tests the ranges of the first and additional subnets"""
+        result = models.VLANNetworkData(
+            'oob',
+            subnet=['10.0.0.0/27', '10.0.0.32/27'],
+            gateway='10.0.0.1',
+            subnet_ranges={'10.0.0.32/27': {
+                'gateway': '10.0.0.33'
+            }})
+        self.assertEqual(
+            '10.0.0.1',
+            result.get_subnet_ranges('10.0.0.0/27')['gateway'])
+        self.assertEqual(
+            '10.0.0.33',
+            result.get_subnet_ranges('10.0.0.32/27')['gateway'])
+        self.assertIsNone(
+            result.get_subnet_ranges('10.0.0.32/27')['static_start'])
+
+        result.set_subnet_ranges(
+            '10.0.0.0/27', static_start='10.0.0.11', static_end='10.0.0.30')
+        result.set_subnet_ranges(
+            '10.0.0.32/27', static_start='10.0.0.43', static_end='10.0.0.62')
+        self.assertEqual('10.0.0.11', result.static_start)
+        self.assertEqual('10.0.0.1', result.gateway)
+        self.assertDictEqual(
+            {
+                '10.0.0.32/27': {
+                    'gateway': '10.0.0.33',
+                    'static_start': '10.0.0.43',
+                    'static_end': '10.0.0.62'
+                }
+            },
+            result.dict_from_class()['oob']['subnet_ranges'])
+
+    def test_subnet_ranges_non_canonical(self):
+        """Tests that subnets are matched as networks, not as text"""
+        result = models.VLANNetworkData(
+            'storage',
+            subnet=['FD00::/64', 'FD00:0:0:1::/64'],
+            subnet_ranges={'fd00:0:0:1::/64': {
+                'gateway': 'fd00:0:0:1::1'
+            }})
+        result.set_subnet_ranges('fd00::/64', gateway='fd00::1')
+        result.set_subnet_ranges(
+            'fd00:0:0:1::/64', static_start='fd00:0:0:1::10')
+        self.assertEqual('fd00::1', result.gateway)
+        self.assertEqual(
+            {
+                'fd00:0:0:1::/64': {
+                    'gateway': 'fd00:0:0:1::1',
+                    'static_start': 'fd00:0:0:1::10'
+                }
+            }, result.subnet_ranges)
+        self.assertEqual(
+            'fd00::1',
+            result.get_subnet_ranges('FD00:0::/64')['gateway'])
+        self.assertEqual(
+            'fd00:0:0:1::10',
+            result.get_subnet_ranges('FD00:0:0:1::/64')['static_start'])
+
+    def test_dict_from_class_single_subnet(self):
+        """Tests that subnet_ranges is only written for additional subnets"""
+        result = models.VLANNetworkData(self.VLAN_NAME, **self.VLAN_DATA)
+        self.assertNotIn('subnet_ranges', result.dict_from_class()['oam'])
+
 
 class TestNetwork(unittest.TestCase):
     """Tests for the Network model"""
@@ -849,6 +1196,37 @@ class TestSiteDocumentData(unittest.TestCase):
         self.assertEqual(
             2, len(result.get_baremetal_host_by_type('controller')))
 
+    @mock.patch('spyglass.data_extractor.models.SiteInfo')
+    @mock.patch('spyglass.data_extractor.models.Network')
+    @mock.patch('spyglass.data_extractor.models.Rack')
+    def test_narrow(self, Rack, Network, SiteInfo):
+        """Tests narrowing site data to a subset of racks"""
+        site_info = SiteInfo()
+        network = Network()
+        baremetal = [Rack(), Rack()]
+        data = models.SiteDocumentData(
+            site_info, network, baremetal, self.STORAGE_DICT)
+        result = data.narrow(baremetal[1:])
+        self.assertEqual(baremetal[1:], result.baremetal)
+        self.assertIs(site_info, result.site_info)
+        self.assertIs(network, result.network)
+        self.assertIs(data.storage, result.storage)
+        self.assertEqual(2, len(data.baremetal))
+
+    @mock.patch('spyglass.data_extractor.models.AddressIndex')
+    @mock.patch('spyglass.data_extractor.models.SiteInfo')
+    @mock.patch('spyglass.data_extractor.models.Network')
+    def test_address_index(self, Network, SiteInfo, AddressIndex):
+        """Tests that the address index is built once, when first used"""
+        data = models.SiteDocumentData(SiteInfo(), Network(), [])
+        AddressIndex.assert_not_called()
+        self.assertIs(AddressIndex.return_value, data.address_index)
+        self.assertIs(AddressIndex.return_value, data.address_index)
+        AddressIndex.assert_called_once_with(data)
+        data.merge_additional_data({})
+        self.assertIs(AddressIndex.return_value, data.address_index)
+        self.assertEqual(2, AddressIndex.call_count)
+
 
 class TestValidateKeyInIntermediaryDict(unittest.TestCase):
     """Tests the _validate_key_in_intermediary_dict function"""
@@ -880,6 +1258,43 @@ class TestSiteDocumentDataFactory(unittest.TestCase):
         # Check correct return type
         self.assertIsInstance(site_document_data, models.SiteDocumentData)
 
+    def test_site_document_data_factory_rack_networks(self):
+        rack_networks = {
+            'rack73': {
+                'oob': {
+                    'subnet': ['10.0.230.0/27'],
+                    'gateway': '10.0.230.1'
+                }
+            }
+        }
+        self.intermediary_dict['network']['rack_vlan_network_data'] = \
+            rack_networks
+        site_document_data = models.site_document_data_factory(
+            self.intermediary_dict)
+        rack72 = site_document_data.get_baremetal_rack_by_name('rack72')
+        rack73 = site_document_data.get_baremetal_rack_by_name('rack73')
+        self.assertDictEqual({}, rack72.networks)
+        self.assertEqual(['10.0.230.0/27'], rack73.networks['oob'].subnet)
+        self.assertIs(
+            rack73.networks['oob'],
+            site_document_data.get_vlan_data_for_rack(rack73, 'oob'))
+        self.assertIs(
+            site_document_data.network.get_vlan_data_by_name('oob'),
+            site_document_data.get_vlan_data_for_rack(rack72, 'oob'))
+
+        # Rack-level networks are written back in the same place
+        document = site_document_data.dict_from_class()
+        self.assertDictEqual(
+            {
+                'rack73': {
+                    'oob': {
+                        'subnet': ['10.0.230.0/27'],
+                        'gateway': '10.0.230.1',
+                        'routes': []
+                    }
+                }
+            }, document['network']['rack_vlan_network_data'])
+
     def test_site_document_data_factory_saves_storage(self):
         site_document_data = models.site_document_data_factory(
             self.intermediary_dict)
@@ -988,3 +1403,68 @@ class TestSiteDocumentDataFactory(unittest.TestCase):
                 self.assertEqual(host_data['ip']['pxe'], host.ip.pxe)
                 self.assertEqual(host_data['ip']['storage'], host.ip.storage)
             self.assertEqual(rack_name, rack.name)
+
+    def test_site_document_data_factory_lazy(self):
+        site_document_data = models.site_document_data_factory(
+            self.intermediary_dict)
+        racks = site_document_data.baremetal
+        self.assertFalse(any(rack.materialized for rack in racks))
+        self.assertFalse(site_document_data.network.materialized)
+
+        # Site information is available without building any host
+        self.assertEqual('test', site_document_data.site_info.region_name)
+        self.assertFalse(any(rack.materialized for rack in racks))
+
+        # Hosts are built once, on first access
+        hosts = racks[0].hosts
+        self.assertIs(hosts, racks[0].hosts)
+        self.assertIsInstance(hosts[0], models.Host)
+        self.assertEqual('10.0.220.140', hosts[0].ip.oob)
+        self.assertFalse(racks[1].materialized)
+
+        self.assertIs(site_document_data, site_document_data.materialize_all())
+        self.assertTrue(all(rack.materialized for rack in racks))
+        self.assertTrue(site_document_data.network.materialized)
+        eager = models.site_document_data_factory(
+            self.intermediary_dict, lazy=False)
+        self.assertTrue(eager.baremetal[0].materialized)
+        self.assertEqual(
+            eager.dict_from_class(), site_document_data.dict_from_class())
+        self.assertEqual(eager.fingerprint(), site_document_data.fingerprint())
+
+    def test_site_document_data_factory_lazy_validation(self):
+        self.intermediary_dict['baremetal']['rack72']['cab2r72c12']['ip'][
+            'oob'] = 'not.an.ip'
+        models._invalid_ips.clear()
+        with mock.patch.object(models, 'LOG') as LOG:
+            site_document_data = models.site_document_data_factory(
+                self.intermediary_dict)
+            LOG.warning.assert_not_called()
+            site_document_data.materialize_all()
+            LOG.warning.assert_any_call(
+                '%s is not a valid IP address.', 'not.an.ip')
+
+    def test_lazy_rack_set_hosts(self):
+        rack = models.LazyRack(
+            'rack72', self.intermediary_dict['baremetal']['rack72'])
+        fingerprint = rack.fingerprint()
+        rack.hosts = [models.Host('new', ip=models.IPList())]
+        self.assertTrue(rack.materialized)
+        self.assertEqual(['new'], [host.name for host in rack.hosts])
+        self.assertNotEqual(fingerprint, rack.fingerprint())
+
+    def test_site_document_data_factory_does_not_change_intermediary(self):
+        site_document_data = models.site_document_data_factory(
+            self.intermediary_dict)
+        site_document_data.merge_additional_data(
+            {'site_info': {
+                'state': 'changed',
+                'ldap': {
+                    'url': 'changed'
+                }
+            }})
+        self.assertEqual('changed', site_document_data.site_info.ldap['url'])
+        self.assertNotEqual(
+            'changed', self.intermediary_dict['site_info']['state'])
+        self.assertNotEqual(
+            'changed', self.intermediary_dict['site_info']['ldap']['url'])
@@ -0,0 +1,39 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from spyglass.data_extractor.selectors import compile_patterns
+from spyglass import exceptions
+
+
+class TestCompilePatterns(unittest.TestCase):
+    def test_globs(self):
+        matcher = compile_patterns(['cab2r72c1*', 'cab2r73c1[67]'])
+        self.assertTrue(matcher.fullmatch('cab2r72c12'))
+        self.assertTrue(matcher.fullmatch('cab2r73c17'))
+        self.assertFalse(matcher.fullmatch('cab2r73c12'))
+        self.assertFalse(matcher.fullmatch('xcab2r72c12'))
+
+    def test_regex(self):
+        matcher = compile_patterns('/cab2r7[23]c1\\d/')
+        self.assertTrue(matcher.fullmatch('cab2r73c12'))
+        self.assertFalse(matcher.fullmatch('cab2r73c1'))
+
+    def test_no_patterns(self):
+        self.assertIsNone(compile_patterns([]))
+
+    def test_invalid_regex(self):
+        with self.assertRaises(exceptions.InvalidPattern):
+            compile_patterns(['rack*', '/rack[/'])
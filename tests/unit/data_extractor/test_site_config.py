@@ -0,0 +1,137 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from pytest import mark
+
+from spyglass.data_extractor.site_config import is_pattern
+from spyglass.data_extractor.site_config import SiteConfigMerge
+from spyglass import exceptions
+
+
+@mark.usefixtures('site_document_data_loader')
+class TestSiteConfigMerge(unittest.TestCase):
+    def setUp(self):
+        self.site_data = self.load_site_document_data()
+
+    def _host(self, name):
+        for rack in self.site_data.baremetal:
+            host = rack.get_host_by_name(name)
+            if host is not None:
+                return host
+        return None
+
+    def test_is_pattern(self):
+        self.assertTrue(is_pattern('rack7*'))
+        self.assertTrue(is_pattern('/rack7\\d/'))
+        self.assertFalse(is_pattern('rack72'))
+
+    def test_selectors(self):
+        self.site_data.merge_additional_data(
+            {
+                'baremetal': {
+                    'rack7*': {
+                        'type:controller': {
+                            'host_profile': 'cp-r740'
+                        },
+                        'profile:dp-*': {
+                            'ip': {
+                                'storage': '30.30.4.100'
+                            }
+                        },
+                    },
+                    '/rack73/': {
+                        'cab2r73c1[23]': {
+                            'host_profile': 'dp-r740'
+                        },
+                    },
+                    'rack73': {
+                        'cab2r73c12': {
+                            'host_profile': 'dp-r750'
+                        },
+                    },
+                }
+            })
+        self.assertEqual('cp-r740', self._host('cab2r72c17').host_profile)
+        self.assertEqual('cp-r720', self._host('cab2r72c16').host_profile)
+        self.assertEqual('30.30.4.100', self._host('cab2r72c12').ip.storage)
+        self.assertEqual('dp-r740', self._host('cab2r73c13').host_profile)
+        self.assertEqual('dp-r750', self._host('cab2r73c12').host_profile)
+
+    def test_new_racks_and_hosts(self):
+        self.site_data.merge_additional_data(
+            {
+                'baremetal': {
+                    'rack74': {
+                        'cab2r74c12': {
+                            'host_profile': 'dp-r720'
+                        }
+                    },
+                    'rack72': {
+                        'cab2r72c18': {
+                            'host_profile': 'dp-r720'
+                        }
+                    },
+                    'rack9*': {
+                        'cab2r90c12': {
+                            'host_profile': 'dp-r720'
+                        }
+                    },
+                }
+            })
+        self.assertEqual(
+            ['rack72', 'rack73', 'rack74'],
+            [rack.name for rack in self.site_data.baremetal])
+        self.assertIsNotNone(self._host('cab2r74c12'))
+        self.assertIsNotNone(self._host('cab2r72c18'))
+        self.assertIsNone(self._host('cab2r90c12'))
+
+    def test_bulk_merge(self):
+        hosts = {
+            'cab2r72c{}'.format(index): {
+                'host_profile': 'dp-r720'
+            }
+            for index in range(5000)
+        }
+        self.site_data.merge_additional_data({'baremetal': {'rack72': hosts}})
+        self.assertEqual(5000, len(self.site_data.baremetal[0].hosts))
+
+    def test_invalid_configuration(self):
+        with self.assertRaises(exceptions.InvalidSiteConfiguration) as cm:
+            self.site_data.merge_additional_data(
+                {
+                    'network': {
+                        'bgp': {
+                            'asnumber': 64000
+                        }
+                    },
+                    'baremetal': {
+                        'rack72': {
+                            'cab2r72c12': 'dp-r720',
+                            '/cab2r72c1[/': {}
+                        },
+                        'rack73': {
+                            'cab2r73c12': {
+                                'ip': '10.0.220.1'
+                            }
+                        },
+                    },
+                })
+        self.assertIn('Found 3 errors', cm.exception.message)
+        self.assertNotEqual(64000, self.site_data.network.bgp.get('asnumber'))
+
+    def test_invalid_section(self):
+        with self.assertRaises(exceptions.InvalidSiteConfiguration):
+            SiteConfigMerge({'baremetal': ['rack72']})
@@ -0,0 +1,104 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import mock
+
+from pytest import mark
+
+from spyglass.data_extractor import site_diff
+from spyglass.data_extractor.site_diff import Change
+
+
+@mark.usefixtures('site_document_data_loader')
+class TestSiteDiff(unittest.TestCase):
+    def setUp(self):
+        self.old = self.load_site_document_data()
+        self.new = self.load_site_document_data()
+
+    def test_no_changes(self):
+        self.assertEqual([], self.old.diff(self.new))
+
+    def test_changes(self):
+        rack72 = self.new.get_baremetal_rack_by_name('rack72')
+        rack72.get_host_by_name('cab2r72c12').ip.oob = '10.0.220.150'
+        rack72.get_host_by_name('cab2r72c13').type = 'controller'
+        rack72.hosts.remove(rack72.get_host_by_name('cab2r72c14'))
+        self.new.baremetal.remove(
+            self.new.get_baremetal_rack_by_name('rack73'))
+        oob = self.new.network.get_vlan_data_by_name('oob')
+        oob.static_start = '10.0.220.150'
+        self.new.site_info.domain = 'example.com'
+        old_domain = self.old.site_info.domain
+        old_static_start = self.old.network.get_vlan_data_by_name(
+            'oob').static_start
+
+        self.assertEqual(
+            [
+                Change(
+                    'modified', ('host', 'rack72', 'cab2r72c12', 'ip', 'oob'),
+                    '10.0.220.140', '10.0.220.150'),
+                Change(
+                    'modified', ('host', 'rack72', 'cab2r72c13', 'type'),
+                    'compute', 'controller'),
+                Change(
+                    'removed', ('host', 'rack72', 'cab2r72c14'), None, None),
+                Change(
+                    'modified', ('network', 'oob', 'static_start'),
+                    old_static_start, '10.0.220.150'),
+                Change('removed', ('rack', 'rack73'), None, None),
+                Change(
+                    'modified',
+                    ('site_info', 'domain'), old_domain, 'example.com'),
+            ], self.old.diff(self.new))
+
+    def test_unchanged_racks_pruned(self):
+        rack72 = self.new.get_baremetal_rack_by_name('rack72')
+        rack72.get_host_by_name('cab2r72c12').ip.oob = '10.0.220.150'
+        with mock.patch.object(site_diff, '_diff_host',
+                               wraps=site_diff._diff_host) as diff_host:
+            self.old.diff(self.new)
+        diff_host.assert_called_once()
+
+    def test_format_change(self):
+        self.assertEqual(
+            'modified host rack72/cab2r72c12 ip.oob: 10.0.220.140 -> '
+            '10.0.220.150',
+            site_diff.format_change(
+                Change(
+                    'modified', ('host', 'rack72', 'cab2r72c12', 'ip', 'oob'),
+                    '10.0.220.140', '10.0.220.150')))
+        self.assertEqual(
+            'added host rack72/cab2r72c18',
+            site_diff.format_change(
+                Change('added', ('host', 'rack72', 'cab2r72c18'), None, None)))
+        self.assertEqual(
+            'removed bgp asnumber: 64671',
+            site_diff.format_change(
+                Change('removed', ('bgp', 'asnumber'), 64671, None)))
+
+    def test_changes_as_dict(self):
+        changes = [
+            Change('removed', ('rack', 'rack73'), None, None),
+            Change('modified', ('site_info', 'domain'), 'a', 'b'),
+        ]
+        result = site_diff.changes_as_dict(changes)
+        self.assertEqual({'removed': 1, 'modified': 1}, result['summary'])
+        self.assertEqual(
+            {
+                'change': 'removed',
+                'path': ['rack', 'rack73'],
+                'old': None,
+                'new': None
+            }, result['changes'][0])
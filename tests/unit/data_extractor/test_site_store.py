@@ -0,0 +1,191 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from pytest import mark
+
+from spyglass.data_extractor import models
+from spyglass.data_extractor import site_store
+from spyglass.data_extractor.site_store import StoredAddress
+from spyglass.parser.address_conflicts import find_address_conflicts
+
+FIXTURE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'shared')
+
+INTERMEDIARY_PATH = os.path.join(FIXTURE_DIR, 'test_intermediary.yaml')
+
+
+def _names(hosts):
+    return [host.name for host in hosts]
+
+
+@mark.usefixtures('site_document_data_loader')
+class TestSiteStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'site.db')
+        self.site_data = self.load_site_document_data()
+        self.store = site_store.SiteStore(self.path)
+        self.store.save(self.site_data)
+        self.stored = self.store.site_data()
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_is_site_store(self):
+        self.assertTrue(site_store.is_site_store(self.path))
+        self.assertFalse(site_store.is_site_store(INTERMEDIARY_PATH))
+
+    def test_site_data(self):
+        self.assertEqual(
+            self.site_data.dict_from_class(), self.stored.dict_from_class())
+        self.assertEqual(
+            self.site_data.fingerprint(), self.stored.fingerprint())
+        self.assertEqual([], self.site_data.diff(self.stored))
+        for rack in self.stored.baremetal:
+            self.assertIsInstance(rack, site_store.StoredRack)
+
+    def test_save_replaces_content(self):
+        rack72 = self.site_data.get_baremetal_rack_by_name('rack72')
+        rack72.get_host_by_name('cab2r72c12').ip.oob = '10.0.220.150'
+        self.site_data.baremetal.remove(
+            self.site_data.get_baremetal_rack_by_name('rack73'))
+        self.store.save(self.site_data)
+        stored = self.store.site_data()
+        self.assertEqual(['rack72'], [rack.name for rack in stored.baremetal])
+        self.assertEqual(
+            '10.0.220.150',
+            stored.baremetal[0].get_host_by_name('cab2r72c12').ip.oob)
+        self.assertEqual(self.site_data.fingerprint(), stored.fingerprint())
+
+    def test_hosts(self):
+        hosts = self.stored.get_baremetal_rack_by_name('rack72').hosts
+        self.assertEqual(6, len(hosts))
+        self.assertEqual('cab2r72c12', hosts[0].name)
+        self.assertEqual('cab2r72c17', hosts[-1].name)
+        self.assertEqual(['cab2r72c13', 'cab2r72c14'], _names(hosts[1:3]))
+        self.assertEqual('rack72', hosts[0].rack_name)
+        self.assertEqual('10.0.220.140', hosts[0].ip.oob)
+        with self.assertRaises(IndexError):
+            hosts[6]
+
+    def test_get_host(self):
+        rack72 = self.stored.get_baremetal_rack_by_name('rack72')
+        self.assertEqual(
+            'cp-r720',
+            rack72.get_host_by_name('cab2r72c16').host_profile)
+        self.assertIsNone(rack72.get_host_by_name('cab2r73c12'))
+        self.assertEqual(
+            ['cab2r72c17'], _names(rack72.get_host_by_type('controller')))
+
+    def test_count_hosts_by_type(self):
+        self.assertEqual(
+            self.site_data.count_hosts_by_type(),
+            self.store.count_hosts_by_type())
+        self.assertEqual(
+            {
+                'compute': 4,
+                'controller': 1,
+                'genesis': 1
+            },
+            self.stored.get_baremetal_rack_by_name(
+                'rack72').count_hosts_by_type())
+
+    def test_sorted_hosts(self):
+        for rack in self.site_data.baremetal:
+            stored_rack = self.stored.get_baremetal_rack_by_name(rack.name)
+            for field in ('name', 'type', 'host_profile') + models.IP_ROLES:
+                self.assertEqual(
+                    _names(rack.sorted_hosts(field)),
+                    _names(stored_rack.sorted_hosts(field)))
+
+    def test_host_for(self):
+        self.assertEqual(
+            [StoredAddress('rack72', 'cab2r72c12', 'oob')],
+            self.store.host_for('10.0.220.140'))
+        self.assertEqual([], self.store.host_for('192.0.2.1'))
+        self.assertEqual([], self.store.host_for('#CHANGE_ME'))
+
+    def test_duplicate_addresses(self):
+        self.assertEqual({}, self.store.duplicate_addresses())
+        rack72 = self.site_data.get_baremetal_rack_by_name('rack72')
+        rack72.get_host_by_name('cab2r72c13').ip.oob = '10.0.220.140'
+        self.store.save(self.site_data)
+        self.assertEqual(
+            {
+                '10.0.220.140': [
+                    StoredAddress('rack72', 'cab2r72c12', 'oob'),
+                    StoredAddress('rack72', 'cab2r72c13', 'oob'),
+                ]
+            }, self.store.duplicate_addresses())
+
+    def test_execute(self):
+        rows = self.store.execute(
+            'SELECT name FROM hosts WHERE type = ? ORDER BY name',
+            ('controller', )).fetchall()
+        self.assertEqual(
+            [('cab2r72c17', ), ('cab2r73c16', ), ('cab2r73c17', )], rows)
+
+    def test_address_conflicts(self):
+        self.assertEqual(
+            find_address_conflicts(self.site_data),
+            find_address_conflicts(self.stored))
+
+    def test_threads(self):
+        results = []
+
+        def read_hosts():
+            rack = self.stored.get_baremetal_rack_by_name('rack73')
+            results.append(_names(rack.hosts))
+
+        thread = threading.Thread(target=read_hosts)
+        thread.start()
+        thread.join()
+        self.assertEqual(
+            [
+                _names(
+                    self.site_data.get_baremetal_rack_by_name('rack73').hosts)
+            ], results)
+
+    def test_close(self):
+        """Tests that closing the store closes the connections of threads"""
+        connections = [self.store.connection()]
+        thread = threading.Thread(
+            target=lambda: connections.append(self.store.connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(connections[0], connections[1])
+        self.store.close()
+        for connection in connections:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                connection.execute('SELECT 1')
+        self.assertEqual(
+            _names(self.site_data.baremetal[0].hosts),
+            _names(self.stored.baremetal[0].hosts))
+
+    def test_context_manager(self):
+        with site_store.SiteStore(self.path) as store:
+            connection = store.connection()
+            self.assertEqual(
+                len(self.site_data.baremetal),
+                len(store.site_data().baremetal))
+        with self.assertRaises(sqlite3.ProgrammingError):
+            connection.execute('SELECT 1')
@@ -0,0 +1,124 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from pytest import mark
+
+from spyglass.data_extractor import models
+from spyglass.parser import address_conflicts
+
+
+def _interval(start, end, network='net', label='range'):
+    return address_conflicts.Interval(
+        models.pack_ip(start), models.pack_ip(end), network, label)
+
+
+class TestOverlappingIntervals(unittest.TestCase):
+    def test_overlapping_intervals(self):
+        a = _interval('10.0.0.0', '10.0.0.10', label='a')
+        b = _interval('10.0.0.5', '10.0.0.20', label='b')
+        c = _interval('10.0.0.20', '10.0.0.30', label='c')
+        d = _interval('10.0.0.31', '10.0.0.40', label='d')
+        e = _interval('10.0.0.0', '10.0.0.255', label='e')
+        pairs = address_conflicts.overlapping_intervals([d, c, b, a, e])
+        self.assertEqual(
+            {
+                ('a', 'b'), ('a', 'e'), ('b', 'c'), ('b', 'e'), ('c', 'e'),
+                ('d', 'e')
+            }, {tuple(sorted((x.label, y.label)))
+                for x, y in pairs})
+
+    def test_overlapping_intervals_versions(self):
+        """Tests that IPv4 and IPv6 ranges with equal values do not overlap"""
+        v4 = _interval('0.0.0.1', '0.0.0.10')
+        v6 = _interval('::1', '::10')
+        self.assertEqual([], address_conflicts.overlapping_intervals([v4, v6]))
+
+
+@mark.usefixtures('site_document_data_loader')
+class TestFindAddressConflicts(unittest.TestCase):
+    def setUp(self):
+        self.site_data = self.load_site_document_data()
+
+    def test_no_conflicts(self):
+        self.assertEqual(
+            [], address_conflicts.find_address_conflicts(self.site_data))
+
+    def test_duplicate_address(self):
+        hosts = self.site_data.baremetal[0].hosts
+        hosts[1].ip.oob = hosts[0].ip.oob
+        conflicts = address_conflicts.find_address_conflicts(self.site_data)
+        self.assertEqual(
+            [
+                'Address {} is assigned to both {} oob and {} oob'.format(
+                    hosts[0].ip.oob, hosts[0].name, hosts[1].name)
+            ], conflicts)
+
+    def test_address_outside_subnet(self):
+        host = self.site_data.baremetal[0].hosts[0]
+        host.ip.calico = '30.29.1.200'
+        conflicts = address_conflicts.find_address_conflicts(self.site_data)
+        self.assertEqual(
+            [
+                'Address 30.29.1.200 of {} calico is outside of the subnets '
+                'of network calico'.format(host.name)
+            ], conflicts)
+
+    def test_overlapping_networks(self):
+        storage = self.site_data.network.get_vlan_data_by_name('storage')
+        storage.subnet = ['30.29.1.0/24']
+        storage.static_start = '30.29.1.100'
+        storage.static_end = '30.29.1.200'
+        conflicts = address_conflicts.find_address_conflicts(self.site_data)
+        self.assertIn(
+            'subnet 30.29.1.0/25 of network calico overlaps subnet '
+            '30.29.1.0/24 of network storage', conflicts)
+        self.assertIn(
+            'static range 30.29.1.13 - 30.29.1.126 of network calico '
+            'overlaps static range 30.29.1.100 - 30.29.1.200 of network '
+            'storage', conflicts)
+        # Every storage host address is now outside of its subnet
+        self.assertEqual(14, len(conflicts))
+
+    def test_subnet_host_bits(self):
+        """Tests networks whose subnet is written with host bits set"""
+        storage = self.site_data.network.get_vlan_data_by_name('storage')
+        storage.subnet = ['30.31.1.5/25']
+        self.assertEqual(
+            [], address_conflicts.find_address_conflicts(self.site_data))
+        host = self.site_data.baremetal[0].hosts[0]
+        host.ip.storage = '30.31.1.200'
+        self.assertEqual(
+            [
+                'Address 30.31.1.200 of {} storage is outside of the subnets '
+                'of network storage'.format(host.name)
+            ], address_conflicts.find_address_conflicts(self.site_data))
+
+    def test_rack_networks(self):
+        rack = self.site_data.baremetal[1]
+        rack.networks['oob'] = models.VLANNetworkData(
+            'oob', subnet=['10.0.230.0/27'])
+        # The rack's hosts are still in the site-wide oob subnet
+        conflicts = address_conflicts.find_address_conflicts(self.site_data)
+        self.assertEqual(len(rack.hosts), len(conflicts))
+        for index, host in enumerate(rack.hosts):
+            host.ip.oob = '10.0.230.{}'.format(11 + index)
+        self.assertEqual(
+            [], address_conflicts.find_address_conflicts(self.site_data))
+        rack.networks['oob'].subnet = ['10.0.220.224/27']
+        self.assertIn(
+            'subnet 10.0.220.224/27 of network oob overlaps subnet '
+            '10.0.220.224/27 of network oob of rack rack73',
+            address_conflicts.find_address_conflicts(self.site_data))
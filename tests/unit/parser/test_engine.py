@@ -13,12 +13,17 @@
 # limitations under the License.
 
 import os
+import shutil
+from tempfile import mkdtemp
 import unittest
 from unittest import mock
 
+from netaddr import IPAddress
 from netaddr import IPNetwork
 from pytest import mark
+import yaml
 
+from spyglass.data_extractor import models
 from spyglass import exceptions
 from spyglass.parser.engine import ProcessDataSource
 
@@ -30,11 +35,25 @@ FIXTURE_DIR = os.path.join(
 @mark.usefixtures('site_document_data_objects')
 @mark.usefixtures('invalid_site_document_data_objects')
 @mark.usefixtures('rules_data')
+@mark.usefixtures('site_document_data_loader')
 class TestProcessDataSource(unittest.TestCase):
     REGION_NAME = 'test'
     DEFAULT_RULES = None
     INPUT_RULES = os.path.join(FIXTURE_DIR, 'rules.yaml')
 
+    def _mkdtemp(self):
+        """Returns a temporary directory removed after the test"""
+        tmp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    def _site_document_data_without_ips(self):
+        site_data = self.load_site_document_data()
+        for rack in site_data.baremetal:
+            for host in rack.hosts:
+                host.ip = models.IPList()
+        return site_data
+
     def test___init__(self):
         expected_data = 'data'
         obj = ProcessDataSource(
@@ -66,12 +85,22 @@ class TestProcessDataSource(unittest.TestCase):
 
     def test__get_network_subnets(self):
         expected_result = {
-            'calico': IPNetwork('30.29.1.0/25'),
-            'oam': IPNetwork('10.0.220.0/26'),
-            'oob': IPNetwork('10.0.220.128/27'),
-            'overlay': IPNetwork('30.19.0.0/25'),
-            'pxe': IPNetwork('30.30.4.0/25'),
-            'storage': IPNetwork('30.31.1.0/25')
+            'calico': [IPNetwork('30.29.1.0/25')],
+            'oam': [IPNetwork('10.0.220.0/26')],
+            'oob': [
+                IPNetwork('10.0.220.128/27'),
+                IPNetwork('10.0.220.160/27'),
+                IPNetwork('10.0.220.192/27'),
+                IPNetwork('10.0.220.224/27')
+            ],
+            'overlay': [IPNetwork('30.19.0.0/25')],
+            'pxe': [
+                IPNetwork('30.30.4.0/25'),
+                IPNetwork('30.30.4.128/25'),
+                IPNetwork('30.30.5.0/25'),
+                IPNetwork('30.30.5.128/25')
+            ],
+            'storage': [IPNetwork('30.31.1.0/25')]
         }
         obj = ProcessDataSource(
             self.REGION_NAME, self.site_document_data, self.DEFAULT_RULES)
@@ -80,12 +109,22 @@ class TestProcessDataSource(unittest.TestCase):
 
     def test__get_network_subnets_input_rules(self):
         expected_result = {
-            'calico': IPNetwork('30.29.1.0/25'),
-            'oam': IPNetwork('10.0.220.0/26'),
-            'oob': IPNetwork('10.0.220.128/27'),
-            'overlay': IPNetwork('30.19.0.0/25'),
-            'pxe': IPNetwork('30.30.4.0/25'),
-            'storage': IPNetwork('30.31.1.0/25')
+            'calico': [IPNetwork('30.29.1.0/25')],
+            'oam': [IPNetwork('10.0.220.0/26')],
+            'oob': [
+                IPNetwork('10.0.220.128/27'),
+                IPNetwork('10.0.220.160/27'),
+                IPNetwork('10.0.220.192/27'),
+                IPNetwork('10.0.220.224/27')
+            ],
+            'overlay': [IPNetwork('30.19.0.0/25')],
+            'pxe': [
+                IPNetwork('30.30.4.0/25'),
+                IPNetwork('30.30.4.128/25'),
+                IPNetwork('30.30.5.0/25'),
+                IPNetwork('30.30.5.128/25')
+            ],
+            'storage': [IPNetwork('30.31.1.0/25')]
         }
         obj = ProcessDataSource(
             self.REGION_NAME, self.site_document_data, self.INPUT_RULES)
@@ -240,17 +279,27 @@ class TestProcessDataSource(unittest.TestCase):
         obj.network_subnets = obj._get_network_subnets()
         ip_alloc_offset_rules = self.rules_data['rule_ip_alloc_offset'][
             'ip_alloc_offset']
+        previous_ips = {
+            host.name: dict(host.ip)
+            for rack in obj.data.baremetal for host in rack.hosts
+        }
         obj._update_baremetal_host_ip_data(ip_alloc_offset_rules)
 
-        counter = 0
+        assigned = set()
         for rack in obj.data.baremetal:
             for host in rack.hosts:
                 for net_type, net_ip in iter(host.ip):
-                    ips = list(obj.network_subnets[net_type])
-                    self.assertEqual(
-                        str(ips[counter + ip_alloc_offset_rules['default']]),
-                        net_ip)
-                counter += 1
+                    vlan = obj.data.network.get_vlan_data_by_name(net_type)
+                    address = IPAddress(net_ip)
+                    self.assertNotIn((net_type, address), assigned)
+                    assigned.add((net_type, address))
+                    self.assertGreaterEqual(
+                        address, IPAddress(vlan.static_start))
+                    self.assertLessEqual(address, IPAddress(vlan.static_end))
+                    self.assertGreater(address, IPAddress(vlan.reserved_end))
+                    previous_ip = IPAddress(previous_ips[host.name][net_type])
+                    if previous_ip > IPAddress(vlan.reserved_end):
+                        self.assertEqual(previous_ip, address)
 
     def test__update_baremetal_host_ip_data_input_rules(self):
         obj = ProcessDataSource(
@@ -258,17 +307,124 @@ class TestProcessDataSource(unittest.TestCase):
         obj.network_subnets = obj._get_network_subnets()
         ip_alloc_offset_rules = self.rules_data['rule_ip_alloc_offset'][
             'ip_alloc_offset']
+        previous_ips = {
+            host.name: dict(host.ip)
+            for rack in obj.data.baremetal for host in rack.hosts
+        }
         obj._update_baremetal_host_ip_data(ip_alloc_offset_rules)
 
-        counter = 0
+        assigned = set()
         for rack in obj.data.baremetal:
             for host in rack.hosts:
                 for net_type, net_ip in iter(host.ip):
-                    ips = list(obj.network_subnets[net_type])
-                    self.assertEqual(
-                        str(ips[counter + ip_alloc_offset_rules['default']]),
-                        net_ip)
-                counter += 1
+                    vlan = obj.data.network.get_vlan_data_by_name(net_type)
+                    address = IPAddress(net_ip)
+                    self.assertNotIn((net_type, address), assigned)
+                    assigned.add((net_type, address))
+                    self.assertGreaterEqual(
+                        address, IPAddress(vlan.static_start))
+                    self.assertLessEqual(address, IPAddress(vlan.static_end))
+                    self.assertGreater(address, IPAddress(vlan.reserved_end))
+                    previous_ip = IPAddress(previous_ips[host.name][net_type])
+                    if previous_ip > IPAddress(vlan.reserved_end):
+                        self.assertEqual(previous_ip, address)
+
+    def test__update_baremetal_host_ip_data_ledger(self):
+        ledger_file = os.path.join(self._mkdtemp(), 'ledger.yaml')
+        ip_alloc_offset_rules = self.rules_data['rule_ip_alloc_offset'][
+            'ip_alloc_offset']
+
+        obj = ProcessDataSource(
+            self.REGION_NAME,
+            self._site_document_data_without_ips(),
+            self.DEFAULT_RULES,
+            ip_ledger=ledger_file)
+        obj.network_subnets = obj._get_network_subnets()
+        obj._update_baremetal_host_ip_data(ip_alloc_offset_rules)
+        with open(ledger_file, 'r') as f:
+            ledger = yaml.safe_load(f)
+        for rack in obj.data.baremetal:
+            for host in rack.hosts:
+                self.assertDictEqual(dict(host.ip), ledger[host.name])
+
+        site_data = self._site_document_data_without_ips()
+        site_data.baremetal[0].hosts.insert(
+            0, models.Host('new_host', rack_name='rack72'))
+        obj = ProcessDataSource(
+            self.REGION_NAME,
+            site_data,
+            self.DEFAULT_RULES,
+            ip_ledger=ledger_file)
+        obj.network_subnets = obj._get_network_subnets()
+        obj._update_baremetal_host_ip_data(ip_alloc_offset_rules)
+        for rack in obj.data.baremetal:
+            for host in rack.hosts:
+                if host.name == 'new_host':
+                    for net_type, net_ip in iter(host.ip):
+                        self.assertNotIn(
+                            net_ip, [ips[net_type] for ips in ledger.values()])
+                else:
+                    self.assertDictEqual(ledger[host.name], dict(host.ip))
+        with open(ledger_file, 'r') as f:
+            self.assertIn('new_host', yaml.safe_load(f))
+
+    def test__update_baremetal_host_ip_data_multiple_subnets(self):
+        """Tests that addresses are allocated from the next subnet"""
+        ip_alloc_offset_rules = self.rules_data['rule_ip_alloc_offset'][
+            'ip_alloc_offset']
+        site_data = self._site_document_data_without_ips()
+        rack = site_data.baremetal[0]
+        for index in range(15):
+            rack.hosts.append(
+                models.Host('extra{}'.format(index), rack_name=rack.name))
+        obj = ProcessDataSource(
+            self.REGION_NAME, site_data, self.DEFAULT_RULES)
+        obj.network_subnets = obj._get_network_subnets()
+        obj._update_vlan_net_data(ip_alloc_offset_rules)
+        obj._update_baremetal_host_ip_data(ip_alloc_offset_rules)
+
+        oob = site_data.network.get_vlan_data_by_name('oob')
+        ranges = oob.get_subnet_ranges('10.0.220.160/27')
+        addresses = sorted(
+            IPAddress(host.ip.oob) for rack in site_data.baremetal
+            for host in rack.hosts)
+        self.assertEqual(27, len(set(addresses)))
+        self.assertEqual(IPAddress(oob.static_start), addresses[0])
+        self.assertEqual(IPAddress(oob.static_end), addresses[19])
+        self.assertEqual(IPAddress(ranges['static_start']), addresses[20])
+        self.assertEqual(IPAddress(ranges['static_start']) + 6, addresses[-1])
+
+    def test__update_baremetal_host_ip_data_rack_networks(self):
+        """Tests that racks with their own subnets allocate from them"""
+        ip_alloc_offset_rules = self.rules_data['rule_ip_alloc_offset'][
+            'ip_alloc_offset']
+        site_data = self._site_document_data_without_ips()
+        rack73 = site_data.get_baremetal_rack_by_name('rack73')
+        rack73.networks['oob'] = models.VLANNetworkData(
+            'oob', subnet=['10.0.230.0/27'])
+        obj = ProcessDataSource(
+            self.REGION_NAME, site_data, self.DEFAULT_RULES)
+        obj.network_subnets = obj._get_network_subnets()
+        obj._update_vlan_net_data(ip_alloc_offset_rules)
+        obj._update_baremetal_host_ip_data(ip_alloc_offset_rules)
+
+        rack_oob = rack73.networks['oob']
+        self.assertEqual('10.0.230.1', rack_oob.gateway)
+        self.assertEqual('10.0.230.11', rack_oob.static_start)
+        site_oob = site_data.network.get_vlan_data_by_name('oob')
+        for rack in site_data.baremetal:
+            oob = rack_oob if rack is rack73 else site_oob
+            addresses = sorted(IPAddress(host.ip.oob) for host in rack.hosts)
+            self.assertEqual(IPAddress(oob.static_start), addresses[0])
+            self.assertEqual(
+                IPAddress(oob.static_start) + len(rack.hosts) - 1,
+                addresses[-1])
+            for host in rack.hosts:
+                self.assertIn(
+                    IPAddress(host.ip.calico),
+                    IPNetwork(
+                        site_data.network.get_vlan_data_by_name(
+                            'calico').subnet[0]))
 
     def test__update_vlan_net_data(self):
         ip_alloc_offset_rules = self.rules_data['rule_ip_alloc_offset'][
@@ -292,7 +448,7 @@ class TestProcessDataSource(unittest.TestCase):
         for vlan in self.site_document_data.network.vlan_network_data:
             if vlan.role == 'ingress':
                 continue
-            ips = list(subnets[vlan.role])
+            ips = list(subnets[vlan.role][0])
             self.assertEqual(
                 str(ips[ip_alloc_offset_rules['gateway']]), vlan.gateway)
 
@@ -321,6 +477,41 @@ class TestProcessDataSource(unittest.TestCase):
             else:
                 self.assertEqual([], vlan.routes)
 
+            # Additional subnets get the same layout
+            self.assertEqual(
+                sorted(str(subnet) for subnet in subnets[vlan.role][1:]),
+                sorted(vlan.subnet_ranges))
+            for subnet in subnets[vlan.role][1:]:
+                ips = list(subnet)
+                ranges = vlan.get_subnet_ranges(str(subnet))
+                self.assertEqual(
+                    str(ips[ip_alloc_offset_rules['gateway']]),
+                    ranges['gateway'])
+                self.assertEqual(str(ips[1]), ranges['reserved_start'])
+                self.assertEqual(str(ips[ip_offset]), ranges['reserved_end'])
+                self.assertEqual(
+                    str(ips[ip_offset + 1]), ranges['static_start'])
+
+    def test__update_vlan_net_data_ipv6_subnets(self):
+        """Tests ranges of IPv6 subnets not written in canonical form"""
+        ip_alloc_offset_rules = self.rules_data['rule_ip_alloc_offset'][
+            'ip_alloc_offset']
+        site_data = self._site_document_data_without_ips()
+        storage = site_data.network.get_vlan_data_by_name('storage')
+        storage.subnet = ['FD00::/64', 'FD00:0:0:1::/64']
+
+        obj = ProcessDataSource(
+            self.REGION_NAME, site_data, self.DEFAULT_RULES)
+        obj.network_subnets = obj._get_network_subnets()
+        obj._update_vlan_net_data(ip_alloc_offset_rules)
+
+        self.assertEqual('fd00::1', storage.gateway)
+        self.assertIsNotNone(storage.static_start)
+        self.assertEqual(['FD00:0:0:1::/64'], list(storage.subnet_ranges))
+        self.assertEqual(
+            'fd00:0:0:1::1',
+            storage.get_subnet_ranges('fd00:0:0:1::/64')['gateway'])
+
     def test__update_vlan_net_data_input_rules(self):
         ip_alloc_offset_rules = self.rules_data['rule_ip_alloc_offset'][
             'ip_alloc_offset']
@@ -343,7 +534,7 @@ class TestProcessDataSource(unittest.TestCase):
         for vlan in self.site_document_data.network.vlan_network_data:
             if vlan.role == 'ingress':
                 continue
-            ips = list(subnets[vlan.role])
+            ips = list(subnets[vlan.role][0])
             self.assertEqual(
                 str(ips[ip_alloc_offset_rules['gateway']]), vlan.gateway)
 
@@ -372,6 +563,21 @@ class TestProcessDataSource(unittest.TestCase):
             else:
                 self.assertEqual([], vlan.routes)
 
+            # Additional subnets get the same layout
+            self.assertEqual(
+                sorted(str(subnet) for subnet in subnets[vlan.role][1:]),
+                sorted(vlan.subnet_ranges))
+            for subnet in subnets[vlan.role][1:]:
+                ips = list(subnet)
+                ranges = vlan.get_subnet_ranges(str(subnet))
+                self.assertEqual(
+                    str(ips[ip_alloc_offset_rules['gateway']]),
+                    ranges['gateway'])
+                self.assertEqual(str(ips[1]), ranges['reserved_start'])
+                self.assertEqual(str(ips[ip_offset]), ranges['reserved_end'])
+                self.assertEqual(
+                    str(ips[ip_offset + 1]), ranges['static_start'])
+
     def test_load_extracted_data_from_data_source(self):
         obj = ProcessDataSource(
             self.REGION_NAME, self.site_document_data, self.DEFAULT_RULES)
@@ -382,31 +588,88 @@ class TestProcessDataSource(unittest.TestCase):
             self.REGION_NAME, self.site_document_data, self.INPUT_RULES)
         self.assertEqual(self.site_document_data, obj.data)
 
-    @mock.patch('yaml.dump', return_value='success')
-    def test_dump_intermediary_file(self, mock_dump):
+    def test_dump_intermediary_file(self):
         obj = ProcessDataSource(
             self.REGION_NAME, self.site_document_data, self.DEFAULT_RULES)
-        mock_open = mock.mock_open()
-        with mock.patch('spyglass.parser.engine.open', mock_open):
-            obj.dump_intermediary_file(None)
-        mock_dump.assert_called_once_with(
-            self.site_document_data.dict_from_class(),
-            default_flow_style=False)
-        mock_open.return_value.write.assert_called_once()
-        mock_open.return_value.close.assert_called_once()
-
-    @mock.patch('yaml.dump', return_value='success')
-    def test_dump_intermediary_file_input_rules(self, mock_dump):
+        out_dir = self._mkdtemp()
+        obj.dump_intermediary_file(out_dir)
+        outfile = os.path.join(
+            out_dir, '{}_intermediary.yaml'.format(self.REGION_NAME))
+        with open(outfile, 'r') as f:
+            self.assertEqual(
+                yaml.dump(
+                    self.site_document_data.dict_from_class(),
+                    default_flow_style=False), f.read())
+        self.assertFalse(os.path.exists(outfile + '.index.json'))
+
+    def test_dump_intermediary_file_input_rules(self):
         obj = ProcessDataSource(
             self.REGION_NAME, self.site_document_data, self.INPUT_RULES)
-        mock_open = mock.mock_open()
-        with mock.patch('spyglass.parser.engine.open', mock_open):
-            obj.dump_intermediary_file(None)
-        mock_dump.assert_called_once_with(
-            self.site_document_data.dict_from_class(),
-            default_flow_style=False)
-        mock_open.return_value.write.assert_called_once()
-        mock_open.return_value.close.assert_called_once()
+        out_dir = self._mkdtemp()
+        obj.dump_intermediary_file(out_dir)
+        outfile = os.path.join(
+            out_dir, '{}_intermediary.yaml'.format(self.REGION_NAME))
+        with open(outfile, 'r') as f:
+            self.assertEqual(
+                yaml.dump(
+                    self.site_document_data.dict_from_class(),
+                    default_flow_style=False), f.read())
+        self.assertFalse(os.path.exists(outfile + '.index.json'))
+
+    def test_dump_intermediary_file_index(self):
+        obj = ProcessDataSource(
+            self.REGION_NAME, self.site_document_data, self.DEFAULT_RULES)
+        out_dir = self._mkdtemp()
+        obj.dump_intermediary_file(out_dir, index=True)
+        outfile = os.path.join(
+            out_dir, '{}_intermediary.yaml'.format(self.REGION_NAME))
+        with open(outfile, 'r') as f:
+            self.assertEqual(
+                yaml.dump(
+                    self.site_document_data.dict_from_class(),
+                    default_flow_style=False), f.read())
+        self.assertTrue(os.path.isfile(outfile + '.index.json'))
+
+    def test_dump_intermediary_file_sharded(self):
+        obj = ProcessDataSource(
+            self.REGION_NAME, self.site_document_data, self.DEFAULT_RULES)
+        out_dir = self._mkdtemp()
+        obj.dump_intermediary_file(out_dir, sharded=True)
+        outdir = os.path.join(
+            out_dir, '{}_intermediary'.format(self.REGION_NAME))
+        self.assertTrue(os.path.isfile(os.path.join(outdir, 'site.yaml')))
+        self.assertEqual(
+            sorted(
+                rack.name + '.yaml'
+                for rack in self.site_document_data.baremetal),
+            sorted(os.listdir(os.path.join(outdir, 'racks'))))
+
+    @mock.patch(
+        'spyglass.parser.engine.find_address_conflicts',
+        return_value=['conflict one', 'conflict two'])
+    def test__check_address_conflicts(self, mock_find_address_conflicts):
+        obj = ProcessDataSource(
+            self.REGION_NAME,
+            self.site_document_data,
+            self.DEFAULT_RULES,
+            no_validation=False)
+        with self.assertRaises(exceptions.AddressConflict) as context:
+            obj._check_address_conflicts()
+        self.assertIn('Found 2 address conflicts', str(context.exception))
+        self.assertIn('conflict one\nconflict two', str(context.exception))
+        mock_find_address_conflicts.assert_called_once_with(
+            self.site_document_data)
+
+    @mock.patch(
+        'spyglass.parser.engine.find_address_conflicts',
+        return_value=['conflict one', 'conflict two'])
+    def test__check_address_conflicts_no_validation(
+            self, mock_find_address_conflicts):
+        obj = ProcessDataSource(
+            self.REGION_NAME, self.site_document_data, self.DEFAULT_RULES)
+        with self.assertLogs(level='WARNING') as test_log:
+            obj._check_address_conflicts()
+        self.assertEqual(2, len(test_log.records))
 
     @mock.patch.object(ProcessDataSource, '_apply_design_rules')
     @mock.patch.object(ProcessDataSource, '_get_genesis_node_details')
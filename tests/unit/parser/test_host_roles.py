@@ -0,0 +1,69 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from pytest import mark
+
+from spyglass.parser.host_roles import assign_host_types
+from spyglass.parser.host_roles import HostRoleMatcher
+
+
+def _hosts_by_type(site_data, host_type):
+    return sorted(
+        host.name for host in site_data.get_baremetal_host_by_type(host_type))
+
+
+@mark.usefixtures('site_document_data_loader')
+class TestHostRoles(unittest.TestCase):
+    def setUp(self):
+        self.site_data = self.load_site_document_data()
+
+    def test_profile_name(self):
+        matcher = HostRoleMatcher.from_hardware_profile(
+            {'profile_name': {
+                'ctrl': 'cp-r720',
+                'compute': 'dp-r720'
+            }})
+        genesis = assign_host_types(
+            list(reversed(self.site_data.baremetal)), matcher)
+        self.assertEqual('cab2r72c16', genesis.name)
+        self.assertEqual(
+            ['cab2r72c17', 'cab2r73c16', 'cab2r73c17'],
+            _hosts_by_type(self.site_data, 'controller'))
+        self.assertEqual(8, len(_hosts_by_type(self.site_data, 'compute')))
+
+    def test_selectors(self):
+        matcher = HostRoleMatcher.from_hardware_profile(
+            {
+                'profile_name': {
+                    'ctrl': ['cp-r740']
+                },
+                'controller': {
+                    'profiles': ['cp-r720'],
+                    'hosts': ['cab2r7?c12', '/cab2r73c1[34]/'],
+                    'racks': ['rack73'],
+                }
+            })
+        genesis = assign_host_types(self.site_data.baremetal, matcher)
+        self.assertEqual('cab2r73c12', genesis.name)
+        self.assertEqual(
+            ['cab2r73c13', 'cab2r73c14', 'cab2r73c16', 'cab2r73c17'],
+            _hosts_by_type(self.site_data, 'controller'))
+        self.assertIn('cab2r72c12', _hosts_by_type(self.site_data, 'compute'))
+
+    def test_no_controllers(self):
+        matcher = HostRoleMatcher(profiles=['cp-r740'])
+        self.assertIsNone(assign_host_types(self.site_data.baremetal, matcher))
+        self.assertEqual(12, len(_hosts_by_type(self.site_data, 'compute')))
@@ -0,0 +1,198 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import mock
+
+from netaddr import IPAddress
+from netaddr import IPNetwork
+import pytest
+
+from spyglass.data_extractor.models import VLANNetworkData
+from spyglass import exceptions
+from spyglass.parser.ip_allocator import format_address_runs
+from spyglass.parser.ip_allocator import ip_pool_chain_from_vlan_data
+from spyglass.parser.ip_allocator import ip_pool_from_vlan_data
+from spyglass.parser.ip_allocator import IPPool
+from spyglass.parser.ip_allocator import IPPoolChain
+
+
+class TestIPPool(unittest.TestCase):
+    """Tests for the IPPool host address allocator"""
+    def test___init__(self):
+        pool = IPPool('oam', IPNetwork('10.0.0.0/29'))
+        self.assertEqual(int(IPAddress('10.0.0.1')), pool.first)
+        self.assertEqual(int(IPAddress('10.0.0.6')), pool.last)
+        self.assertEqual(6, pool.available())
+
+    def test_allocate(self):
+        pool = IPPool('oam', IPNetwork('10.0.0.0/29'), '10.0.0.2', '10.0.0.4')
+        self.assertEqual(IPAddress('10.0.0.2'), pool.allocate())
+        self.assertEqual(IPAddress('10.0.0.3'), pool.allocate())
+        self.assertEqual(IPAddress('10.0.0.4'), pool.allocate())
+        with self.assertRaises(exceptions.IPPoolExhausted):
+            pool.allocate()
+
+    def test_empty(self):
+        pool = IPPool('oam', IPNetwork('10.0.0.0/29'), '10.0.0.2', '10.0.0.3')
+        self.assertFalse(pool.empty())
+        pool.allocate()
+        self.assertFalse(pool.empty())
+        pool.allocate()
+        self.assertTrue(pool.empty())
+
+    def test_reserve(self):
+        pool = IPPool('oam', IPNetwork('10.0.0.0/28'))
+        pool.reserve('10.0.0.3', '10.0.0.5')
+        pool.reserve('10.0.0.1')
+        pool.reserve('10.0.0.14', '10.0.0.20')
+        self.assertEqual(9, pool.available())
+        self.assertFalse(pool.is_free('10.0.0.4'))
+        self.assertTrue(pool.is_free('10.0.0.6'))
+        self.assertEqual(IPAddress('10.0.0.2'), pool.allocate())
+        self.assertEqual(IPAddress('10.0.0.6'), pool.allocate())
+
+    def test_claim(self):
+        pool = IPPool('oam', IPNetwork('10.0.0.0/29'))
+        self.assertTrue(pool.claim('10.0.0.1'))
+        self.assertFalse(pool.claim('10.0.0.1'))
+        self.assertFalse(pool.claim('10.0.1.1'))
+        self.assertFalse(pool.claim('#CHANGE_ME'))
+        self.assertFalse(pool.claim('2001:db8::1'))
+        self.assertEqual(IPAddress('10.0.0.2'), pool.allocate())
+
+    def test_large_pools(self):
+        pool = IPPool('oam', IPNetwork('10.0.0.0/16'))
+        self.assertEqual(65534, pool.available())
+        pool.reserve('10.0.0.1', '10.0.255.0')
+        self.assertEqual(IPAddress('10.0.255.1'), pool.allocate())
+
+        pool = IPPool('oam', IPNetwork('2001:db8::/64'))
+        self.assertEqual(2**64 - 2, pool.available())
+        self.assertTrue(pool.claim('2001:db8::1'))
+        self.assertEqual(IPAddress('2001:db8::2'), pool.allocate())
+
+    def test_ip_pool_from_vlan_data(self):
+        vlan_data = VLANNetworkData(
+            'pxe',
+            subnet=['30.30.4.0/25'],
+            gateway='30.30.4.1',
+            reserved_start='30.30.4.1',
+            reserved_end='30.30.4.12',
+            static_start='30.30.4.13',
+            static_end='30.30.4.126',
+            dhcp_start='30.30.4.64',
+            dhcp_end='30.30.4.126')
+        pool = ip_pool_from_vlan_data(IPNetwork('30.30.4.0/25'), vlan_data)
+        self.assertEqual(51, pool.available())
+        self.assertFalse(pool.claim('30.30.4.12'))
+        self.assertFalse(pool.claim('30.30.4.64'))
+        self.assertTrue(pool.claim('30.30.4.63'))
+
+    def test_allocate_many(self):
+        pool = IPPool('oam', IPNetwork('10.0.0.0/28'))
+        pool.claim('10.0.0.2')
+        pool.reserve('10.0.0.5', '10.0.0.6')
+        expected = ['10.0.0.1', '10.0.0.3', '10.0.0.4', '10.0.0.7']
+        self.assertEqual(expected, pool.allocate_many(4, vectorize=False))
+        self.assertEqual(IPAddress('10.0.0.8'), pool.allocate())
+        with self.assertRaises(exceptions.IPPoolExhausted):
+            pool.allocate_many(7)
+        self.assertEqual(6, pool.available())
+
+    def test_allocate_many_ipv6(self):
+        pool = IPPool('oam', IPNetwork('2001:db8::/64'))
+        self.assertEqual(['2001:db8::1', '2001:db8::2'], pool.allocate_many(2))
+
+
+class TestIPPoolChain(unittest.TestCase):
+    """Tests for allocation across the subnets of a network"""
+    def setUp(self):
+        self.vlan_data = VLANNetworkData(
+            'oob',
+            subnet=['10.0.0.64/29', '10.0.0.0/29'],
+            gateway='10.0.0.65',
+            subnet_ranges={
+                '10.0.0.0/29': {
+                    'gateway': '10.0.0.1',
+                    'static_start': '10.0.0.4',
+                    'static_end': '10.0.0.5'
+                }
+            })
+        self.chain = ip_pool_chain_from_vlan_data(
+            [IPNetwork(subnet) for subnet in self.vlan_data.subnet],
+            self.vlan_data)
+
+    def test_available(self):
+        self.assertEqual([5, 2], [p.available() for p in self.chain.pools])
+        self.assertEqual(7, self.chain.available())
+
+    def test_claim(self):
+        self.assertTrue(self.chain.claim('10.0.0.4'))
+        self.assertFalse(self.chain.claim('10.0.0.4'))
+        self.assertFalse(self.chain.claim('10.0.0.2'))
+        self.assertTrue(self.chain.claim('10.0.0.66'))
+        self.assertFalse(self.chain.is_free('10.0.0.66'))
+        self.assertEqual(5, self.chain.available())
+
+    def test_allocate_in_order(self):
+        """Tests that subnets are filled in the order they are listed"""
+        self.assertEqual(IPAddress('10.0.0.66'), self.chain.allocate())
+        self.assertEqual(
+            ['10.0.0.67', '10.0.0.68', '10.0.0.69', '10.0.0.70', '10.0.0.4'],
+            self.chain.allocate_many(5, vectorize=False))
+        self.assertEqual(IPAddress('10.0.0.5'), self.chain.allocate())
+        with self.assertRaises(exceptions.IPPoolExhausted):
+            self.chain.allocate()
+
+    def test_allocate_skips_exhausted_pools(self):
+        """Tests that allocation does not count the free addresses left"""
+        self.chain.allocate_many(5, vectorize=False)
+        self.assertTrue(self.chain.pools[0].empty())
+        with mock.patch.object(IPPool, 'available') as mock_available:
+            self.assertEqual(IPAddress('10.0.0.4'), self.chain.allocate())
+            self.assertEqual(IPAddress('10.0.0.5'), self.chain.allocate())
+            with self.assertRaises(exceptions.IPPoolExhausted):
+                self.chain.allocate()
+        mock_available.assert_not_called()
+
+    def test_allocate_many_exhausted(self):
+        with self.assertRaises(exceptions.IPPoolExhausted):
+            self.chain.allocate_many(8)
+        self.assertEqual(7, self.chain.available())
+        self.assertEqual([], IPPoolChain('oob', []).allocate_many(0))
+
+
+class TestFormatAddressRuns(unittest.TestCase):
+    """Tests for the bulk formatting of addresses"""
+    RUNS = [
+        (int(IPAddress('10.0.0.250')), 10),
+        (int(IPAddress('192.168.255.255')), 2),
+    ]
+
+    def test_format_address_runs(self):
+        expected = [
+            str(IPAddress(start + offset, 4)) for start, count in self.RUNS
+            for offset in range(count)
+        ]
+        self.assertEqual(
+            expected, format_address_runs(self.RUNS, 4, vectorize=False))
+        self.assertEqual('10.0.1.3', expected[9])
+
+    def test_format_address_runs_vectorized(self):
+        pytest.importorskip('numpy')
+        self.assertEqual(
+            format_address_runs(self.RUNS, 4, vectorize=False),
+            format_address_runs(self.RUNS, 4, vectorize=True))
+        self.assertEqual([], format_address_runs([], 4, vectorize=True))
@@ -0,0 +1,271 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+from tempfile import mkdtemp
+import unittest
+from unittest import mock
+
+from pytest import mark
+
+from spyglass.data_extractor import models
+from spyglass import exceptions
+from spyglass.parser.engine import ProcessDataSource
+from spyglass.parser import rules
+
+
+def _make_rule(reads, writes, calls=None):
+    """Returns a rule recording its name in calls when applied"""
+    class _Rule(rules.DesignRule):
+        def apply(self, engine, rule_data):
+            if calls is not None:
+                calls.append(rule_data)
+
+    _Rule.reads = reads
+    _Rule.writes = writes
+    return _Rule
+
+
+def _names(stages):
+    return [[name for name, _ in stage] for stage in stages]
+
+
+def _rules_yaml(*names):
+    return {
+        'rule_{}'.format(name): {
+            'name': name,
+            name: name
+        }
+        for name in names
+    }
+
+
+class TestOrderRules(unittest.TestCase):
+    def test_independent_rules(self):
+        stages = rules.order_rules(
+            [
+                ('a', _make_rule(('baremetal.name', ), ('network.bgp', ))()),
+                (
+                    'b',
+                    _make_rule(
+                        ('baremetal.name', ), ('baremetal.hosts.type', ))()),
+            ])
+        self.assertEqual([['a', 'b']], _names(stages))
+
+    def test_writer_before_reader(self):
+        stages = rules.order_rules(
+            [
+                ('reader', _make_rule(('baremetal.hosts', ), ())()),
+                ('writer', _make_rule((), ('baremetal.hosts.ip', ))()),
+            ])
+        self.assertEqual([['writer'], ['reader']], _names(stages))
+
+    def test_shared_writes_keep_listed_order(self):
+        stages = rules.order_rules(
+            [
+                ('b', _make_rule((), ('network.bgp', ))()),
+                ('a', _make_rule((), ('network', ))()),
+            ])
+        self.assertEqual([['b'], ['a']], _names(stages))
+
+    def test_mutual_reads_keep_listed_order(self):
+        stages = rules.order_rules(
+            [
+                ('b', _make_rule(('network.bgp', ), ('baremetal', ))()),
+                ('a', _make_rule(('baremetal', ), ('network.bgp', ))()),
+            ])
+        self.assertEqual([['b'], ['a']], _names(stages))
+
+    def test_undeclared_fields_written_first(self):
+        stages = rules.order_rules(
+            [
+                ('b', _make_rule(('network', ), ())()),
+                ('method', rules._MethodRule('method')),
+                ('a', _make_rule(('baremetal', ), ())()),
+            ])
+        self.assertEqual([['method'], ['b', 'a']], _names(stages))
+
+    def test_cycle(self):
+        with self.assertRaises(exceptions.DesignRuleCycle):
+            rules.order_rules(
+                [
+                    ('a', _make_rule(('x', ), ('y', ))()),
+                    ('b', _make_rule(('y', ), ('z', ))()),
+                    ('c', _make_rule(('z', ), ('x', ))()),
+                ])
+
+
+class TestRuleRegistry(unittest.TestCase):
+    @mock.patch('pkg_resources.iter_entry_points', return_value=[])
+    def test_builtin_rules(self, mock_entry_points):
+        registry = rules.get_rule_registry()
+        mock_entry_points.assert_called_once_with(rules.RULES_ENTRY_POINT)
+        self.assertIs(rules.HardwareProfileRule, registry['hardware_profile'])
+        self.assertIs(rules.IPAllocOffsetRule, registry['ip_alloc_offset'])
+
+    @mock.patch('pkg_resources.iter_entry_points')
+    def test_registered_rules(self, mock_entry_points):
+        custom_rule = _make_rule((), ())
+        entry_point = mock.Mock()
+        entry_point.name = 'hardware_profile'
+        entry_point.load.return_value = custom_rule
+        mock_entry_points.return_value = [entry_point]
+        registry = rules.get_rule_registry()
+        self.assertIs(custom_rule, registry['hardware_profile'])
+
+    def test_get_rule_method(self):
+        engine = mock.Mock(spec=['_apply_rule_custom'])
+        runner = rules.RuleRunner(registry={})
+        rule = runner.get_rule(engine, 'custom')
+        rule.apply(engine, 'data')
+        engine._apply_rule_custom.assert_called_once_with('data')
+
+    def test_get_rule_unknown(self):
+        runner = rules.RuleRunner(registry={})
+        with self.assertRaises(exceptions.UnknownDesignRule):
+            runner.get_rule(mock.Mock(spec=[]), 'custom')
+
+
+@mark.usefixtures('site_document_data_loader')
+class TestRuleRunner(unittest.TestCase):
+    def setUp(self):
+        self.engine = mock.Mock(data=self.load_site_document_data())
+        self.calls = []
+        self.registry = {
+            'types': _make_rule(
+                ('baremetal.hosts.host_profile', ), ('baremetal.hosts.type', ),
+                self.calls),
+            'bgp': _make_rule(
+                ('network.vlan_network_data', ), ('network.bgp', ),
+                self.calls),
+        }
+
+    def _mkdtemp(self):
+        """Returns a temporary directory removed after the test"""
+        tmp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    def test_run(self):
+        runner = rules.RuleRunner(registry=self.registry)
+        runner.run(self.engine, _rules_yaml('types', 'bgp'))
+        self.assertCountEqual(['types', 'bgp'], self.calls)
+        self.assertCountEqual(['types', 'bgp'], runner.timings.keys())
+
+    def test_run_skips_unchanged_rules(self):
+        runner = rules.RuleRunner(registry=self.registry)
+        runner.run(self.engine, _rules_yaml('types', 'bgp'))
+        self.engine.data.network.bgp['asnumber'] = 64000
+        runner.run(self.engine, _rules_yaml('types', 'bgp'))
+        self.assertEqual(['bgp'], self.calls[2:])
+        self.assertEqual(0.0, runner.timings['types'])
+
+    def test_run_applies_changed_configuration(self):
+        runner = rules.RuleRunner(registry=self.registry)
+        runner.run(self.engine, _rules_yaml('types'))
+        rules_yaml = _rules_yaml('types')
+        rules_yaml['rule_types']['types'] = 'changed'
+        runner.run(self.engine, rules_yaml)
+        self.assertEqual(['types', 'changed'], self.calls)
+
+    def test_run_state_file(self):
+        state_file = os.path.join(self._mkdtemp(), 'rules_state.json')
+        rules.RuleRunner(state_file,
+                         self.registry).run(self.engine, _rules_yaml('types'))
+        self.assertTrue(os.path.isfile(state_file))
+        rules.RuleRunner(state_file,
+                         self.registry).run(self.engine, _rules_yaml('types'))
+        self.assertEqual(['types'], self.calls)
+
+    def test_run_builtin_rules(self):
+        site_data = self.load_site_document_data()
+        engine = ProcessDataSource('test', site_data, None)
+        engine._apply_design_rules()
+        self.assertEqual(
+            1, len(site_data.get_baremetal_host_by_type('genesis')))
+        with mock.patch.object(
+                ProcessDataSource, '_apply_rule_ip_alloc_offset') as mock_ip, \
+                mock.patch.object(ProcessDataSource,
+                                  '_apply_rule_hardware_profile') as mock_hw:
+            engine._apply_design_rules()
+        mock_ip.assert_not_called()
+        mock_hw.assert_not_called()
+
+    def test_run_builtin_rules_ip_ledger(self):
+        """Tests that the IP ledger written by a rule does not rerun it"""
+        tmp_dir = self._mkdtemp()
+        state_file = os.path.join(tmp_dir, 'rules_state.json')
+        ledger_file = os.path.join(tmp_dir, 'ledger.yaml')
+        apply_ip_alloc = ProcessDataSource._apply_rule_ip_alloc_offset
+
+        def run():
+            engine = ProcessDataSource(
+                'test',
+                self.load_site_document_data(),
+                None,
+                ip_ledger=ledger_file,
+                rules_state=state_file)
+            with mock.patch.object(ProcessDataSource,
+                                   '_apply_rule_ip_alloc_offset',
+                                   autospec=True,
+                                   side_effect=apply_ip_alloc) as mock_ip:
+                engine._apply_design_rules()
+            return mock_ip.call_count
+
+        self.assertEqual(1, run())
+        self.assertTrue(os.path.isfile(ledger_file))
+        self.assertEqual(0, run())
+
+        # Editing the ledger applies the rule again
+        with open(ledger_file, 'a') as f:
+            f.write('# edited\n')
+        self.assertEqual(1, run())
+
+    def test_run_builtin_rules_replays_outputs(self):
+        def unallocated_site_data():
+            site_data = self.load_site_document_data()
+            for rack in site_data.baremetal:
+                for host in rack.hosts:
+                    for role in models.IP_ROLES:
+                        host.ip.set_ip_by_role(role, None)
+            return site_data
+
+        state_file = os.path.join(self._mkdtemp(), 'rules_state.json')
+        site_data = unallocated_site_data()
+        ProcessDataSource(
+            'test', site_data, None,
+            rules_state=state_file)._apply_design_rules()
+
+        # A second run on the same unallocated data replays the addresses
+        replayed = unallocated_site_data()
+        engine = ProcessDataSource(
+            'test', replayed, None, rules_state=state_file)
+        with mock.patch.object(ProcessDataSource,
+                               '_apply_rule_ip_alloc_offset') as mock_ip:
+            engine._apply_design_rules()
+        mock_ip.assert_not_called()
+        self.assertEqual(0.0, engine.rule_runner.timings['ip_alloc_offset'])
+        self.assertEqual(
+            site_data.dict_from_class(), replayed.dict_from_class())
+
+        # Changed inputs are allocated again
+        changed = unallocated_site_data()
+        changed.baremetal[0].hosts[0].name = 'renamed'
+        engine = ProcessDataSource(
+            'test', changed, None, rules_state=state_file)
+        with mock.patch.object(ProcessDataSource,
+                               '_apply_rule_ip_alloc_offset') as mock_ip:
+            engine._apply_design_rules()
+        mock_ip.assert_called_once()
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+import json
 import logging
 import os
 from tempfile import mkdtemp
@@ -21,14 +23,17 @@ from unittest import mock
 
 from jinja2 import UndefinedError
 import pytest
+import yaml
 
 from spyglass.data_extractor import models
+from spyglass.site_processors.site_processor import get_template_directives
 from spyglass.site_processors.site_processor import SiteProcessor
 
 LOG = logging.getLogger(__name__)
 LOG.level = logging.DEBUG
 
 
+@pytest.mark.usefixtures('site_document_data_loader')
 class TestSiteProcessor(unittest.TestCase):
 
     J2_TPL = textwrap.dedent(
@@ -61,6 +66,20 @@ class TestSiteProcessor(unittest.TestCase):
       site_type:{{ undefined_param }}
     ...""")
 
+    J2_TPL_SHARDED = textwrap.dedent(
+        """\
+    {# shard_by: rack #}
+    {% for rack in data.baremetal %}
+    {% for host in rack.hosts %}
+    ---
+    name: {{ host.name }}
+    rack: {{ rack.name }}
+    oob: {{ host.ip.oob }}
+    region: {{ data.site_info.region_name }}
+    {% endfor %}
+    {% endfor %}
+    """)
+
     @mock.patch(
         'spyglass.data_extractor.models.SiteDocumentData',
         spec=models.SiteDocumentData)
@@ -166,6 +185,10 @@ class TestSiteProcessor(unittest.TestCase):
             _out_dir, "pegleg_manifests", "site", region_name,
             os.path.split(_tpl_dir)[1], "test.yaml")
         self.assertFalse(os.path.exists(output_file))
+        staged_file = os.path.join(
+            _out_dir, "pegleg_manifests", "site", region_name + '.staging',
+            os.path.split(_tpl_dir)[1], "test.yaml")
+        self.assertFalse(os.path.exists(staged_file))
 
     @mock.patch(
         'spyglass.data_extractor.models.SiteDocumentData',
@@ -215,3 +238,501 @@ class TestSiteProcessor(unittest.TestCase):
         with open(output_file, 'r') as f:
             content = f.read()
             self.assertEqual(expected_output, content)
+
+    @mock.patch(
+        'spyglass.data_extractor.models.SiteDocumentData',
+        spec=models.SiteDocumentData)
+    @mock.patch('spyglass.data_extractor.models.SiteInfo')
+    @mock.patch('spyglass.data_extractor.models.ServerList')
+    def test_render_template_write_if_changed(
+            self, ServerList, SiteInfo, SiteDocumentData):
+        _tpl_parent_dir = mkdtemp()
+        _tpl_dir = mkdtemp(dir=_tpl_parent_dir)
+        _tpl_file = os.path.join(_tpl_dir, "test.yaml.j2")
+        with open(_tpl_file, 'w') as f:
+            f.write(self.J2_TPL)
+        _extra_tpl_file = os.path.join(_tpl_dir, "extra.yaml.j2")
+        with open(_extra_tpl_file, 'w') as f:
+            f.write(self.J2_TPL)
+
+        site_data = SiteDocumentData()
+        type(SiteDocumentData()).site_info = SiteInfo()
+        region_name = 'test'
+        type(SiteInfo()).region_name = mock.PropertyMock(
+            return_value=region_name)
+        type(SiteInfo()).sitetype = mock.PropertyMock(return_value='one')
+
+        _out_dir = mkdtemp()
+        site_processor = SiteProcessor(site_data, _out_dir, force_write=False)
+        stats = site_processor.render_template(_tpl_parent_dir)
+        self.assertEqual({'written': 2, 'unchanged': 0, 'removed': 0}, stats)
+
+        output_dir = os.path.join(
+            _out_dir, "pegleg_manifests", "site", region_name,
+            os.path.split(_tpl_dir)[1])
+        output_file = os.path.join(output_dir, "test.yaml")
+        first_mtime = os.stat(output_file).st_mtime_ns
+
+        os.remove(_extra_tpl_file)
+        stats = site_processor.render_template(_tpl_parent_dir)
+        self.assertEqual({'written': 0, 'unchanged': 1, 'removed': 1}, stats)
+        self.assertEqual(first_mtime, os.stat(output_file).st_mtime_ns)
+        self.assertFalse(
+            os.path.exists(os.path.join(output_dir, "extra.yaml")))
+
+        type(SiteInfo()).sitetype = mock.PropertyMock(return_value='two')
+        stats = site_processor.render_template(_tpl_parent_dir)
+        self.assertEqual({'written': 1, 'unchanged': 0, 'removed': 0}, stats)
+        with open(output_file, 'r') as f:
+            self.assertIn('site_type:two', f.read())
+
+    @mock.patch(
+        'spyglass.data_extractor.models.SiteDocumentData',
+        spec=models.SiteDocumentData)
+    @mock.patch('spyglass.data_extractor.models.SiteInfo')
+    @mock.patch('spyglass.data_extractor.models.ServerList')
+    def test_render_template_missing_data_keeps_previous(
+            self, ServerList, SiteInfo, SiteDocumentData):
+        _tpl_parent_dir = mkdtemp()
+        _tpl_dir = mkdtemp(dir=_tpl_parent_dir)
+        _tpl_file = os.path.join(_tpl_dir, "test.yaml.j2")
+        with open(_tpl_file, 'w') as f:
+            f.write(self.J2_TPL)
+
+        site_data = SiteDocumentData()
+        type(SiteDocumentData()).site_info = SiteInfo()
+        region_name = 'test'
+        type(SiteInfo()).region_name = mock.PropertyMock(
+            return_value=region_name)
+        type(SiteInfo()).sitetype = mock.PropertyMock(return_value='one')
+
+        _out_dir = mkdtemp()
+        site_processor = SiteProcessor(site_data, _out_dir, force_write=False)
+        site_processor.render_template(_tpl_parent_dir)
+
+        region_dir = os.path.join(
+            _out_dir, "pegleg_manifests", "site", region_name)
+        output_file = os.path.join(
+            region_dir,
+            os.path.split(_tpl_dir)[1], "test.yaml")
+        with open(output_file, 'r') as f:
+            expected_output = f.read()
+
+        _sub_dir = mkdtemp(dir=_tpl_dir)
+        with open(os.path.join(_sub_dir, "undefined.yaml.j2"), 'w') as f:
+            f.write(self.J2_TPL_UNDEFINED)
+        type(SiteInfo()).sitetype = mock.PropertyMock(return_value='two')
+        with pytest.raises(UndefinedError):
+            site_processor.render_template(_tpl_parent_dir)
+
+        with open(output_file, 'r') as f:
+            self.assertEqual(expected_output, f.read())
+        self.assertFalse(
+            os.path.exists(
+                os.path.join(
+                    region_dir,
+                    os.path.split(_tpl_dir)[1],
+                    os.path.split(_sub_dir)[1], "undefined.yaml")))
+
+    @mock.patch.object(SiteProcessor, 'check_templates')
+    @mock.patch(
+        'spyglass.data_extractor.models.SiteDocumentData',
+        spec=models.SiteDocumentData)
+    @mock.patch('spyglass.data_extractor.models.SiteInfo')
+    @mock.patch('spyglass.data_extractor.models.ServerList')
+    def test_render_template_resume(
+            self, ServerList, SiteInfo, SiteDocumentData, check_templates):
+        _tpl_parent_dir = mkdtemp()
+        _tpl_dir = mkdtemp(dir=_tpl_parent_dir)
+        with open(os.path.join(_tpl_dir, "test.yaml.j2"), 'w') as f:
+            f.write(self.J2_TPL)
+        _sub_dir = mkdtemp(dir=_tpl_dir)
+        _undefined_tpl_file = os.path.join(_sub_dir, "undefined.yaml.j2")
+        with open(_undefined_tpl_file, 'w') as f:
+            f.write(self.J2_TPL_UNDEFINED)
+
+        site_data = SiteDocumentData()
+        type(SiteDocumentData()).site_info = SiteInfo()
+        region_name = 'test'
+        type(SiteInfo()).region_name = mock.PropertyMock(
+            return_value=region_name)
+        type(SiteInfo()).sitetype = mock.PropertyMock(return_value='one')
+
+        _out_dir = mkdtemp()
+        site_processor = SiteProcessor(
+            site_data, _out_dir, force_write=False, resume=True)
+        with pytest.raises(UndefinedError):
+            site_processor.render_template(_tpl_parent_dir)
+
+        rel_path = os.path.join(os.path.split(_tpl_dir)[1], "test.yaml")
+        region_dir = os.path.join(
+            _out_dir, "pegleg_manifests", "site", region_name)
+        staged_file = os.path.join(region_dir + '.staging', rel_path)
+        self.assertTrue(os.path.exists(staged_file))
+        staged_inode = os.stat(staged_file).st_ino
+
+        with open(_undefined_tpl_file, 'w') as f:
+            f.write(self.J2_TPL)
+        stats = site_processor.render_template(_tpl_parent_dir)
+        self.assertEqual({'written': 2, 'unchanged': 0, 'removed': 0}, stats)
+        output_file = os.path.join(region_dir, rel_path)
+        self.assertEqual(staged_inode, os.stat(output_file).st_ino)
+        self.assertFalse(os.path.exists(region_dir + '.staging'))
+
+    def test__stream_template_writes_chunks(self):
+        outfile = os.path.join(mkdtemp(), 'out.yaml')
+        chunks = ['---\n', 'name: a\n', 'name: b\n']
+
+        def generate(data):
+            for index, chunk in enumerate(chunks):
+                # Every chunk produced so far is already in the file
+                with open(outfile, 'r') as f:
+                    self.assertEqual(''.join(chunks[:index]), f.read())
+                yield chunk
+
+        template = mock.Mock(spec=['generate'])
+        template.generate.side_effect = generate
+        with mock.patch(
+                'spyglass.site_processors.site_processor.WRITE_BUFFER_SIZE',
+                0):
+            digest = SiteProcessor._stream_template(
+                template, mock.sentinel.data, outfile)
+        template.generate.assert_called_once_with(data=mock.sentinel.data)
+        with open(outfile, 'r') as f:
+            self.assertEqual(''.join(chunks), f.read())
+        self.assertEqual(
+            hashlib.sha256(''.join(chunks).encode('utf-8')).hexdigest(),
+            digest)
+
+    def test__stream_template_failure_removes_partial_file(self):
+        out_dir = mkdtemp()
+        live_file = os.path.join(out_dir, 'live.yaml')
+        outfile = os.path.join(out_dir, 'staged.yaml')
+        with open(live_file, 'w') as f:
+            f.write('live content\n')
+        os.link(live_file, outfile)
+
+        def generate(data):
+            yield 'partial\n'
+            raise UndefinedError('missing')
+
+        template = mock.Mock(spec=['generate'])
+        template.generate.side_effect = generate
+        with pytest.raises(UndefinedError):
+            SiteProcessor._stream_template(template, {}, outfile)
+        self.assertFalse(os.path.exists(outfile))
+        with open(live_file, 'r') as f:
+            self.assertEqual('live content\n', f.read())
+        self.assertEqual(1, os.stat(live_file).st_nlink)
+
+    def test_get_template_directives(self):
+        self.assertEqual(
+            {'shard_by': 'rack'}, get_template_directives(self.J2_TPL_SHARDED))
+        self.assertEqual({}, get_template_directives(self.J2_TPL))
+        self.assertEqual({}, get_template_directives('{# a comment #}'))
+
+    def test_render_template_sharded(self):
+        _tpl_parent_dir = mkdtemp()
+        _tpl_dir = mkdtemp(dir=_tpl_parent_dir)
+        with open(os.path.join(_tpl_dir, "nodes.yaml.j2"), 'w') as f:
+            f.write(self.J2_TPL_SHARDED)
+
+        site_data = self.load_site_document_data()
+        _out_dir = mkdtemp()
+        site_processor = SiteProcessor(site_data, _out_dir, force_write=False)
+        stats = site_processor.render_template(_tpl_parent_dir)
+        self.assertEqual({'written': 2, 'unchanged': 0, 'removed': 0}, stats)
+
+        shard_dir = os.path.join(
+            _out_dir, "pegleg_manifests", "site", "test",
+            os.path.split(_tpl_dir)[1], "nodes")
+        self.assertEqual(
+            ['rack72.yaml', 'rack73.yaml'], sorted(os.listdir(shard_dir)))
+        for rack in site_data.baremetal:
+            with open(os.path.join(shard_dir, rack.name + '.yaml')) as f:
+                documents = list(yaml.safe_load_all(f))
+            self.assertEqual(
+                [host.name for host in rack.hosts],
+                [document['name'] for document in documents])
+            for document in documents:
+                self.assertEqual(rack.name, document['rack'])
+
+        with mock.patch.object(SiteProcessor, '_stream_template',
+                               wraps=SiteProcessor._stream_template) as mock_:
+            stats = site_processor.render_template(_tpl_parent_dir)
+            self.assertEqual(
+                {
+                    'written': 0,
+                    'unchanged': 2,
+                    'removed': 0
+                }, stats)
+            mock_.assert_not_called()
+
+            site_data.baremetal[1].hosts[0].ip.oob = '10.0.220.150'
+            stats = site_processor.render_template(_tpl_parent_dir)
+            self.assertEqual(
+                {
+                    'written': 1,
+                    'unchanged': 1,
+                    'removed': 0
+                }, stats)
+            mock_.assert_called_once()
+        with open(os.path.join(shard_dir, 'rack73.yaml')) as f:
+            self.assertIn('oob: 10.0.220.150', f.read())
+
+    def test_render_template_sharded_include(self):
+        _tpl_parent_dir = mkdtemp()
+        _tpl_dir = mkdtemp(dir=_tpl_parent_dir)
+        with open(os.path.join(_tpl_dir, "nodes.yaml.j2"), 'w') as f:
+            f.write(
+                self.J2_TPL_SHARDED.replace(
+                    '{% endfor %}\n{% endfor %}',
+                    "{% endfor %}\n{% include 'region.j2' %}\n{% endfor %}"))
+        with open(os.path.join(_tpl_dir, "region.j2"), 'w') as f:
+            f.write("site: {{ data.site_info.region_name }}\n")
+
+        _out_dir = mkdtemp()
+        site_processor = SiteProcessor(
+            self.load_site_document_data(), _out_dir, force_write=False)
+        site_processor.render_template(_tpl_parent_dir)
+        stats = site_processor.render_template(_tpl_parent_dir)
+        self.assertEqual({'written': 0, 'unchanged': 3, 'removed': 0}, stats)
+
+        # Editing the included template renders the shards again
+        with open(os.path.join(_tpl_dir, "region.j2"), 'w') as f:
+            f.write("region: {{ data.site_info.region_name }}\n")
+        stats = site_processor.render_template(_tpl_parent_dir)
+        self.assertEqual({'written': 3, 'unchanged': 0, 'removed': 0}, stats)
+        shard_file = os.path.join(
+            _out_dir, "pegleg_manifests", "site", "test",
+            os.path.split(_tpl_dir)[1], "nodes", "rack72.yaml")
+        with open(shard_file) as f:
+            self.assertIn('region: test', f.read())
+
+    def test_render_template_sharded_dynamic_include(self):
+        _tpl_parent_dir = mkdtemp()
+        _tpl_dir = mkdtemp(dir=_tpl_parent_dir)
+        with open(os.path.join(_tpl_dir, "nodes.yaml.j2"), 'w') as f:
+            f.write(
+                "{# shard_by: rack #}\n"
+                "{% for rack in data.baremetal %}"
+                "{% include rack.name ~ '.j2' ignore missing %}"
+                "{% endfor %}\n")
+
+        _out_dir = mkdtemp()
+        site_processor = SiteProcessor(
+            self.load_site_document_data(), _out_dir, force_write=False)
+        site_processor.render_template(_tpl_parent_dir)
+        with mock.patch.object(SiteProcessor, '_stream_template',
+                               wraps=SiteProcessor._stream_template) as mock_:
+            site_processor.render_template(_tpl_parent_dir)
+        self.assertEqual(2, mock_.call_count)
+
+    def test_render_template_sharded_site_data_changed(self):
+        _tpl_parent_dir = mkdtemp()
+        _tpl_dir = mkdtemp(dir=_tpl_parent_dir)
+        with open(os.path.join(_tpl_dir, "nodes.yaml.j2"), 'w') as f:
+            f.write(self.J2_TPL_SHARDED)
+
+        site_data = self.load_site_document_data()
+        site_processor = SiteProcessor(site_data, mkdtemp(), force_write=False)
+        site_processor.render_template(_tpl_parent_dir)
+        site_data.network.bgp['asnumber'] = 64000
+        with mock.patch.object(SiteProcessor, '_stream_template',
+                               wraps=SiteProcessor._stream_template) as mock_:
+            site_processor.render_template(_tpl_parent_dir)
+        self.assertEqual(2, mock_.call_count)
+
+    def test_render_template_sharded_by_host(self):
+        _tpl_parent_dir = mkdtemp()
+        _tpl_dir = mkdtemp(dir=_tpl_parent_dir)
+        with open(os.path.join(_tpl_dir, "nodes.yaml.j2"), 'w') as f:
+            f.write(
+                self.J2_TPL_SHARDED.replace(
+                    'shard_by: rack', 'shard_by: host'))
+
+        site_data = self.load_site_document_data()
+        _out_dir = mkdtemp()
+        site_processor = SiteProcessor(site_data, _out_dir, force_write=False)
+        site_processor.render_template(_tpl_parent_dir)
+
+        shard_dir = os.path.join(
+            _out_dir, "pegleg_manifests", "site", "test",
+            os.path.split(_tpl_dir)[1], "nodes")
+        expected_files = sorted(
+            host.name + '.yaml' for rack in site_data.baremetal
+            for host in rack.hosts)
+        self.assertEqual(expected_files, sorted(os.listdir(shard_dir)))
+
+    def test_render_template_sharded_by_host_rack_networks(self):
+        _tpl_parent_dir = mkdtemp()
+        _tpl_dir = mkdtemp(dir=_tpl_parent_dir)
+        with open(os.path.join(_tpl_dir, "nodes.yaml.j2"), 'w') as f:
+            f.write(
+                "{# shard_by: host #}\n"
+                "{% for rack in data.baremetal %}"
+                "{% for host in rack.hosts %}"
+                "{{ host.name }}: "
+                "{{ data.get_vlan_data_for_rack(rack, 'oob').subnet[0] }}\n"
+                "{% endfor %}{% endfor %}")
+
+        site_data = self.load_site_document_data()
+        rack = site_data.get_baremetal_rack_by_name('rack72')
+        rack.networks['oob'] = models.VLANNetworkData(
+            'oob', subnet=['10.99.0.0/24'])
+        _out_dir = mkdtemp()
+        site_processor = SiteProcessor(site_data, _out_dir, force_write=False)
+        site_processor.render_template(_tpl_parent_dir)
+
+        shard_dir = os.path.join(
+            _out_dir, "pegleg_manifests", "site", "test",
+            os.path.split(_tpl_dir)[1], "nodes")
+        host = rack.hosts[0]
+        with open(os.path.join(shard_dir, host.name + '.yaml')) as f:
+            self.assertEqual('{}: 10.99.0.0/24\n'.format(host.name), f.read())
+
+        # Changing a rack network renders the host shards of the rack again
+        rack.networks['oob'] = models.VLANNetworkData(
+            'oob', subnet=['10.98.0.0/24'])
+        stats = site_processor.render_template(_tpl_parent_dir)
+        self.assertEqual(
+            {
+                'written': len(rack.hosts),
+                'unchanged': len(
+                    site_data.get_baremetal_rack_by_name('rack73').hosts),
+                'removed': 0
+            }, stats)
+        with open(os.path.join(shard_dir, host.name + '.yaml')) as f:
+            self.assertIn('10.98.0.0/24', f.read())
+
+    def test_render_template_racks(self):
+        _tpl_parent_dir = mkdtemp()
+        _tpl_dir = mkdtemp(dir=_tpl_parent_dir)
+        with open(os.path.join(_tpl_dir, "nodes.yaml.j2"), 'w') as f:
+            f.write(self.J2_TPL_SHARDED)
+        with open(os.path.join(_tpl_dir, "site.yaml.j2"), 'w') as f:
+            f.write(self.J2_TPL)
+
+        site_data = self.load_site_document_data()
+        _out_dir = mkdtemp()
+        SiteProcessor(
+            site_data, _out_dir,
+            force_write=False).render_template(_tpl_parent_dir)
+        region_dir = os.path.join(_out_dir, "pegleg_manifests", "site", "test")
+        tpl_name = os.path.split(_tpl_dir)[1]
+
+        site_data.baremetal[0].hosts[0].ip.oob = '10.0.220.150'
+        site_data.baremetal[1].hosts[0].ip.oob = '10.0.220.151'
+        site_data.site_info.sitetype = 'changed'
+        with mock.patch.object(SiteProcessor, '_stream_template',
+                               wraps=SiteProcessor._stream_template) as mock_:
+            stats = SiteProcessor(
+                site_data, _out_dir, force_write=False,
+                racks=['rack73']).render_template(_tpl_parent_dir)
+            mock_.assert_called_once()
+        self.assertEqual({'written': 1, 'unchanged': 0, 'removed': 0}, stats)
+
+        with open(os.path.join(region_dir, tpl_name, 'nodes',
+                               'rack73.yaml')) as f:
+            self.assertIn('oob: 10.0.220.151', f.read())
+        with open(os.path.join(region_dir, tpl_name, 'nodes',
+                               'rack72.yaml')) as f:
+            self.assertNotIn('oob: 10.0.220.150', f.read())
+        with open(os.path.join(region_dir, tpl_name, 'site.yaml')) as f:
+            self.assertNotIn('changed', f.read())
+        with open(os.path.join(region_dir, '.spyglass-manifest.json')) as f:
+            self.assertEqual(
+                sorted(
+                    [
+                        os.path.join(tpl_name, 'site.yaml'),
+                        os.path.join(tpl_name, 'nodes', 'rack72.yaml'),
+                        os.path.join(tpl_name, 'nodes', 'rack73.yaml')
+                    ]), sorted(json.load(f)))
+
+    def test_check_templates(self):
+        _tpl_dir = mkdtemp()
+        with open(os.path.join(_tpl_dir, "nodes.yaml.j2"), 'w') as f:
+            f.write(self.J2_TPL_SHARDED)
+        with open(os.path.join(_tpl_dir, "broken.yaml.j2"), 'w') as f:
+            f.write(
+                textwrap.dedent(
+                    """
+            {{ data.site_info.missing }}
+            {% for rack in data.baremetal %}
+            {% for host in rack.hosts %}
+            {{ host.ip.missing }} {{ undefined_param }}
+            {% endfor %}
+            {% endfor %}
+            """))
+
+        _out_dir = mkdtemp()
+        site_processor = SiteProcessor(
+            self.load_site_document_data(), _out_dir, force_write=False)
+        with pytest.raises(UndefinedError) as error:
+            site_processor.render_template(_tpl_dir)
+        message = str(error.value)
+        self.assertIn(
+            "broken.yaml.j2: data.baremetal[].hosts[].ip.missing", message)
+        self.assertIn("broken.yaml.j2: data.site_info.missing", message)
+        self.assertIn("broken.yaml.j2: 'undefined_param'", message)
+        self.assertNotIn("nodes.yaml.j2", message)
+        self.assertEqual([], os.listdir(_out_dir))
+
+    def test_check_templates_guarded(self):
+        _tpl_dir = mkdtemp()
+        with open(os.path.join(_tpl_dir, "ldap.yaml.j2"), 'w') as f:
+            f.write(
+                "{% if data.site_info.ldap %}"
+                "{{ data.site_info.ldap.common_name }}{% endif %}\n")
+
+        site_data = self.load_site_document_data()
+        site_data.site_info.ldap = {}
+        _out_dir = mkdtemp()
+        site_processor = SiteProcessor(site_data, _out_dir, force_write=False)
+        site_processor.check_templates(_tpl_dir)
+        stats = site_processor.render_template(_tpl_dir)
+        self.assertEqual(1, stats['written'])
+
+    def test_get_template_dependencies(self):
+        _tpl_dir = mkdtemp()
+        with open(os.path.join(_tpl_dir, "nodes.yaml.j2"), 'w') as f:
+            f.write(self.J2_TPL_SHARDED)
+        site_processor = SiteProcessor(
+            self.load_site_document_data(), mkdtemp(), force_write=False)
+        self.assertEqual(
+            {
+                'nodes.yaml.j2': [
+                    'data.baremetal',
+                    'data.baremetal[].hosts',
+                    'data.baremetal[].hosts[].ip.oob',
+                    'data.baremetal[].hosts[].name',
+                    'data.baremetal[].name',
+                    'data.site_info.region_name',
+                ]
+            }, site_processor.get_template_dependencies(_tpl_dir))
+
+    def test_render_template_site_only_lazy(self):
+        _tpl_parent_dir = mkdtemp()
+        _tpl_dir = mkdtemp(dir=_tpl_parent_dir)
+        with open(os.path.join(_tpl_dir, "site.yaml.j2"), 'w') as f:
+            f.write(self.J2_TPL)
+
+        site_data = self.load_site_document_data()
+        _out_dir = mkdtemp()
+        site_processor = SiteProcessor(site_data, _out_dir, force_write=False)
+        stats = site_processor.render_template(_tpl_parent_dir)
+        self.assertEqual({'written': 1, 'unchanged': 0, 'removed': 0}, stats)
+        self.assertFalse(
+            any(rack.materialized for rack in site_data.baremetal))
+
+        # The output is keyed by the site information it uses
+        site_data.baremetal[0].hosts[0].ip.oob = '10.0.220.150'
+        stats = SiteProcessor(
+            site_data, _out_dir,
+            force_write=False).render_template(_tpl_parent_dir)
+        self.assertEqual({'written': 0, 'unchanged': 1, 'removed': 0}, stats)
+        site_data.site_info.sitetype = 'changed'
+        stats = SiteProcessor(
+            site_data, _out_dir,
+            force_write=False).render_template(_tpl_parent_dir)
+        self.assertEqual({'written': 1, 'unchanged': 0, 'removed': 0}, stats)
@@ -0,0 +1,129 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import jinja2
+from pytest import mark
+
+from spyglass.site_processors import template_analysis
+
+
+@mark.usefixtures('site_document_data_loader')
+class TestTemplateAnalysis(unittest.TestCase):
+    """Tests for the static analysis of templates"""
+    def setUp(self):
+        self.environment = jinja2.Environment()
+        self.site_data = self.load_site_document_data()
+
+    def _dependencies(self, source):
+        return sorted(
+            template_analysis.format_path(path)
+            for path in template_analysis.find_data_dependencies(
+                self.environment.parse(source)))
+
+    def test_find_data_dependencies(self):
+        source = (
+            "{{ data['region_name'] }}"
+            "{% set info = data.site_info %}{{ info.domain }}"
+            "{% for host in data.get_baremetal_host_by_type('genesis') %}"
+            "{{ host.name }}{% endfor %}")
+        self.assertEqual(
+            [
+                "data.get_baremetal_host_by_type('genesis')",
+                "data.get_baremetal_host_by_type('genesis')[].name",
+                'data.region_name',
+                'data.site_info',
+                'data.site_info.domain',
+            ], self._dependencies(source))
+
+    def test_find_data_dependencies_optional(self):
+        source = (
+            "{{ data.site_info.missing | default('x') }}"
+            "{% if data.network.missing is defined %}{% endif %}"
+            "{% for i in range(3) %}{{ loop.index }}{% endfor %}")
+        self.assertEqual([], self._dependencies(source))
+
+    def test_find_data_dependencies_guarded(self):
+        source = (
+            "{% if data.site_info.ldap %}"
+            "{{ data.site_info.ldap.common_name }}{% endif %}"
+            "{{ data.network.bgp if data.network.bgp else '' }}"
+            "{{ data.site_info.dns and data.site_info.dns.servers }}"
+            "{{ data.site_info.name }}")
+        self.assertEqual(['data.site_info.name'], self._dependencies(source))
+        self.assertEqual(
+            [
+                'data.network.bgp',
+                'data.site_info.dns',
+                'data.site_info.dns.servers',
+                'data.site_info.ldap',
+                'data.site_info.ldap.common_name',
+                'data.site_info.name',
+            ],
+            sorted(
+                template_analysis.format_path(path)
+                for path in template_analysis.find_data_dependencies(
+                    self.environment.parse(source), include_optional=True)))
+
+    def test_find_data_dependencies_shadowed(self):
+        source = (
+            "{% for rack in data.baremetal %}{% for rack in range(2) %}"
+            "{{ rack.name }}{% endfor %}{% endfor %}")
+        self.assertEqual(['data.baremetal'], self._dependencies(source))
+
+    def test_find_data_sections(self):
+        def sections(source):
+            return template_analysis.find_data_sections(
+                self.environment.parse(source))
+
+        self.assertEqual(
+            {'site_info', 'network'},
+            sections(
+                "{{ data.site_info.name }}{{ data['network'].bgp }}"
+                "{% for net in data.network.vlan_network_data %}"
+                "{{ net.name }}{% endfor %}"))
+        self.assertEqual(
+            {'baremetal'}, sections("{{ data.baremetal | default([]) }}"))
+        self.assertEqual(set(), sections("no data"))
+        self.assertIsNone(sections("{% set d = data %}{{ d.baremetal }}"))
+        self.assertIsNone(sections("{{ data[key] }}"))
+        self.assertIsNone(sections("{% include 'other.j2' %}"))
+
+    def test_check_data_dependencies(self):
+        source = (
+            "{{ data.site_info.sitetype }}{{ data.network.bgp.asnumber }}"
+            "{% for rack in data.baremetal %}{% for host in rack.hosts %}"
+            "{{ host.ip.pxe }}{{ host.ip.nothing }}{% endfor %}{% endfor %}"
+            "{{ data.nothing.deeper }}"
+            "{{ data.get_baremetal_rack_by_name('rack72').name }}"
+            "{{ data.get_baremetal_rack_by_name('none').name }}")
+        paths = template_analysis.find_data_dependencies(
+            self.environment.parse(source))
+        self.assertEqual(
+            [
+                "data.baremetal[].hosts[].ip.nothing",
+                "data.get_baremetal_rack_by_name('none').name",
+                "data.nothing",
+            ],
+            template_analysis.check_data_dependencies(
+                self.environment, self.site_data, paths))
+
+    def test_find_undeclared_names(self):
+        template_ast = self.environment.parse(
+            "{{ data.site_info.name }}{{ range(2) }}{{ other }}")
+        self.assertEqual(
+            ['other'],
+            template_analysis.find_undeclared_names(
+                self.environment, template_ast))
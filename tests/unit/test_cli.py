@@ -11,6 +11,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import json
 import os
 from unittest import mock
 
@@ -20,7 +21,15 @@ import yaml
 
 from spyglass.cli import generate_manifests_using_intermediary
 from spyglass.cli import intermediary_processor
+from spyglass.cli import diff_intermediaries
+from spyglass.cli import lookup_addresses
+from spyglass.cli import store_intermediary
 from spyglass.cli import validate_manifests_against_schemas
+from spyglass.data_extractor.intermediary_file import load_intermediary
+from spyglass.data_extractor.intermediary_file import write_intermediary
+from spyglass.data_extractor.intermediary_file import \
+    write_intermediary_dir
+from spyglass.data_extractor.site_store import SiteStore
 from spyglass import exceptions
 from spyglass.parser.engine import ProcessDataSource
 from spyglass.site_processors.site_processor import SiteProcessor
@@ -102,7 +111,7 @@ def test_generate_manifests_using_intermediary(mock_site_processor):
             [INTERMEDIARY_PATH, '-t', TEMPLATE_DIR_PATH])
     assert result.exit_code == 0
     mock_site_processor.assert_called_once_with(
-        _get_intermediary_data(), None, False)
+        _get_intermediary_data(), None, False, resume=False, racks=None)
     mock_render.assert_called_once_with(TEMPLATE_DIR_PATH)
 
 
@@ -128,6 +137,213 @@ def test_generate_manifests_using_intermediary_no_templates():
     assert not mock_render.called
 
 
+def test_lookup_addresses():
+    """Tests `lookup` command from CLI"""
+    runner = CliRunner()
+    result = runner.invoke(
+        lookup_addresses,
+        [INTERMEDIARY_PATH, '10.0.220.140', '30.30.5.1', '192.0.2.1'])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [
+        '10.0.220.140: network oob, host cab2r72c12 (rack rack72, oob)',
+        '30.30.5.1: network pxe, host -',
+        '192.0.2.1: network -, host -',
+    ]
+
+
+def test_store_intermediary(tmpdir):
+    """Tests `store` command from CLI and looking up addresses in a store"""
+    store_path = os.path.join(str(tmpdir), 'site.db')
+    runner = CliRunner()
+    result = runner.invoke(store_intermediary, [INTERMEDIARY_PATH, store_path])
+    assert result.exit_code == 0
+    result = runner.invoke(lookup_addresses, [store_path, '10.0.220.140'])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [
+        '10.0.220.140: network oob, host cab2r72c12 (rack rack72, oob)'
+    ]
+
+
+def test_store_intermediary_closes_store(tmpdir):
+    """Tests that commands close the site stores they open"""
+    store_path = os.path.join(str(tmpdir), 'site.db')
+    runner = CliRunner()
+    with mock.patch.object(SiteStore, 'close', autospec=True,
+                           side_effect=SiteStore.close) as mock_close:
+        result = runner.invoke(
+            store_intermediary, [INTERMEDIARY_PATH, store_path])
+        assert result.exit_code == 0
+        assert mock_close.call_count == 1
+        result = runner.invoke(lookup_addresses, [store_path, '10.0.220.140'])
+        assert result.exit_code == 0
+        assert mock_close.call_count == 2
+
+        def render_template(template_dir):
+            # The store is still open while rendering
+            assert mock_close.call_count == 2
+
+        with mock.patch.object(SiteProcessor, 'render_template',
+                               side_effect=render_template):
+            result = runner.invoke(
+                generate_manifests_using_intermediary,
+                [store_path, '-t', TEMPLATE_DIR_PATH])
+        assert result.exit_code == 0
+        assert mock_close.call_count == 3
+
+
+def _write_changed_intermediary(tmpdir):
+    with open(INTERMEDIARY_PATH, 'r') as f:
+        intermediary = yaml.safe_load(f)
+    intermediary['baremetal']['rack72']['cab2r72c12']['ip']['oob'] = \
+        '10.0.220.150'
+    new_path = os.path.join(str(tmpdir), 'new_intermediary.yaml')
+    with open(new_path, 'w') as f:
+        yaml.dump(intermediary, f, default_flow_style=False)
+    return new_path
+
+
+def test_diff_intermediaries(tmpdir):
+    """Tests `diff` command from CLI"""
+    runner = CliRunner()
+    result = runner.invoke(
+        diff_intermediaries,
+        [INTERMEDIARY_PATH,
+         _write_changed_intermediary(tmpdir)])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [
+        'modified host rack72/cab2r72c12 ip.oob: 10.0.220.140 -> '
+        '10.0.220.150'
+    ]
+
+
+def test_diff_intermediaries_indexed(tmpdir):
+    """Tests `diff` command from CLI with indexed intermediary files"""
+    new_path = _write_changed_intermediary(tmpdir)
+    old_path = os.path.join(str(tmpdir), 'old_intermediary.yaml')
+    write_intermediary(_get_intermediary_data(), old_path, index=True)
+    with open(new_path, 'r') as f:
+        write_intermediary(yaml.safe_load(f), new_path, index=True)
+    runner = CliRunner()
+    with mock.patch(
+            'spyglass.data_extractor.intermediary_file.load_intermediary',
+            wraps=load_intermediary) as mock_load:
+        result = runner.invoke(diff_intermediaries, [old_path, new_path])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [
+        'modified host rack72/cab2r72c12 ip.oob: 10.0.220.140 -> '
+        '10.0.220.150'
+    ]
+    assert mock_load.call_count == 2
+    for call in mock_load.call_args_list:
+        assert call[1]['racks'] == {'rack72'}
+
+
+def test_diff_intermediaries_unindexed_parses_changed_racks(tmpdir):
+    """Tests `diff` command from CLI only parses the changed racks"""
+    new_path = _write_changed_intermediary(tmpdir)
+    runner = CliRunner()
+    with mock.patch(
+            'spyglass.data_extractor.intermediary_file.load_intermediary',
+            wraps=load_intermediary) as mock_load:
+        result = runner.invoke(
+            diff_intermediaries, [INTERMEDIARY_PATH, new_path])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [
+        'modified host rack72/cab2r72c12 ip.oob: 10.0.220.140 -> '
+        '10.0.220.150'
+    ]
+    assert mock_load.call_count == 2
+    for call in mock_load.call_args_list:
+        assert call[1]['racks'] == {'rack72'}
+
+
+def test_diff_intermediaries_store(tmpdir):
+    """Tests `diff` command from CLI with a site store"""
+    store_path = os.path.join(str(tmpdir), 'site.db')
+    runner = CliRunner()
+    result = runner.invoke(store_intermediary, [INTERMEDIARY_PATH, store_path])
+    assert result.exit_code == 0
+    result = runner.invoke(
+        diff_intermediaries,
+        [store_path, _write_changed_intermediary(tmpdir)])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [
+        'modified host rack72/cab2r72c12 ip.oob: 10.0.220.140 -> '
+        '10.0.220.150'
+    ]
+
+
+@mock.patch.object(
+    SiteProcessor, '__init__', spec=SiteProcessor, return_value=None)
+def test_generate_manifests_using_intermediary_racks(
+        mock_site_processor, tmpdir):
+    """Tests `mi` command from CLI limited to a rack"""
+    path = os.path.join(str(tmpdir), 'intermediary.yaml')
+    write_intermediary(_get_intermediary_data(), path, index=True)
+    runner = CliRunner()
+    with mock.patch.object(SiteProcessor, 'render_template',
+                           spec=SiteProcessor) as mock_render:
+        result = runner.invoke(
+            generate_manifests_using_intermediary,
+            [path, '-t', TEMPLATE_DIR_PATH, '--rack', 'rack73'])
+    assert result.exit_code == 0
+    intermediary = _get_intermediary_data()
+    del intermediary['baremetal']['rack72']
+    mock_site_processor.assert_called_once_with(
+        intermediary, None, False, resume=False, racks=('rack73', ))
+    mock_render.assert_called_once_with(TEMPLATE_DIR_PATH)
+
+
+@mock.patch.object(
+    SiteProcessor, '__init__', spec=SiteProcessor, return_value=None)
+def test_generate_manifests_using_intermediary_dir(
+        mock_site_processor, tmpdir):
+    """Tests `mi` command from CLI with an intermediary directory"""
+    path = os.path.join(str(tmpdir), 'test_intermediary')
+    write_intermediary_dir(_get_intermediary_data(), path)
+    runner = CliRunner()
+    with mock.patch.object(SiteProcessor, 'render_template',
+                           spec=SiteProcessor) as mock_render:
+        result = runner.invoke(
+            generate_manifests_using_intermediary,
+            [path, '-t', TEMPLATE_DIR_PATH])
+    assert result.exit_code == 0
+    mock_site_processor.assert_called_once_with(
+        _get_intermediary_data(), None, False, resume=False, racks=None)
+    mock_render.assert_called_once_with(TEMPLATE_DIR_PATH)
+
+
+def test_diff_intermediaries_json(tmpdir):
+    """Tests `diff` command from CLI with JSON output"""
+    runner = CliRunner()
+    result = runner.invoke(
+        diff_intermediaries, [
+            INTERMEDIARY_PATH,
+            _write_changed_intermediary(tmpdir), '--format', 'json'
+        ])
+    assert result.exit_code == 0
+    assert json.loads(result.output) == {
+        'changes': [
+            {
+                'change': 'modified',
+                'path': ['host', 'rack72', 'cab2r72c12', 'ip', 'oob'],
+                'old': '10.0.220.140',
+                'new': '10.0.220.150'
+            }
+        ],
+        'summary': {
+            'modified': 1
+        }
+    }
+
+
+def test_lookup_addresses_no_addresses():
+    """Tests that `lookup` requires at least one address"""
+    runner = CliRunner()
+    result = runner.invoke(lookup_addresses, [INTERMEDIARY_PATH])
+    assert result.exit_code != 0
+
+
 @mock.patch.object(
     JSONSchemaValidator, '__init__', autospec=True, return_value=None)
 @mock.patch.object(JSONSchemaValidator, 'validate', autospec=True)
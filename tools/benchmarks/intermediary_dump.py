@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares yaml.dump and the streaming emitter for intermediary files
+
+Run from an environment where spyglass is installed::
+
+    python tools/benchmarks/intermediary_dump.py [host_count]
+"""
+
+import io
+import sys
+import timeit
+
+import yaml
+
+from spyglass.data_extractor import models
+from spyglass.data_extractor.intermediary_file import emit_intermediary
+
+HOSTS_PER_RACK = 40
+
+
+def build_site_data(host_count):
+    racks = []
+    for index in range(host_count):
+        rack_index, slot = divmod(index, HOSTS_PER_RACK)
+        if not slot:
+            racks.append(models.Rack('rack{}'.format(rack_index), []))
+        addresses = {
+            role:
+            '10.{}.{}.{}'.format(role_index, index // 250, index % 250 + 1)
+            for role_index, role in enumerate(models.IP_ROLES)
+        }
+        racks[-1].hosts.append(
+            models.Host(
+                'r{}c{}'.format(rack_index, slot),
+                rack_name=racks[-1].name,
+                type='compute',
+                host_profile='cp-r640',
+                ip=models.IPList(**addresses)))
+    return models.SiteDocumentData(
+        models.SiteInfo('bench', region_name='bench'), models.Network([]),
+        racks)
+
+
+def dump(site_data):
+    return yaml.dump(site_data.dict_from_class(), default_flow_style=False)
+
+
+def emit(site_data):
+    stream = io.StringIO()
+    emit_intermediary(site_data, stream)
+    return stream.getvalue()
+
+
+def main():
+    host_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    site_data = build_site_data(host_count)
+    if dump(site_data) != emit(site_data):
+        raise SystemExit('yaml.dump and emitter output differ')
+    for name, function in (('yaml.dump', dump), ('emitter', emit)):
+        seconds = min(
+            timeit.repeat(lambda: function(site_data), number=1, repeat=3))
+        print('{:<10} {} hosts: {:.3f}s'.format(name, host_count, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compares scalar and NumPy vectorized bulk host IP allocation
+
+Run from an environment where spyglass is installed, optionally with the
+numpy extra::
+
+    python tools/benchmarks/ip_allocation.py [host_count]
+"""
+
+import sys
+import timeit
+
+from netaddr import IPNetwork
+
+from spyglass.parser.ip_allocator import IPPool
+
+NETWORKS = ('oob', 'oam', 'pxe', 'storage', 'calico', 'overlay')
+
+
+def allocate(host_count, vectorize):
+    results = []
+    for index, name in enumerate(NETWORKS):
+        pool = IPPool(name, IPNetwork('10.{}.0.0/14'.format(index * 4)))
+        pool.reserve(pool.first, pool.first + 11)
+        results.append(pool.allocate_many(host_count, vectorize=vectorize))
+    return results
+
+
+def main():
+    host_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    if allocate(host_count, False) != allocate(host_count, True):
+        raise SystemExit('Scalar and vectorized results differ')
+    for vectorize in (False, True):
+        seconds = min(
+            timeit.repeat(
+                lambda: allocate(host_count, vectorize), number=1, repeat=3))
+        print(
+            '{:<10} {} hosts x {} networks: {:.3f}s'.format(
+                'vectorized' if vectorize else 'scalar', host_count,
+                len(NETWORKS), seconds))
+
+
+if __name__ == '__main__':
+    main()